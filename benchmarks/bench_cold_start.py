@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ETL_DIR = os.path.join(ROOT_DIR, "etl")
+APP_PATH = os.path.join(ROOT_DIR, "visualisation", "chess_data_app.py")
+sys.path.append(ETL_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "visualisation"))
+
+USERNAME = "BenchPlayer"
+GAMES_PER_MONTH = 5000
+TYPING_SECONDS = 1.5  # time to type the username after the page is shown
+HEAVY_MODULES = ["pandas", "pyarrow", "chess", "matplotlib", "seaborn"]
+
+
+def prepare_data(number_games: int):
+    """
+    It writes synthetic monthly archives and runs the transform, from
+    the current directory like the ETL.
+    """
+    from main import run_transform
+    from raw_archives import write_games_jsonl
+    from synthetic import archive_filename, generate_month
+
+    os.makedirs(os.path.join("data", "json", USERNAME))
+    for i in range(max(1, number_games // GAMES_PER_MONTH)):
+        year, month = 2015 + i // 12, i % 12 + 1
+        write_games_jsonl(
+            generate_month(USERNAME, year, month, GAMES_PER_MONTH),
+            os.path.join(
+                "data", "json", USERNAME, archive_filename(USERNAME, year, month)
+            ),
+        )
+    run_transform(USERNAME, export_csv=False)
+
+
+def time_command(command: list, repeat: int):
+    """
+    It runs a command in a new interpreter several times.
+
+    Returns:
+        float: The median wall time in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True, cwd=ROOT_DIR)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def heavy_imports(code: str):
+    """
+    It gives the heavy modules imported by a piece of code.
+    """
+    check = (
+        f"import sys; sys.path.insert(0, {ETL_DIR!r}); {code}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    )
+    return output.stdout.strip() or "none"
+
+
+def app_run():
+    """
+    It opens the dashboard in this new interpreter, like a first visit
+    to a freshly started server, and prints the time to show the page,
+    then, once the username is typed, the time to the first metric, the
+    first chart and the whole page.
+    """
+    start = time.perf_counter()
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    marks = {}
+    for name, label in [("metric", "first_metric"), ("image", "first_chart")]:
+
+        def marked(*args, _widget=getattr(st, name), _label=label, **kwargs):
+            marks.setdefault(_label, time.perf_counter())
+            return _widget(*args, **kwargs)
+
+        setattr(st, name, marked)
+    app = AppTest.from_file(APP_PATH, default_timeout=300)
+    app.run()
+    shown = time.perf_counter()
+    time.sleep(TYPING_SECONDS)
+    app.text_input[0].input(USERNAME)
+    typed = time.perf_counter()
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    timings = {"startup": shown - start, "full_run": time.perf_counter() - typed}
+    timings.update({label: mark - typed for label, mark in marks.items()})
+    print(json.dumps(timings))
+
+
+def time_app(repeat: int):
+    """
+    It measures the dashboard in new interpreters.
+
+    Returns:
+        dict: The median of each timing, in seconds.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--app-run"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cold start of the command line and of the dashboard"
+    )
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--app-run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.app_run:
+        return app_run()
+
+    main_path = os.path.join(ETL_DIR, "main.py")
+    print("command line (median of new interpreters)")
+    for label, command in [
+        ("main.py --help", [sys.executable, main_path, "--help"]),
+        ("main.py extract --help", [sys.executable, main_path, "extract", "--help"]),
+        (
+            "import main",
+            [
+                sys.executable,
+                "-c",
+                f"import sys; sys.path.insert(0, {ETL_DIR!r}); import main",
+            ],
+        ),
+    ]:
+        print(f"  {label:<24} {time_command(command, args.repeat):.2f}s")
+    print(f"  heavy modules of main.py: {heavy_imports('import main')}")
+    print(
+        "  heavy modules of the extraction: "
+        f"{heavy_imports('import extract_chess_data')}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        prepare_data(args.games)
+        os.makedirs("visualisation")
+        os.chdir("visualisation")  # the app reads ../data/transformed
+        snapshot = os.path.join(
+            "..", "data", "transformed", USERNAME, f"{USERNAME}_snapshot.json"
+        )
+        print(f"dashboard, {args.games} games (median of new servers)")
+        print(
+            f"  {'':<18} {'startup':>8} {'1st metric':>11} {'1st chart':>10} "
+            f"{'full page':>10}"
+        )
+        with_snapshot = time_app(args.repeat)
+        os.rename(snapshot, f"{snapshot}.off")
+        without_snapshot = time_app(args.repeat)
+        for label, timings in [
+            ("without snapshot", without_snapshot),
+            ("with snapshot", with_snapshot),
+        ]:
+            print(
+                f"  {label:<18} {timings['startup']:>7.2f}s "
+                f"{timings['first_metric']:>10.2f}s "
+                f"{timings['first_chart']:>9.2f}s {timings['full_run']:>9.2f}s"
+            )
+        os.chdir(ROOT_DIR)
+
+
+if __name__ == "__main__":
+    main()
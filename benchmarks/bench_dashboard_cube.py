@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from aggregate_cube import DailyCube, build_cube  # noqa: E402
+from games_storage import set_column_types  # noqa: E402
+
+TIME_CLASSES = ["blitz", "bullet", "rapid", "daily"]
+RESULTS = ["win", "loss", "draw"]
+
+
+def generate_games(number_games: int, seed: int = 0):
+    """
+    It generates transformed games spread over ten years, with the
+    columns used by the dashboard.
+    """
+    rnd = np.random.default_rng(seed)
+    days = pd.Timestamp("2015-01-01") + pd.to_timedelta(
+        np.sort(rnd.integers(0, 3650, number_games)), unit="D"
+    )
+    df = pd.DataFrame(
+        {
+            "date": days,
+            "time_class": rnd.choice(TIME_CLASSES, number_games),
+            "player_color": rnd.choice(["white", "black"], number_games),
+            "player_result": rnd.choice(RESULTS, number_games),
+            "player_rating": rnd.integers(800, 2200, number_games),
+            "opponent_rating": rnd.integers(800, 2200, number_games),
+        }
+    )
+    return set_column_types(df)
+
+
+def rerun_from_rows(df: pd.DataFrame, start, end):
+    """
+    It computes the dashboard widgets from the rows, like the dashboard
+    did before the cube.
+    """
+    filtered = df[(df["date"] >= start) & (df["date"] <= end)].copy()
+    by_class = [filtered[filtered["time_class"] == c] for c in TIME_CLASSES[:3]]
+    filtered.groupby(["time_class"], observed=True)["opponent_rating"].mean()
+    filtered["time_class"].value_counts()
+    for games in by_class:
+        games["player_result"].value_counts()
+        games.groupby("date")["player_rating"].mean()
+
+
+def rerun_from_cube(cube: DailyCube, start, end):
+    """
+    It computes the same widgets from the cube.
+    """
+    summary = cube.select(start, end)
+    totals = summary.groupby("time_class")[
+        ["opponent_rating_sum", "opponent_rating_games"]
+    ].sum()
+    totals["opponent_rating_sum"] / totals["opponent_rating_games"]
+    for time_class in TIME_CLASSES[:3]:
+        summary[summary["time_class"] == time_class].groupby("player_result")[
+            "games"
+        ].sum()
+        cube.daily(start, end, time_class)
+
+
+def timed(function, *args, repeat: int = 20):
+    """
+    It runs a function `repeat` times and keeps the median time.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of a dashboard rerun, from the rows and from the cube"
+    )
+    parser.add_argument(
+        "--games", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+    start, end = pd.Timestamp("2017-03-01"), pd.Timestamp("2023-06-30")
+    print(f"{'games':>10} {'rows (ms)':>10} {'cube (ms)':>10} {'cube cells':>11}")
+    for number_games in args.games:
+        df = generate_games(number_games)
+        cube_df = build_cube(df)
+        cube = DailyCube(cube_df)
+        rows_ms = timed(rerun_from_rows, df, start, end) * 1000
+        cube_ms = timed(rerun_from_cube, cube, start, end) * 1000
+        print(
+            f"{number_games:>10,} {rows_ms:>10.1f} {cube_ms:>10.1f} {len(cube_df):>11,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_PATH = os.path.join(ROOT_DIR, "visualisation", "chess_data_app.py")
+sys.path.append(os.path.join(ROOT_DIR, "etl"))
+sys.path.append(os.path.join(ROOT_DIR, "visualisation"))
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from figure_cache import render_png  # noqa: E402
+from opening_index import build_opening_index  # noqa: E402
+from pgn_parser import build_move_store  # noqa: E402
+from raw_archives import write_games_jsonl  # noqa: E402
+from synthetic import archive_filename, generate_month  # noqa: E402
+from transform_chess_data import transformed_games  # noqa: E402
+import visualisation_utils as vu  # noqa: E402
+
+USERNAME = "BenchPlayer"
+GAMES_PER_MONTH = 5000
+
+
+def prepare_data(number_games: int):
+    """
+    It writes synthetic monthly archives and runs the transform steps,
+    from the current directory like the ETL.
+    """
+    os.makedirs(os.path.join("data", "json", USERNAME))
+    for i in range(max(1, number_games // GAMES_PER_MONTH)):
+        year, month = 2015 + i // 12, i % 12 + 1
+        write_games_jsonl(
+            generate_month(USERNAME, year, month, GAMES_PER_MONTH),
+            os.path.join(
+                "data", "json", USERNAME, archive_filename(USERNAME, year, month)
+            ),
+        )
+    transformed_games(USERNAME, export_csv=False)
+    build_move_store(USERNAME, workers=1)
+    build_opening_index(USERNAME)
+
+
+def eager_rerun(cube, series, df, start_date, end_date):
+    """
+    It builds the 10 figures of the dashboard without any cache, like
+    every rerun did when all the tabs were rendered with st.pyplot.
+    """
+    summary = cube.select(start_date, end_date)
+    figures = [vu.draw_number_games(summary.groupby("time_class")["games"].sum())]
+    df = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
+    for time_class in vu.TIME_CLASSES:
+        results = summary[summary["time_class"] == time_class.lower()]
+        figures.append(
+            vu.draw_outcome_distribution(
+                results.groupby("player_result")["games"].sum(), time_class
+            )
+        )
+        resolution, points = series.select(time_class.lower(), start_date, end_date)
+        figures.append(vu.draw_rating_evolution(points, resolution, time_class))
+        counts = vu.opening_counts(
+            df.loc[df["time_class"] == time_class.lower(), "opening"]
+        )
+        figures.append(vu.draw_frequent_openings(counts, time_class, 3))
+    for fig in figures:
+        render_png(fig)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the dashboard rerun latency per interaction"
+    )
+    parser.add_argument("--games", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        prepare_data(args.games)
+        os.makedirs("visualisation")
+        os.chdir("visualisation")  # the app reads ../data/transformed
+        cube = vu.read_cube(vu.DATA_DIR, USERNAME)
+        series = vu.read_rating_series(vu.DATA_DIR, USERNAME)
+        df = vu.read_games(
+            vu.DATA_DIR, USERNAME, columns=["date", "time_class", "opening"]
+        )
+        first, last = cube.days[0].to_pydatetime(), cube.days[-1].to_pydatetime()
+        middle = first + (last - first) / 2
+
+        app = AppTest.from_file(APP_PATH, default_timeout=300)
+        app.run()
+        interactions = [
+            (
+                "open the dashboard",
+                (first, last),
+                lambda: app.text_input[0].input(USERNAME),
+            ),
+            (
+                "move the date slider",
+                (first, middle),
+                lambda: app.slider[0].set_value((first, middle)),
+            ),
+            (
+                "switch the time class",
+                None,
+                lambda: app.radio(key="time_class_results").set_value("Bullet"),
+            ),
+            (
+                "back to the full range",
+                (first, last),
+                lambda: app.slider[0].set_value((first, last)),
+            ),
+            (
+                "move the date slider again",
+                (first, middle),
+                lambda: app.slider[0].set_value((first, middle)),
+            ),
+            ("rerun without change", (first, middle), lambda: app),
+        ]
+        print(f"{len(cube)} games, {len(cube.days)} days")
+        print(f"{'interaction':<28} {'before (ms)':>12} {'after (ms)':>11}")
+        for label, date_range, interact in interactions:
+            before = "no rerun"
+            if date_range:
+                before = f"{timed(eager_rerun, cube, series, df, *date_range):.0f}"
+            after = timed(lambda: interact().run())
+            if app.exception:
+                raise RuntimeError(app.exception[0].value)
+            print(f"{label:<28} {before:>12} {after:>11.0f}")
+        figure_cache = vu.get_figure_cache()
+        print(
+            f"figure cache: {len(figure_cache)} images, {figure_cache.nbytes / 1e6:.1f} MB, "
+            f"{figure_cache.hits} hits, {figure_cache.misses} misses"
+        )
+
+
+if __name__ == "__main__":
+    main()
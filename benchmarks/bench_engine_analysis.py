@@ -0,0 +1,68 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARKS_DIR, "..", "etl"))
+from engine_analysis import (  # noqa: E402
+    EVALUATION_CACHE_FILE,
+    analyse_games,
+    analysis_dirpath,
+)
+from metrics import METRICS  # noqa: E402
+from pgn_parser import build_move_store  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+from transform_chess_data import transformed_games  # noqa: E402
+
+USERNAME = "BenchPlayer"
+STUB_ENGINE = f"{sys.executable} {os.path.join(BENCHMARKS_DIR, 'stub_uci_engine.py')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput of the engine analysis and its position cache"
+    )
+    parser.add_argument("--games", type=int, default=20_000)
+    parser.add_argument("--engine", default=STUB_ENGINE, help="UCI engine command")
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # the ETL writes to data/ like from the repository
+        write_corpus("raw", [USERNAME], args.games)
+        transformed_games(USERNAME, raw_dir="raw", export_csv=False)
+        build_move_store(USERNAME, raw_dir="raw")
+        results = []
+        for label in ["empty cache", "warm cache"]:
+            shutil.rmtree(analysis_dirpath(USERNAME), ignore_errors=True)
+            METRICS.reset()
+            start = time.perf_counter()
+            games = analyse_games(USERNAME, args.engine, args.depth, args.workers)
+            seconds = time.perf_counter() - start
+            positions = {
+                dict(labels)["source"]: value
+                for (name, labels), value in METRICS.snapshot()["counters"]
+                if name == "positions"
+            }
+            results.append((label, games, seconds, positions))
+        cache_size = os.path.getsize(EVALUATION_CACHE_FILE)
+        os.chdir(BENCHMARKS_DIR)
+
+    print(
+        f"{'':12} {'games':>8} {'seconds':>8} {'games/s':>9} "
+        f"{'from cache':>11} {'evaluated':>10}"
+    )
+    for label, games, seconds, positions in results:
+        print(
+            f"{label:12} {games:8} {seconds:8.2f} {games / seconds:9,.0f} "
+            f"{positions.get('cache', 0):11,} {positions.get('engine', 0):10,}"
+        )
+    print(f"evaluation cache: {cache_size / 1e3:.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
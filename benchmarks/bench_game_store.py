@@ -0,0 +1,139 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from game_store import STORE_FILENAME, index_filename, store_games  # noqa: E402
+from raw_archives import write_games_jsonl  # noqa: E402
+from synthetic import archive_filename, generate_game  # noqa: E402
+from transform_chess_data import (  # noqa: E402
+    chunk_game_table,
+    set_column_types,
+    transform_file,
+)
+
+YEAR = 2023
+
+
+def generate_club(members: list, months: int, games: int, shared: float):
+    """
+    It generates the monthly archives of the members of a club. Each
+    member plays `games` games a month, a fraction `shared` of them
+    against another member, and these games are in the archives of
+    both players, like the API gives them.
+    """
+    archives = {(member, month): [] for member in members for month in range(months)}
+    for seed, member in enumerate(members):
+        others = [other for other in members if other != member]
+        for month in range(months):
+            rnd = random.Random(f"{seed}-{member}-{month}")
+            first_id = (YEAR * 12 + month) * 10_000_000 + seed * 100_000
+            for i in range(games):
+                opponent = None
+                if rnd.random() < shared:
+                    opponent = rnd.choice(others)
+                game = generate_game(
+                    rnd,
+                    first_id + i,
+                    member,
+                    YEAR,
+                    month + 1,
+                    [opponent] if opponent else None,
+                )
+                archives[member, month].append(game)
+                if opponent:
+                    archives[opponent, month].append(game)
+    for games_of_month in archives.values():
+        games_of_month.sort(key=lambda game: game["end_time"])
+    return archives
+
+
+def directory_size(path: str):
+    return sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(path)
+        for file in files
+    )
+
+
+def transform_club(raw_dir: str, members: list, name):
+    """
+    It transforms the archives of every member, like the ETL does.
+    """
+    results = {}
+    for member in members:
+        user_dir = os.path.join(raw_dir, member)
+        frames = [
+            transform_file(
+                os.path.join(user_dir, name(member, YEAR, month + 1)), member
+            )
+            for month in range(len(os.listdir(user_dir)))
+        ]
+        results[member] = set_column_types(pd.concat(frames, ignore_index=True))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the game store")
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--games", type=int, default=1000, help="games per month")
+    parser.add_argument(
+        "--shared", type=float, nargs="+", default=[0.0, 0.25, 0.5, 0.9]
+    )
+    args = parser.parse_args()
+    members = [f"member{i}" for i in range(args.members)]
+    print(
+        f"{args.members} members x {args.months} months x {args.games} games\n"
+        f"{'shared':>6} {'files (MB)':>10} {'store (MB)':>10} "
+        f"{'files (s)':>9} {'store (s)':>9} {'saved (s)':>9}"
+    )
+    for shared in args.shared:
+        archives = generate_club(members, args.months, args.games, shared)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files_dir = os.path.join(tmp_dir, "files")
+            store_dir = os.path.join(tmp_dir, "store")
+            for (member, month), games in archives.items():
+                for raw_dir in [files_dir, store_dir]:
+                    os.makedirs(os.path.join(raw_dir, member), exist_ok=True)
+                write_games_jsonl(
+                    games,
+                    os.path.join(
+                        files_dir, member, archive_filename(member, YEAR, month + 1)
+                    ),
+                )
+                store_games(
+                    games,
+                    os.path.join(
+                        store_dir, member, index_filename(member, YEAR, month + 1)
+                    ),
+                )
+            start = time.perf_counter()
+            expected = transform_club(files_dir, members, archive_filename)
+            files_s = time.perf_counter() - start
+            start = time.perf_counter()
+            result = transform_club(store_dir, members, index_filename)
+            store_s = time.perf_counter() - start
+            chunk_game_table.cache_clear()  # like a new process
+            start = time.perf_counter()
+            saved = transform_club(store_dir, members, index_filename)
+            saved_s = time.perf_counter() - start
+            for member in members:
+                pd.testing.assert_frame_equal(result[member], expected[member])
+                pd.testing.assert_frame_equal(saved[member], expected[member])
+            store_size = directory_size(store_dir)
+            assert os.path.exists(os.path.join(store_dir, STORE_FILENAME))
+            print(
+                f"{shared:>6.2f} {directory_size(files_dir) / 1e6:>10.1f} "
+                f"{store_size / 1e6:>10.1f} {files_s:>9.2f} {store_s:>9.2f} "
+                f"{saved_s:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
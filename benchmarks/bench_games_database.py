@@ -0,0 +1,141 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from games_database import query_games, write_games_database  # noqa: E402
+from games_storage import (  # noqa: E402
+    games_dirpath,
+    read_games,
+    replace_dataset,
+    set_column_types,
+    split_partitions,
+    write_partition,
+)
+
+TIME_CLASSES = ["blitz", "bullet", "rapid", "daily"]
+RESULTS = ["win", "loss", "draw"]
+
+
+def write_games(df: pd.DataFrame, output_dir: str, username: str):
+    """
+    It saves all the generated games of a player to the monthly Parquet
+    dataset read by read_games, written next to the previous one and
+    then swapped.
+    """
+    dataset_dir = games_dirpath(output_dir, username)
+    for key, games in split_partitions(df).items():
+        write_partition(games, f"{dataset_dir}.tmp", *key)
+    replace_dataset(f"{dataset_dir}.tmp", dataset_dir)
+
+
+def generate_player(username: str, number_games: int, seed: int):
+    """
+    It generates the transformed games of a player over ten years.
+    """
+    rnd = np.random.default_rng(seed)
+    days = np.sort(rnd.integers(0, 3650, number_games))
+    df = pd.DataFrame(
+        {
+            "game_id": [f"{seed}{i:07d}" for i in range(number_games)],
+            "date": pd.Timestamp("2015-01-01") + pd.to_timedelta(days, unit="D"),
+            "rated": True,
+            "time_class": rnd.choice(TIME_CLASSES, number_games),
+            "opening": rnd.choice(["Sicilian-Defense", "French-Defense"], number_games),
+            "white_accuracy": np.nan,
+            "black_accuracy": np.nan,
+            "player_color": rnd.choice(["white", "black"], number_games),
+            "player_rating": rnd.integers(800, 2200, number_games),
+            "opponent_username": [
+                f"opponent{i}" for i in rnd.integers(0, 50_000, number_games)
+            ],
+            "opponent_rating": rnd.integers(800, 2200, number_games),
+            "player_result": rnd.choice(RESULTS, number_games),
+        }
+    )
+    return set_column_types(df)
+
+
+def timed(function, *args, repeat: int = 5):
+    """
+    It runs a function `repeat` times and keeps the best time.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def from_files(output_dir: str, usernames: list, start, end, time_class: str):
+    """
+    It reads the Parquet file of every player and filters the games.
+    """
+    frames = []
+    for username in usernames:
+        df = read_games(output_dir, username, ["date", "time_class", "player_rating"])
+        frames.append(
+            df[
+                (df["date"] >= start)
+                & (df["date"] <= end)
+                & (df["time_class"] == time_class)
+            ]
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the SQLite game store")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--games", type=int, default=2000, help="games per player")
+    args = parser.parse_args()
+
+    usernames = [f"player{i}" for i in range(args.players)]
+    start, end = pd.Timestamp("2020-03-01"), pd.Timestamp("2020-03-31")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = os.path.join(tmp_dir, "transformed")
+        database_path = os.path.join(tmp_dir, "games.sqlite")
+        load_start = time.perf_counter()
+        for seed, username in enumerate(usernames):
+            df = generate_player(username, args.games, seed)
+            write_games(df, output_dir, username)
+            write_games_database(df, username, None, database_path)
+        print(
+            f"{args.players} players x {args.games} games written in "
+            f"{time.perf_counter() - load_start:.1f}s, database "
+            f"{os.path.getsize(database_path) / 1e6:.0f} MB"
+        )
+        expected, files_ms = timed(
+            from_files, output_dir, usernames, start, end, "blitz", repeat=1
+        )
+        result, sql_ms = timed(
+            query_games,
+            usernames,
+            ["date", "time_class", "player_rating"],
+            start,
+            end,
+            "blitz",
+            database_path,
+        )
+        assert len(result) == len(expected)
+        _, one_ms = timed(
+            query_games, usernames[:1], ["opening"], start, end, "blitz", database_path
+        )
+        _, upsert_ms = timed(
+            write_games_database, df, username, set(), database_path, repeat=1
+        )
+        print(f"blitz games of March 2020 for all players: {len(result)} games")
+        print(f"  every Parquet file  : {files_ms:8.1f} ms")
+        print(f"  SQLite              : {sql_ms:8.1f} ms")
+        print(f"same query, one player: {one_ms:8.1f} ms")
+        print(f"no-op incremental sync of one player: {upsert_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from games_storage import (  # noqa: E402
+    ACCURACY_COLUMNS,
+    RATING_COLUMNS,
+    game_urls,
+    read_games,
+)
+from synthetic import write_corpus  # noqa: E402
+from transform_chess_data import TRANSFORMED_DATA_DIR, transformed_games  # noqa: E402
+
+USERNAME = "BenchPlayer"
+BYTES_PER_GAME_BUDGET = 48  # the compact schema takes about 38 bytes per game
+
+
+def object_types(df: pd.DataFrame):
+    """
+    It converts games to the types used before the compact schema:
+    Python strings with the game_url, int64 ratings and float64
+    accuracies.
+    """
+    df = df.assign(
+        game_url=game_urls(df), game_id=df["game_id"].astype(str).astype(object)
+    )
+    for column in ["opening", "opponent_username"]:
+        df[column] = df[column].astype(object)
+    for column in RATING_COLUMNS:
+        df[column] = df[column].astype(np.int64)
+    for column in ACCURACY_COLUMNS:
+        df[column] = df[column].astype(np.float64)
+    return df
+
+
+def bytes_per_game(df: pd.DataFrame):
+    """
+    It gives the memory of each column divided by the number of games,
+    with the Python strings and the dictionaries of the categories.
+    """
+    return df.memory_usage(deep=True, index=False) / len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Memory of the games loaded by the dashboard"
+    )
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=BYTES_PER_GAME_BUDGET,
+        help="bytes per game above which the benchmark fails",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # the ETL writes to data/ like from the repository
+        write_corpus("raw", [USERNAME], args.games)
+        transformed_games(USERNAME, raw_dir="raw", export_csv=False)
+        df = read_games(TRANSFORMED_DATA_DIR, USERNAME)
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    before = bytes_per_game(object_types(df))
+    table = pd.DataFrame(
+        {"object": before, "compact": bytes_per_game(df)}, index=before.index
+    )
+    table.loc["total"] = table.sum()
+    print(f"{len(df)} games, bytes per game of each column")
+    print(table.to_string(float_format="{:.1f}".format))
+    total = table.loc["total", "compact"]
+    if total > args.budget:
+        print(f"REGRESSION {total:.1f} bytes per game > {args.budget:.0f}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from games_storage import (  # noqa: E402
+    games_dirpath,
+    read_games,
+    set_column_types,
+    split_partitions,
+    write_partition,
+)
+from opponent_index import (  # noqa: E402
+    DIFFERENCE_LIMIT,
+    DIFFERENCE_STEP,
+    OPPONENT_COLUMNS,
+    RESULTS,
+    OpponentIndex,
+    write_opponent_index,
+)
+
+USERNAME = "BenchPlayer"
+GAMES_PER_MONTH = 5000
+GAMES_PER_OPPONENT = 5  # on average, some opponents are met far more often
+REPEAT = 50
+
+
+def synthetic_games(number_games: int, seed: int = 0):
+    """
+    It generates the OPPONENT_COLUMNS of games against many opponents,
+    with a long tail of opponents met once, like a real history.
+    """
+    rng = np.random.default_rng(seed)
+    number_opponents = max(1, number_games // GAMES_PER_OPPONENT)
+    opponents = np.minimum(
+        rng.zipf(1.3, number_games) - 1, number_opponents - 1
+    ) + rng.integers(0, 2, number_games) * (number_opponents // 2)
+    months = np.arange(number_games) // GAMES_PER_MONTH
+    player_ratings = rng.normal(1500, 100, number_games).astype(int)
+    df = pd.DataFrame(
+        {
+            "game_id": np.arange(number_games, dtype=np.int64) + 10**11,
+            "date": pd.to_datetime(
+                {
+                    "year": 2010 + months // 12,
+                    "month": months % 12 + 1,
+                    "day": rng.integers(1, 29, number_games),
+                }
+            ),
+            "time_class": rng.choice(["blitz", "bullet", "rapid"], number_games),
+            "player_result": rng.choice(RESULTS, number_games, p=[0.48, 0.06, 0.46]),
+            "player_rating": player_ratings,
+            "opponent_username": opponent_names(number_opponents, rng)[
+                opponents % number_opponents
+            ],
+            "opponent_rating": player_ratings
+            + rng.normal(0, 150, number_games).astype(int),
+        }
+    )
+    return set_column_types(df)
+
+
+def opponent_names(number_opponents: int, rng: np.random.Generator):
+    """
+    It generates usernames of 4 to 12 letters and digits, in mixed case.
+    """
+    characters = np.array(
+        list("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+    )
+    lengths = rng.integers(4, 13, number_opponents)
+    letters = characters[rng.integers(0, len(characters), (number_opponents, 12))]
+    names = ["".join(row[:length]) for row, length in zip(letters, lengths)]
+    return np.array([f"{name}{i}" for i, name in enumerate(names)])
+
+
+def timed_us(function, *args):
+    """
+    It gives the median time of a function call, in microseconds.
+    """
+    durations = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations)) * 1e6
+
+
+def scan_record(games: pd.DataFrame, opponent: str):
+    sub = games[games["opponent_username"].astype(str).str.lower() == opponent.lower()]
+    return sub["player_result"].value_counts()
+
+
+def scan_search(games: pd.DataFrame, prefix: str):
+    names = games["opponent_username"].astype(str)
+    names = names[names.str.lower().str.startswith(prefix.lower())]
+    return names.value_counts().head(10)
+
+
+def scan_latest(games: pd.DataFrame, opponent: str):
+    sub = games[games["opponent_username"].astype(str).str.lower() == opponent.lower()]
+    return sub.sort_values(["date", "game_id"]).tail(10)
+
+
+def scan_brackets(games: pd.DataFrame):
+    differences = games["opponent_rating"].astype("float64") - games[
+        "player_rating"
+    ].astype("float64")
+    edges = [-np.inf] + list(
+        range(-DIFFERENCE_LIMIT, DIFFERENCE_LIMIT + 1, DIFFERENCE_STEP)
+    )
+    brackets = pd.cut(differences, edges + [np.inf], right=False)
+    return games.groupby([brackets, "player_result"], observed=True).size()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Opponent queries, DataFrame scan vs opponent index"
+    )
+    parser.add_argument(
+        "--games", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'games':>9} {'build':>7} {'update':>7} {'query':<14} "
+        f"{'scan (us)':>10} {'index (us)':>11}"
+    )
+    for number_games in args.games:
+        with tempfile.TemporaryDirectory() as output_dir:
+            # each month keeps only its categories, like the transform writes them
+            dataset_dir = games_dirpath(output_dir, USERNAME)
+            for key, games in split_partitions(synthetic_games(number_games)).items():
+                for column in games.select_dtypes("category"):
+                    games[column] = games[column].cat.remove_unused_categories()
+                write_partition(games, dataset_dir, *key)
+            start = time.perf_counter()
+            write_opponent_index(output_dir, USERNAME)
+            build = time.perf_counter() - start
+
+            # a new month of games, then the incremental update
+            new_games = synthetic_games(GAMES_PER_MONTH, seed=1)
+            new_games["game_id"] += 10**10
+            new_games["date"] = pd.Timestamp("2030-01-15")
+            write_partition(new_games, dataset_dir, 2030, 1)
+            start = time.perf_counter()
+            write_opponent_index(output_dir, USERNAME, [(2030, 1)])
+            update = time.perf_counter() - start
+
+            games = read_games(output_dir, USERNAME, OPPONENT_COLUMNS)
+            index = OpponentIndex(USERNAME, output_dir)
+            opponent = str(index.search("", 1)["opponent"][0])
+            prefix = opponent[:2]
+            queries = [
+                ("record", scan_record, index.record, opponent),
+                ("prefix search", scan_search, index.search, prefix),
+                ("latest games", scan_latest, index.opponent_games, opponent),
+                ("by difference", scan_brackets, index.results_by_difference, None),
+            ]
+            for label, scan, query, argument in queries:
+                scan_args = (games,) if argument is None else (games, argument)
+                query_args = () if argument is None else (argument,)
+                if label == "latest games":
+                    query_args += (10,)
+                print(
+                    f"{number_games:>9} {build:>6.2f}s {update:>6.2f}s {label:<14} "
+                    f"{timed_us(scan, *scan_args):>10.0f} "
+                    f"{timed_us(query, *query_args):>11.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from pgn_parser import MoveStore, build_move_store  # noqa: E402
+from raw_archives import write_games_jsonl  # noqa: E402
+from synthetic import archive_filename, generate_month  # noqa: E402
+
+USERNAME = "BenchPlayer"
+GAMES_PER_MONTH = 5000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the PGN parser")
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="parser processes (default: CPUs)"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, "json")
+        output_dir = os.path.join(tmp_dir, "transformed")
+        os.makedirs(os.path.join(raw_dir, USERNAME))
+        for i in range(max(1, args.games // GAMES_PER_MONTH)):
+            year, month = 2015 + i // 12, i % 12 + 1
+            write_games_jsonl(
+                generate_month(USERNAME, year, month, GAMES_PER_MONTH),
+                os.path.join(
+                    raw_dir, USERNAME, archive_filename(USERNAME, year, month)
+                ),
+            )
+        for workers in sorted({1, args.workers or os.cpu_count()}):
+            shutil.rmtree(output_dir, ignore_errors=True)
+            start = time.perf_counter()
+            number_games = build_move_store(USERNAME, raw_dir, output_dir, workers)
+            seconds = time.perf_counter() - start
+            store = MoveStore(USERNAME, output_dir)
+            print(f"{workers} process(es): {number_games} games in {seconds:.2f}s")
+            print(f"  {number_games / seconds:12,.0f} games/s")
+            print(f"  {len(store.moves) / seconds:12,.0f} plies/s")
+            print(f"  {store.nbytes() / number_games:12.1f} bytes/game in memory")
+            print(f"  {len(store.vocabulary):12,d} distinct moves")
+
+
+if __name__ == "__main__":
+    main()
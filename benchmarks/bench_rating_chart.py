@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "visualisation")
+)
+import matplotlib  # noqa: E402
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import seaborn as sns  # noqa: E402
+from figure_cache import render_png  # noqa: E402
+from rating_series import RatingSeries, build_rating_series  # noqa: E402
+
+
+def generate_games(number_games: int, seed: int = 0):
+    """
+    It generates the blitz games of a player over ten years, with a
+    rating that moves a little after each game.
+    """
+    rnd = np.random.default_rng(seed)
+    days = np.sort(rnd.integers(0, 3650, number_games))
+    return pd.DataFrame(
+        {
+            "date": pd.Timestamp("2015-01-01") + pd.to_timedelta(days, unit="D"),
+            "game_id": np.arange(number_games).astype(str),
+            "time_class": "blitz",
+            "player_rating": 1200 + np.cumsum(rnd.integers(-8, 9, number_games)),
+        }
+    )
+
+
+def seaborn_chart(df: pd.DataFrame):
+    """
+    It draws every game with sns.lineplot and its default settings,
+    like the dashboard did.
+    """
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.lineplot(x="date", y="player_rating", data=df, linewidth=2, ax=ax)
+    return render_png(fig)
+
+
+def series_chart(series: RatingSeries, start, end):
+    """
+    It draws the points chosen by the rating series, like the dashboard.
+    """
+    resolution, points = series.select("blitz", start, end)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(points["date"], points["close"], linewidth=2)
+    ax.fill_between(points["date"], points["low"], points["high"], alpha=0.2)
+    render_png(fig)
+    return resolution, len(points)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the rating chart")
+    parser.add_argument(
+        "--games", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--max-seaborn",
+        type=int,
+        default=100_000,
+        help="largest number of games drawn with sns.lineplot",
+    )
+    args = parser.parse_args()
+    print(
+        f"{'games':>10} {'seaborn (ms)':>13} {'series (ms)':>12} "
+        f"{'points':>7} {'resolution':>10}"
+    )
+    for number_games in args.games:
+        df = generate_games(number_games)
+        series = RatingSeries(build_rating_series(df))
+        seaborn_ms = "skipped"
+        if number_games <= args.max_seaborn:
+            seaborn_ms = f"{timed(seaborn_chart, df)[1]:.0f}"
+        (resolution, points), series_ms = timed(
+            series_chart, series, df["date"].min(), df["date"].max()
+        )
+        print(
+            f"{number_games:>10,} {seaborn_ms:>13} {series_ms:>12.0f} "
+            f"{points:>7} {resolution:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import gc
+import os
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+import pyarrow as pa  # noqa: E402
+from raw_archives import iter_games, write_games_jsonl  # noqa: E402
+from synthetic import generate_month  # noqa: E402
+from transform_chess_data import (  # noqa: E402
+    set_column_types,
+    transform_file,
+    RAW_GAME_SCHEMA,
+    transform_games_batch,
+    transform_games_table,
+)
+
+USERNAME = "BenchPlayer"
+GAMES_PER_MONTH = 5000
+
+
+def transformed_single_game(game: dict, username: str):
+    """
+    Transforms a single raw game dictionary into a clean, standardised
+    format. This function extracts key data points from a raw game
+    dictionary from the Chess.com API. It also determines the player's
+    color, rating, opponent's details, and standardises the game
+    result (win, loss, or draw). It is the per game transform the ETL
+    used before the batch engine, kept here as the reference of the
+    benchmark.
+
+    Args:
+        game (dict): A dictionary representing a single chess game.
+        username (str): The chess.com username of the player
+
+    Returns:
+        dict/None: A dictionary containing the transformed game data,
+        or None if there is data from the user.
+    """
+    transformed_data = {}
+    transformed_data["game_url"] = game.get("url")
+    transformed_data["game_id"] = game["url"].split("/")[-1]
+    date_pattern = r"\[Date \"(.*?)\"\]"
+    date_match = re.search(date_pattern, game.get("pgn", ""))
+    transformed_data["date"] = date_match.group(1) if date_match else None
+    transformed_data["rated"] = game.get("rated")
+    transformed_data["time_class"] = game.get("time_class")
+    opening = game.get("eco")
+    transformed_data["opening"] = opening.split("/")[-1]
+    accuracies = game.get(
+        "accuracies", {}
+    )  # get {} if there are no accuracies availables
+    transformed_data["white_accuracy"] = accuracies.get("white")
+    transformed_data["black_accuracy"] = accuracies.get("black")
+
+    player = False
+    if game["white"]["username"].lower() == username.lower():
+        transformed_data["player_color"] = "white"
+        transformed_data["player_rating"] = game["white"]["rating"]
+        transformed_data["opponent_username"] = game["black"]["username"]
+        transformed_data["opponent_rating"] = game["black"]["rating"]
+        player_result = game["white"]["result"]
+        player = True
+    elif game["black"]["username"].lower() == username.lower():
+        transformed_data["player_color"] = "black"
+        transformed_data["player_rating"] = game["black"]["rating"]
+        transformed_data["opponent_username"] = game["white"]["username"]
+        transformed_data["opponent_rating"] = game["white"]["rating"]
+        player_result = game["black"]["result"]
+        player = True
+
+    if not player:
+        return None
+
+    if player_result == "win":
+        transformed_data["player_result"] = "win"
+    elif player_result in ["resigned", "timeout", "checkmated"]:
+        transformed_data["player_result"] = "loss"
+    elif player_result in [
+        "draw",
+        "stalemate",
+        "insufficientmaterial",
+        "50move",
+        "agreed",
+        "repetition",
+    ]:
+        transformed_data["player_result"] = "draw"
+    else:
+        transformed_data["player_result"] = "N/A"
+    return transformed_data
+
+
+def per_game_transform(games, username: str):
+    """
+    It transforms games one by one with transformed_single_game, like
+    the transform did before the batch engine.
+    """
+    rows = []
+    for game in games:
+        row = transformed_single_game(game, username)
+        if row:
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def per_game_files(filepaths: list, username: str):
+    """
+    It reads the raw files game by game with iter_games and transforms
+    every game with transformed_single_game.
+    """
+    frames = [per_game_transform(iter_games(path), username) for path in filepaths]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def batch_files(filepaths: list, username: str):
+    """
+    It transforms the raw files with transform_file, like the ETL does.
+    """
+    frames = [transform_file(path, username) for path in filepaths]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def per_game_memory(months: list, username: str):
+    frames = [per_game_transform(games, username) for games in months]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def batch_memory(months: list, username: str):
+    frames = [transform_games_batch(games, username) for games in months]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def per_game_engine(decoded: list, username: str):
+    frames = [per_game_transform(games, username) for games, _ in decoded]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def batch_engine(decoded: list, username: str):
+    frames = [transform_games_table(table, username) for _, table in decoded]
+    return set_column_types(pd.concat(frames, ignore_index=True))
+
+
+def timed(function, *args, repeat: int = 3):
+    """
+    It runs a function `repeat` times and keeps the best time.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def compare(label: str, number_games: int, baseline, candidate, *args):
+    """
+    It times the per game and the batch transform on the same input,
+    checks that they give the same DataFrame and prints the throughputs.
+    """
+    expected, baseline_seconds = timed(baseline, *args)
+    result, candidate_seconds = timed(candidate, *args)
+    pd.testing.assert_frame_equal(result, expected)
+    print(f"{label}")
+    print(f"  per game : {number_games / baseline_seconds:12,.0f} games/s")
+    print(f"  batch    : {number_games / candidate_seconds:12,.0f} games/s")
+    print(f"  speedup  : {baseline_seconds / candidate_seconds:12.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the game transform")
+    parser.add_argument("--games", type=int, default=100_000)
+    args = parser.parse_args()
+
+    number_months = max(1, args.games // GAMES_PER_MONTH)
+    months = [
+        generate_month(USERNAME, 2015 + i // 12, i % 12 + 1, GAMES_PER_MONTH)
+        for i in range(number_months)
+    ]
+    number_games = sum(len(games) for games in months)
+    print(f"{number_games} synthetic games in {number_months} monthly archives")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepaths = []
+        for i, games in enumerate(months):
+            filepaths.append(os.path.join(tmp_dir, f"{USERNAME}_{i}.jsonl.gz"))
+            write_games_jsonl(games, filepaths[-1])
+        compare(
+            "raw .jsonl.gz files -> DataFrame",
+            number_games,
+            per_game_files,
+            batch_files,
+            filepaths,
+            USERNAME,
+        )
+    gc.freeze()  # the in-memory corpus is not scanned by the garbage collector
+    compare(
+        "games already loaded as dicts -> DataFrame",
+        number_games,
+        per_game_memory,
+        batch_memory,
+        months,
+        USERNAME,
+    )
+    decoded = [
+        (games, pa.Table.from_pylist(games, schema=RAW_GAME_SCHEMA)) for games in months
+    ]
+    compare(
+        "transform only, input already decoded (dicts / Arrow table)",
+        number_games,
+        per_game_engine,
+        batch_engine,
+        decoded,
+        USERNAME,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARKS_DIR, "..", "etl"))
+import extract_chess_data  # noqa: E402
+from fake_chess_api import FakeChessAPI  # noqa: E402
+from games_storage import read_data_version  # noqa: E402
+from main import run_etl  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from raw_archives import write_games_jsonl  # noqa: E402
+from synthetic import archive_filename, generate_month, write_corpus  # noqa: E402
+from transform_chess_data import TRANSFORMED_DATA_DIR  # noqa: E402
+from watch import watch_users  # noqa: E402
+
+USERNAME = "BenchPlayer"
+FIRST_GAMES = 50  # games of the current month before the watch starts
+
+
+def write_current_month(games: list):
+    """
+    It writes the archive of the current month of the corpus, served by
+    the fake API with a new ETag.
+    """
+    now = datetime.now(timezone.utc)
+    write_games_jsonl(
+        games,
+        os.path.join(
+            "corpus", USERNAME, archive_filename(USERNAME, now.year, now.month)
+        ),
+    )
+
+
+def wait_for_version(version: int, timeout: float):
+    """
+    It waits until the data version stamp of the player is above
+    `version`, like an open dashboard does.
+
+    Returns:
+        float/None: The time of the change, or None after the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if read_data_version(TRANSFORMED_DATA_DIR, USERNAME) > version:
+            return time.monotonic()
+        time.sleep(0.05)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delay and cost of the watch mode, vs running the ETL again"
+    )
+    parser.add_argument("--games", type=int, default=100_000, help="history")
+    parser.add_argument("--new-games", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds")
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    month_games = generate_month(
+        USERNAME, now.year, now.month, FIRST_GAMES + args.new_games + 1
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # the ETL writes to data/ like from the repository
+        write_corpus("corpus", [USERNAME], args.games)
+        write_current_month(month_games[:FIRST_GAMES])
+        with FakeChessAPI("corpus") as api:
+            extract_chess_data.API_URL = api.url
+            run_etl(USERNAME)
+
+            # one game more, then the whole ETL again, as done by hand
+            write_current_month(month_games[: FIRST_GAMES + 1])
+            requests = api.requests
+            cpu, start = time.process_time(), time.perf_counter()
+            run_etl(USERNAME)
+            by_hand = (
+                time.perf_counter() - start,
+                time.process_time() - cpu,
+                api.requests - requests,
+            )
+
+            METRICS.reset()
+            requests = api.requests
+            cpu = time.process_time()
+            duration = args.interval * (2 * args.new_games + 2)
+            watcher = threading.Thread(
+                target=watch_users,
+                args=([USERNAME], args.interval),
+                kwargs={"requests_per_second": 100, "duration": duration},
+            )
+            watcher.start()
+            delays = []
+            for number in range(FIRST_GAMES + 2, FIRST_GAMES + args.new_games + 2):
+                time.sleep(args.interval * 0.7)  # the game ends between two polls
+                version = read_data_version(TRANSFORMED_DATA_DIR, USERNAME)
+                write_current_month(month_games[:number])
+                ended_at = time.monotonic()
+                shown_at = wait_for_version(version, 4 * args.interval)
+                if shown_at is not None:
+                    delays.append(shown_at - ended_at)
+            watcher.join()
+            watch_cpu = time.process_time() - cpu
+            watch_requests = api.requests - requests
+        refresh = METRICS.snapshot()["spans"].get("watch_refresh", [0, 0.0, 0.0])
+        os.chdir(BENCHMARKS_DIR)
+
+    seconds, cpu_seconds, requests = by_hand
+    print(f"{args.games} games of history, a new game of the current month")
+    print(
+        f"ETL run again: {seconds:.2f}s, {cpu_seconds:.2f}s CPU, "
+        f"{requests} requests"
+    )
+    print(
+        f"watch: {len(delays)}/{args.new_games} new games shown, delay "
+        f"{sum(delays) / max(1, len(delays)):.1f}s on average and "
+        f"{max(delays, default=0):.1f}s at most (interval {args.interval:.0f}s)"
+    )
+    print(
+        f"watch: {refresh[1] / max(1, refresh[0]):.2f}s per refresh, "
+        f"{watch_cpu:.2f}s CPU and {watch_requests} requests "
+        f"in {duration:.0f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
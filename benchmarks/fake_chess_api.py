@@ -0,0 +1,175 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from raw_archives import RAW_SUFFIX  # noqa: E402
+from synthetic import archive_filename  # noqa: E402
+
+ARCHIVES_PATH = re.compile(r"^/pub/player/(?P<username>[^/]+)/games/archives$")
+MONTH_PATH = re.compile(
+    r"^/pub/player/(?P<username>[^/]+)/games/(?P<year>\d{4})/(?P<month>\d{2})$"
+)
+ARCHIVE_NAME = re.compile(r"^.+_(?P<year>\d+)_(?P<month>\d+)$")
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    The request handler of FakeChessAPI. It answers the archives list
+    and the monthly archives of the players of the corpus, with an ETag
+    and a Last-Modified header, and 304 Not Modified to conditional
+    requests when the archive did not change.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass  # one line per request would flood the benchmark output
+
+    def send_json(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+        match = ARCHIVES_PATH.match(self.path)
+        if match:
+            return self.send_archives(match["username"])
+        match = MONTH_PATH.match(self.path)
+        if match:
+            return self.send_month(
+                match["username"], int(match["year"]), int(match["month"])
+            )
+        self.send_json(404, b'{"code":0,"message":"not found"}')
+
+    def send_archives(self, username: str):
+        user_dir = os.path.join(self.server.corpus_dir, username)
+        if not os.path.isdir(user_dir):
+            return self.send_json(404, b'{"code":0,"message":"not found"}')
+        months = []
+        for file in os.listdir(user_dir):
+            match = ARCHIVE_NAME.match(file[: -len(RAW_SUFFIX)])
+            if file.endswith(RAW_SUFFIX) and match:
+                months.append((int(match["year"]), int(match["month"])))
+        archives = [
+            f"{self.server.url}/player/{username}/games/{year}/{month:02d}"
+            for year, month in sorted(months)
+        ]
+        self.send_json(200, json.dumps({"archives": archives}).encode("utf-8"))
+
+    def send_month(self, username: str, year: int, month: int):
+        filepath = os.path.join(
+            self.server.corpus_dir, username, archive_filename(username, year, month)
+        )
+        if not os.path.exists(filepath):
+            return self.send_json(404, b'{"code":0,"message":"not found"}')
+        stat = os.stat(filepath)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = {"ETag": etag, "Last-Modified": last_modified}
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with gzip.open(filepath, "rb") as f:
+            lines = [line.rstrip(b"\n") for line in f if line.strip()]
+        with self.server.lock:
+            self.server.games_served += len(lines)
+        body = b'{"games":[' + b",".join(lines) + b"]}"
+        self.send_json(200, body, headers)
+
+    def not_modified(self, etag: str, mtime: float):
+        if self.headers.get("If-None-Match"):
+            return self.headers["If-None-Match"] == etag
+        if self.headers.get("If-Modified-Since"):
+            try:
+                since = parsedate_to_datetime(self.headers["If-Modified-Since"])
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+
+class FakeChessAPI:
+    """
+    A local stand-in for the Chess.com published data API, serving the
+    monthly archives of a corpus written by synthetic.write_corpus from
+    the /pub/player/{username}/games/archives and
+    /pub/player/{username}/games/{YYYY}/{MM} endpoints. It runs in a
+    background thread, so the extraction can be measured offline by
+    pointing extract_chess_data.API_URL to `url`.
+
+    Args:
+        corpus_dir (str): The directory of the corpus, with one folder
+        of ".jsonl.gz" archives per player.
+        port (int): The port to listen to, 0 for any free port.
+        latency (float): The seconds waited before each answer, to
+        mimic the network.
+    """
+
+    def __init__(self, corpus_dir: str, port: int = 0, latency: float = 0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), ArchiveHandler)
+        self.server.daemon_threads = True
+        self.server.corpus_dir = corpus_dir
+        self.server.latency = latency
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.games_served = 0
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/pub"
+        self.server.url = self.url
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def games_served(self):
+        return self.server.games_served
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serves a synthetic corpus like the Chess.com API"
+    )
+    parser.add_argument("corpus_dir", help="directory written by synthetic.py")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    args = parser.parse_args()
+    with FakeChessAPI(args.corpus_dir, args.port, args.latency) as api:
+        print(f"Serving {args.corpus_dir} at {api.url} (Ctrl+C to stop)")
+        try:
+            api.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT_DIR, "etl"))
+sys.path.append(os.path.join(ROOT_DIR, "visualisation"))
+from fake_chess_api import FakeChessAPI  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+DEFAULT_TOLERANCE = 0.25
+NUMBER_QUERIES = 200
+
+
+def extract_case(usernames: list, api_url: str):
+    """
+    It downloads the archives of every player from the stand-in API.
+    """
+    import extract_chess_data
+
+    extract_chess_data.API_URL = api_url
+    start = time.perf_counter()
+    games = sum(
+        extract_chess_data.extract_chess_player_data(
+            username, requests_per_second=10_000
+        )
+        for username in usernames
+    )
+    return time.perf_counter() - start, games, "games"
+
+
+def transform_case(usernames: list, api_url: str):
+    """
+    It transforms the raw games of every player from scratch.
+    """
+    from transform_chess_data import transformed_games
+
+    start = time.perf_counter()
+    games = sum(
+        transformed_games(username, incremental=False, export_csv=False)[0]
+        for username in usernames
+    )
+    return time.perf_counter() - start, games, "games"
+
+
+def transform_noop_case(usernames: list, api_url: str):
+    """
+    It runs the incremental transform again when nothing changed.
+    """
+    from transform_chess_data import transformed_games
+
+    start = time.perf_counter()
+    games = sum(
+        transformed_games(username, export_csv=False)[0] for username in usernames
+    )
+    return time.perf_counter() - start, games, "games"
+
+
+def load_data_case(usernames: list, api_url: str):
+    """
+    It loads the games of every player like the dashboard does, from
+    a directory next to data/, like visualisation/.
+    """
+    os.makedirs("app", exist_ok=True)
+    os.chdir("app")
+    import visualisation_utils as vu
+
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):  # no Streamlit runtime here
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    start = time.perf_counter()
+    games = sum(len(vu.load_data(username)) for username in usernames)
+    return time.perf_counter() - start, games, "games"
+
+
+def load_data_month_case(usernames: list, api_url: str):
+    """
+    It loads the openings of the last month of every player, like the
+    dashboard does for a narrow date range, from a directory next to
+    data/, like visualisation/.
+    """
+    os.makedirs("app", exist_ok=True)
+    os.chdir("app")
+    import visualisation_utils as vu
+
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):  # no Streamlit runtime here
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    start = time.perf_counter()
+    games = 0
+    for username in usernames:
+        last_day = vu.load_cube(username).days[-1]
+        games += len(
+            vu.load_data(
+                username,
+                columns=("opening",),
+                start_date=last_day - pd.Timedelta(days=30),
+                end_date=last_day,
+            )
+        )
+    return time.perf_counter() - start, games, "games"
+
+
+def dashboard_build_case(usernames: list, api_url: str):
+    """
+    It builds the daily cube and the rating series of every player.
+    """
+    from aggregate_cube import build_cube
+    from games_storage import read_games
+    from rating_series import build_rating_series
+    from transform_chess_data import TRANSFORMED_DATA_DIR
+
+    frames = [read_games(TRANSFORMED_DATA_DIR, username) for username in usernames]
+    start = time.perf_counter()
+    for df in frames:
+        build_cube(df)
+        build_rating_series(df)
+    return time.perf_counter() - start, sum(map(len, frames)), "games"
+
+
+def dashboard_query_case(usernames: list, api_url: str):
+    """
+    It answers the dashboard widgets for random date ranges: the games
+    by time class and result from the cube and the rating chart points.
+    """
+    from aggregate_cube import read_cube
+    from rating_series import read_rating_series
+    from transform_chess_data import TRANSFORMED_DATA_DIR
+
+    rnd = np.random.default_rng(0)
+    queries = 0
+    start = time.perf_counter()
+    for username in usernames:
+        cube = read_cube(TRANSFORMED_DATA_DIR, username)
+        series = read_rating_series(TRANSFORMED_DATA_DIR, username)
+        days = cube.days
+        for _ in range(NUMBER_QUERIES):
+            first, last = np.sort(rnd.integers(0, len(days), 2))
+            summary = cube.select(days[first], days[last])
+            summary.groupby(["time_class", "player_result"])["games"].sum()
+            for time_class in series.time_classes():
+                series.select(time_class, days[first], days[last])
+            queries += 1
+    return time.perf_counter() - start, queries, "queries"
+
+
+CASES = {
+    "extract": extract_case,
+    "transform": transform_case,
+    "transform_noop": transform_noop_case,
+    "load_data": load_data_case,
+    "load_data_month": load_data_month_case,
+    "dashboard_build": dashboard_build_case,
+    "dashboard_query": dashboard_query_case,
+}
+
+
+def run_case(name: str, workdir: str, usernames: list, api_url: str, verbose: bool):
+    """
+    It runs one case in the current process, which is a fresh process
+    started by run_suite, so the peak RSS is the one of the case.
+    """
+    os.chdir(workdir)
+    output = sys.stdout if verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        seconds, count, unit = CASES[name](usernames, api_url)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":  # kilobytes on Linux, bytes on macOS
+        peak_rss *= 1024
+    return {
+        "seconds": seconds,
+        "count": count,
+        "unit": unit,
+        "throughput": count / seconds if seconds else float("inf"),
+        "peak_rss_mb": peak_rss / 1e6,
+    }
+
+
+def run_suite(workdir: str, corpus_dir: str, usernames: list, cases: list, args):
+    """
+    It runs the cases in order on an empty data directory, each in its
+    own process, with the stand-in API serving the corpus. Each case
+    uses the data of the previous ones, so the cases before the last
+    requested one are run too, but only the requested ones are
+    reported.
+    """
+    shutil.rmtree(os.path.join(workdir, "data"), ignore_errors=True)
+    names = list(CASES)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with FakeChessAPI(corpus_dir, latency=args.latency) as api:
+        for name in names[: max(map(names.index, cases)) + 1]:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                results[name] = executor.submit(
+                    run_case, name, workdir, usernames, api.url, args.verbose
+                ).result()
+    return {name: results[name] for name in cases}
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    It compares the results with the baseline.
+
+    Returns:
+        list: The regressions, as texts.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in ["seconds", "peak_rss_mb"]:
+            if result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.2f} > "
+                    f"{reference[metric]:.2f} (+{tolerance:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmarks of the ETL and the dashboard"
+    )
+    parser.add_argument("--games", type=int, default=20_000, help="total games")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--games-per-month", type=int, default=5000)
+    parser.add_argument("--corpus", help="existing corpus written by synthetic.py")
+    parser.add_argument("--workdir", help="directory kept after the run")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=1, help="best of N runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="API seconds")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    workdir = args.workdir
+    if workdir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        workdir = tmp_dir.name
+    os.makedirs(workdir, exist_ok=True)
+    workdir = os.path.abspath(workdir)
+    corpus_dir = args.corpus or os.path.join(workdir, "corpus")
+    if args.corpus:
+        usernames = sorted(os.listdir(corpus_dir))
+    else:
+        usernames = [f"player{i}" for i in range(args.players)]
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        start = time.perf_counter()
+        write_corpus(corpus_dir, usernames, args.games, args.games_per_month)
+        print(
+            f"Corpus: {args.games} games of {len(usernames)} players written in "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+    corpus = {
+        "games": args.games,
+        "players": len(usernames),
+        "games_per_month": args.games_per_month,
+        "corpus": args.corpus,
+    }
+
+    best = {}
+    for _ in range(args.repeat):
+        for name, result in run_suite(
+            workdir, corpus_dir, usernames, args.cases, args
+        ).items():
+            if name not in best or result["seconds"] < best[name]["seconds"]:
+                best[name] = result
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("corpus") == corpus:
+            baseline = saved["cases"]
+        else:
+            print(f"The baseline {args.baseline} was measured on another corpus")
+    table = pd.DataFrame(best).T[["seconds", "count", "unit", "throughput"]]
+    table["per second"] = table.pop("throughput").map("{:,.0f}".format)
+    table["peak RSS (MB)"] = [result["peak_rss_mb"] for result in best.values()]
+    if baseline:
+        table["baseline (s)"] = [
+            baseline.get(name, {}).get("seconds", float("nan")) for name in best
+        ]
+    print(table.to_string(float_format="{:.2f}".format))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"corpus": corpus, "cases": best}, f, indent=2)
+        print(f"Baseline saved: {args.baseline}")
+        return
+    regressions = compare(best, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
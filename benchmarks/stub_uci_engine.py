@@ -0,0 +1,84 @@
+import sys
+
+import chess
+import chess.polyglot
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 300,
+    chess.BISHOP: 320,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+NOISE = 60  # centipawns added from the hash of the position
+
+
+def evaluate(board: chess.Board):
+    """
+    It gives a score in centipawns from the side to move: the material
+    balance and a deterministic noise derived from the position, so the
+    same position always gets the same score.
+    """
+    score = sum(
+        value
+        * (
+            len(board.pieces(piece, chess.WHITE))
+            - len(board.pieces(piece, chess.BLACK))
+        )
+        for piece, value in PIECE_VALUES.items()
+    )
+    score += chess.polyglot.zobrist_hash(board) % (2 * NOISE + 1) - NOISE
+    return score if board.turn == chess.WHITE else -score
+
+
+def position(arguments: list):
+    """
+    It builds the board of a "position" command, like "startpos moves
+    e2e4" or "fen <fen> moves e7e5".
+    """
+    if arguments[0] == "startpos":
+        board, rest = chess.Board(), arguments[1:]
+    else:
+        end = arguments.index("moves") if "moves" in arguments else len(arguments)
+        board, rest = chess.Board(" ".join(arguments[1:end])), arguments[end:]
+    for move in rest[1:]:
+        board.push_uci(move)
+    return board
+
+
+def main():
+    """
+    A minimal UCI engine for the benchmarks: it answers "go" at once
+    with the evaluation of the position and its first legal move, so
+    the analysis pipeline can be measured without a real engine.
+    """
+    board = chess.Board()
+    for line in sys.stdin:
+        command, *arguments = line.split() or [""]
+        if command == "uci":
+            print("id name StubEngine\nid author benchmarks\nuciok", flush=True)
+        elif command == "isready":
+            print("readyok", flush=True)
+        elif command == "position":
+            board = position(arguments)
+        elif command == "go":
+            depth = (
+                arguments[arguments.index("depth") + 1] if "depth" in arguments else 1
+            )
+            move = next(iter(board.legal_moves), None)
+            if move is None:
+                score = "mate 0" if board.is_check() else "cp 0"
+                print(f"info depth 0 score {score}\nbestmove (none)", flush=True)
+                continue
+            print(
+                f"info depth {depth} score cp {evaluate(board)} nodes 1 pv {move.uci()}",
+                flush=True,
+            )
+            print(f"bestmove {move.uci()}", flush=True)
+        elif command == "quit":
+            break
+
+
+if __name__ == "__main__":
+    main()
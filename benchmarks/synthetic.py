@@ -0,0 +1,331 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from raw_archives import RAW_SUFFIX, write_games_jsonl  # noqa: E402
+
+RESULTS_LOSS = ["resigned", "timeout", "checkmated", "abandoned"]
+RESULTS_DRAW = [
+    "agreed",
+    "repetition",
+    "stalemate",
+    "insufficientmaterial",
+    "50move",
+    "timevsinsufficient",
+]
+TIME_CONTROLS = {
+    "bullet": ["60", "120+1"],
+    "blitz": ["180", "180+2", "300"],
+    "rapid": ["600", "900+10"],
+    "daily": ["1/86400"],
+}
+OPENINGS = {
+    "Sicilian-Defense-Najdorf-Variation": (
+        "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6 Be3 e5 Nb3 Be6 f3 Be7 Qd2 O-O"
+    ),
+    "Ruy-Lopez-Opening-Morphy-Defense": (
+        "e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8"
+    ),
+    "French-Defense-Winawer-Variation": (
+        "e4 e6 d4 d5 Nc3 Bb4 e5 c5 a3 Bxc3+ bxc3 Ne7 Qg4 Qc7 Qxg7 Rg8 Qxh7 cxd4"
+    ),
+    "Queens-Gambit-Declined": (
+        "d4 d5 c4 e6 Nc3 Nf6 Bg5 Be7 e3 O-O Nf3 h6 Bh4 b6 cxd5 Nxd5 Bxe7 Qxe7"
+    ),
+    "Kings-Indian-Defense": (
+        "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6 Nf3 O-O Be2 e5 O-O Nc6 d5 Ne7 Ne1 Nd7"
+    ),
+    "Italian-Game-Giuoco-Piano": (
+        "e4 e5 Nf3 Nc6 Bc4 Bc5 c3 Nf6 d3 d6 O-O O-O Re1 a6 Bb3 Ba7 h3 h6"
+    ),
+    "Caro-Kann-Defense-Advance-Variation": (
+        "e4 c6 d4 d5 e5 Bf5 Nf3 e6 Be2 c5 Be3 Nd7 O-O Ne7 c4 dxc4 Na3 Nd5"
+    ),
+    "Scandinavian-Defense-Mieses-Kotrc-Variation": (
+        "e4 d5 exd5 Qxd5 Nc3 Qa5 d4 Nf6 Nf3 c6 Bc4 Bf5 Bd2 e6 Qe2 Bb4 O-O-O Nbd7"
+    ),
+    "English-Opening": (
+        "c4 e5 Nc3 Nf6 g3 d5 cxd5 Nxd5 Bg2 Nb6 Nf3 Nc6 O-O Be7 d3 O-O a3 Be6"
+    ),
+    "London-System": (
+        "d4 d5 Bf4 Nf6 e3 e6 Nf3 c5 c3 Nc6 Nbd2 Bd6 Bg3 O-O Bd3 b6 Ne5 Bb7"
+    ),
+}
+OPENING_NAMES = list(OPENINGS)
+
+
+def archive_filename(username: str, year: int, month: int):
+    """
+    It builds the name of the raw file of a monthly archive.
+
+    Args:
+        username (str): The chess.com username of the player.
+        year (int): The year of the games.
+        month (int): The month of the games.
+
+    Returns:
+        str: The file name, for example "hikaru_2024_5.jsonl.gz".
+    """
+    return f"{username}_{year}_{month}{RAW_SUFFIX}"
+
+
+def format_clock(deciseconds: int):
+    """
+    It formats a clock time the way Chess.com writes it in %clk
+    annotations, for example "0:02:59.9".
+
+    Args:
+        deciseconds (int): The remaining time in tenths of a second.
+
+    Returns:
+        str: The formatted clock.
+    """
+    seconds, tenths = divmod(max(0, deciseconds), 10)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    clock = f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{clock}.{tenths}" if tenths else clock
+
+
+def generate_movetext(rnd: random.Random, opening: str, time_control: str):
+    """
+    It builds a legal movetext with %clk annotations. The moves are a
+    prefix of the main line of the opening, so every game can be
+    replayed by a real chess library.
+
+    Args:
+        rnd (random.Random): The random generator.
+        opening (str): The name of the opening in OPENINGS.
+        time_control (str): The Chess.com time control, like "180+2".
+
+    Returns:
+        str: The movetext, without the result.
+    """
+    moves = OPENINGS[opening].split()
+    moves = moves[: rnd.randint(6, len(moves))]
+    if "/" in time_control:
+        base, increment = 864000, 0
+    else:
+        base_seconds, _, increment_seconds = time_control.partition("+")
+        base = int(base_seconds) * 10
+        increment = int(increment_seconds or 0) * 10
+    clocks = [base, base]
+    parts = []
+    for ply, move in enumerate(moves):
+        side = ply % 2
+        spent = rnd.randint(0, max(1, base // 40))
+        clocks[side] = max(0, clocks[side] - spent) + increment
+        number = ply // 2 + 1
+        prefix = f"{number}. " if side == 0 else f"{number}... "
+        parts.append(f"{prefix}{move} {{[%clk {format_clock(clocks[side])}]}}")
+    return " ".join(parts)
+
+
+def generate_game(
+    rnd: random.Random,
+    game_id: int,
+    username: str,
+    year: int,
+    month: int,
+    opponents: list = None,
+):
+    """
+    It generates one game shaped like the games of the Chess.com
+    monthly archives endpoint (url, pgn, time_control, end_time, rated,
+    accuracies, uuid, fen, time_class, rules, white, black and eco).
+
+    Args:
+        rnd (random.Random): The random generator.
+        game_id (int): The id of the game, used in its URL.
+        username (str): The player whose archive contains the game.
+        year (int): The year of the archive.
+        month (int): The month of the archive.
+        opponents (list): The usernames the player can meet. Defaults
+        to 200 generated names.
+
+    Returns:
+        dict: The raw game.
+    """
+    if opponents:
+        opponent = rnd.choice(opponents)
+    else:
+        opponent = f"opponent_{rnd.randint(1, 200)}"
+    time_class = rnd.choices(list(TIME_CONTROLS), weights=[3, 5, 2, 0.5])[0]
+    time_control = rnd.choice(TIME_CONTROLS[time_class])
+    opening = rnd.choice(OPENING_NAMES)
+    outcome = rnd.random()
+    if outcome < 0.47:
+        white_result, black_result = "win", rnd.choice(RESULTS_LOSS)
+    elif outcome < 0.92:
+        white_result, black_result = rnd.choice(RESULTS_LOSS), "win"
+    else:
+        white_result = black_result = rnd.choice(RESULTS_DRAW)
+    player_is_white = rnd.random() < 0.5
+    white_name, black_name = (
+        (username, opponent) if player_is_white else (opponent, username)
+    )
+    day = rnd.randint(1, 28)
+    hour, minute = rnd.randint(0, 23), rnd.randint(0, 59)
+    end_time = int(
+        datetime(year, month, day, hour, minute, tzinfo=timezone.utc).timestamp()
+    )
+    result = {"win": "1-0"}.get(white_result) or (
+        "0-1" if black_result == "win" else "1/2-1/2"
+    )
+    white_rating = rnd.randint(800, 2400)
+    black_rating = max(100, white_rating + rnd.randint(-200, 200))
+    kind = "daily" if time_class == "daily" else "live"
+    eco_url = f"https://www.chess.com/openings/{opening}"
+    pgn = (
+        '[Event "Live Chess"]\n'
+        '[Site "Chess.com"]\n'
+        f'[Date "{year}.{month:02d}.{day:02d}"]\n'
+        '[Round "-"]\n'
+        f'[White "{white_name}"]\n'
+        f'[Black "{black_name}"]\n'
+        f'[Result "{result}"]\n'
+        f'[WhiteElo "{white_rating}"]\n'
+        f'[BlackElo "{black_rating}"]\n'
+        f'[TimeControl "{time_control}"]\n'
+        f'[ECOUrl "{eco_url}"]\n'
+        f'[Link "https://www.chess.com/game/{kind}/{game_id}"]\n'
+        "\n"
+        f"{generate_movetext(rnd, opening, time_control)} {result}\n"
+    )
+    game = {
+        "url": f"https://www.chess.com/game/{kind}/{game_id}",
+        "pgn": pgn,
+        "time_control": time_control,
+        "end_time": end_time,
+        "rated": rnd.random() < 0.9,
+        "tcn": "",
+        "uuid": f"{game_id:032x}",
+        "initial_setup": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "time_class": time_class,
+        "rules": "chess",
+        "white": {
+            "rating": white_rating,
+            "result": white_result,
+            "@id": f"https://api.chess.com/pub/player/{white_name.lower()}",
+            "username": white_name,
+            "uuid": f"w{game_id:031x}",
+        },
+        "black": {
+            "rating": black_rating,
+            "result": black_result,
+            "@id": f"https://api.chess.com/pub/player/{black_name.lower()}",
+            "username": black_name,
+            "uuid": f"b{game_id:031x}",
+        },
+        "eco": eco_url,
+    }
+    if rnd.random() < 0.4:
+        game["accuracies"] = {
+            "white": round(rnd.uniform(40, 99), 2),
+            "black": round(rnd.uniform(40, 99), 2),
+        }
+    return game
+
+
+def generate_month(
+    username: str, year: int, month: int, number_games: int, seed: int = 0
+):
+    """
+    It generates the games of one monthly archive of a player.
+
+    Args:
+        username (str): The player.
+        year (int): The year of the archive.
+        month (int): The month of the archive.
+        number_games (int): The number of games of the month.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        list: The raw games, sorted by end time like the API does.
+    """
+    rnd = random.Random(f"{seed}-{username}-{year}-{month}")
+    first_id = (year * 12 + month) * 10_000_000 + seed * 1_000_000
+    games = [
+        generate_game(rnd, first_id + i, username, year, month)
+        for i in range(number_games)
+    ]
+    games.sort(key=lambda game: game["end_time"])
+    return games
+
+
+def write_corpus(
+    output_dir: str,
+    usernames: list,
+    number_games: int,
+    games_per_month: int = 5000,
+    first_year: int = 2010,
+):
+    """
+    It writes a corpus of monthly archives, one ".jsonl.gz" file per
+    player and month in `output_dir/<username>`, like the raw files of
+    the ETL. The games are split between the players, and each player
+    has full months of `games_per_month` games from January of
+    `first_year`, the last month holding the remaining games. The
+    archives are generated one at a time, so a corpus of millions of
+    games does not have to fit in memory.
+
+    Args:
+        output_dir (str): The directory of the corpus.
+        usernames (list): The players.
+        number_games (int): The total number of games.
+        games_per_month (int): The number of games of a full month.
+        first_year (int): The year of the first archive.
+
+    Returns:
+        int: The number of written archives.
+    """
+    number_archives = 0
+    for seed, username in enumerate(usernames):
+        remaining = number_games // len(usernames)
+        remaining += seed < number_games % len(usernames)
+        os.makedirs(os.path.join(output_dir, username), exist_ok=True)
+        month_index = 0
+        while remaining > 0:
+            year, month = first_year + month_index // 12, month_index % 12 + 1
+            games = generate_month(
+                username, year, month, min(games_per_month, remaining), seed
+            )
+            write_games_jsonl(
+                games,
+                os.path.join(
+                    output_dir, username, archive_filename(username, year, month)
+                ),
+            )
+            remaining -= len(games)
+            month_index += 1
+            number_archives += 1
+    return number_archives
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Writes a corpus of synthetic Chess.com monthly archives"
+    )
+    parser.add_argument("output_dir", help="directory of the corpus")
+    parser.add_argument("--games", type=int, default=100_000, help="total games")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--games-per-month", type=int, default=5000)
+    args = parser.parse_args()
+    usernames = [f"player{i}" for i in range(args.players)]
+    start = time.perf_counter()
+    number_archives = write_corpus(
+        args.output_dir, usernames, args.games, args.games_per_month
+    )
+    print(
+        f"{args.games} games in {number_archives} archives written to "
+        f"{args.output_dir} in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+CUBE_SUFFIX = "_daily_cube.parquet"
+CUBE_KEYS = ["day", "time_class", "player_color", "player_result"]
+CELL_KEYS = CUBE_KEYS[1:]
+RATING_COLUMNS = ["player_rating", "opponent_rating"]
+
+
+def cube_filepath(output_dir: str, username: str):
+    """
+    It builds the path of the aggregate cube of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the cube file.
+    """
+    return os.path.join(output_dir, username, f"{username}{CUBE_SUFFIX}")
+
+
+def build_cube(df: pd.DataFrame):
+    """
+    It aggregates the transformed games by day, time class, color and
+    result. Each cell holds the number of games and, for the ratings of
+    the player and of the opponents, the number of rated games and the
+    sum, the min and the max of the ratings, which is all the dashboard
+    needs. The sums skip the missing ratings, so an average divides by
+    the rated games. Games without a date are left out.
+
+    Args:
+        df (pd.DataFrame): The transformed games, with converted types.
+
+    Returns:
+        pd.DataFrame: One row per non-empty cell, sorted by day.
+    """
+    df = df.dropna(subset=["date"]).assign(day=df["date"].dt.normalize())
+    df = df.astype(  # the Int16 ratings are summed without overflow
+        {
+            column: np.int64 if df[column].notna().all() else np.float64
+            for column in RATING_COLUMNS
+        }
+    )
+    aggregations = {"games": ("player_rating", "size")}
+    for column in RATING_COLUMNS:
+        aggregations[f"{column}_games"] = (column, "count")
+        aggregations[f"{column}_sum"] = (column, "sum")
+        aggregations[f"{column}_min"] = (column, "min")
+        aggregations[f"{column}_max"] = (column, "max")
+    cube = df.groupby(CUBE_KEYS, observed=True).agg(**aggregations).reset_index()
+    for column in CELL_KEYS:
+        cube[column] = cube[column].astype(str)
+    return cube
+
+
+def fill_rated_games(cells: pd.DataFrame):
+    """
+    It adds the rated games counts to cube cells written before they
+    existed, as the number of games, which is what the averages were
+    divided by then.
+
+    Args:
+        cells (pd.DataFrame): Cube cells, as written by build_cube or
+        returned by DailyCube.select.
+
+    Returns:
+        pd.DataFrame: The cells with a rated games count per rating.
+    """
+    for column in RATING_COLUMNS:
+        rated = f"{column}_games"
+        if rated not in cells:
+            cells[rated] = cells["games"]
+        else:
+            cells[rated] = cells[rated].fillna(cells["games"])
+    return cells
+
+
+def write_cube(df, output_dir: str, username: str, months: list = None):
+    """
+    It builds and saves the aggregate cube of the transformed games.
+    The games can be given one month at a time: since a day is in one
+    month, the cube is the concatenation of the cubes of the months.
+    For the same reason, when `months` is given, only the rows of these
+    months are rebuilt from `df` and the other rows of the saved cube
+    are kept, so appending the games of the current month does not
+    aggregate the whole history again.
+
+    Args:
+        df (pd.DataFrame/iterable): The transformed games, with
+        converted types, or an iterable of the games of each month in
+        the order of the months, like games_storage.iter_partitions.
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+        months (list): If given, the (year, month) pairs of the games
+        of `df`, including the months left without games. The cube
+        file has to exist.
+
+    Returns:
+        str: The path of the cube file.
+    """
+    filepath = cube_filepath(output_dir, username)
+    frames = [df] if isinstance(df, pd.DataFrame) else df
+    cubes = [build_cube(frame) for frame in frames]
+    if months is not None:
+        cube = pd.read_parquet(filepath)
+        keys = cube["day"].dt.year * 100 + cube["day"].dt.month
+        rebuilt = keys.isin([year * 100 + month for year, month in months])
+        cubes.insert(0, cube[~rebuilt])
+    cube = pd.concat(
+        [cube for cube in cubes if not cube.empty] or cubes[:1], ignore_index=True
+    )
+    if months is not None:
+        cube = cube.sort_values("day", kind="stable", ignore_index=True)
+    tmp_filepath = f"{filepath}.tmp"
+    cube.to_parquet(tmp_filepath, index=False)
+    os.replace(tmp_filepath, filepath)
+    return filepath
+
+
+class DailyCube:
+    """
+    The aggregate cube of a user, laid out as dense arrays of shape
+    (days, cells) where a cell is a (time class, color, result) triple.
+    The counts and the rating sums are kept as prefix sums over the
+    days, so the totals of any date range cost two lookups, and the
+    min and max are reduced over the days of the range. A query never
+    depends on the number of games.
+
+    Args:
+        cube (pd.DataFrame): The cube, as returned by build_cube.
+    """
+
+    def __init__(self, cube: pd.DataFrame):
+        cube = fill_rated_games(cube.copy())
+        days, day_index = np.unique(cube["day"].to_numpy(), return_inverse=True)
+        cells = pd.MultiIndex.from_frame(cube[CELL_KEYS]).drop_duplicates()
+        cells = cells.sort_values()
+        cell_index = cells.get_indexer(pd.MultiIndex.from_frame(cube[CELL_KEYS]))
+        self.days = pd.DatetimeIndex(days)
+        self.cells = cells.to_frame(index=False)
+        shape = (len(days), len(cells))
+        self.prefix = {}
+        for column in ["games"] + [
+            f"{c}_{name}" for c in RATING_COLUMNS for name in ["games", "sum"]
+        ]:
+            values = np.zeros(shape, dtype=np.float64)
+            values[day_index, cell_index] = cube[column].to_numpy()
+            self.prefix[column] = np.concatenate(
+                [np.zeros((1, len(cells))), np.cumsum(values, axis=0)]
+            )
+        self.extremes = {}
+        for column in RATING_COLUMNS:
+            for name, empty in [("min", np.inf), ("max", -np.inf)]:
+                values = np.full(shape, empty)
+                values[day_index, cell_index] = cube[f"{column}_{name}"].to_numpy()
+                self.extremes[f"{column}_{name}"] = values
+
+    def __len__(self):
+        return int(self.prefix["games"][-1].sum()) if len(self.days) else 0
+
+    def day_range(self, start, end):
+        """
+        It finds the days of the cube between two dates, both included.
+        """
+        return (
+            int(self.days.searchsorted(pd.Timestamp(start).normalize(), "left")),
+            int(self.days.searchsorted(pd.Timestamp(end), "right")),
+        )
+
+    def select(self, start, end):
+        """
+        It aggregates the cells of the cube over a date range.
+
+        Args:
+            start (datetime): The first day of the range.
+            end (datetime): The last day of the range.
+
+        Returns:
+            pd.DataFrame: One row per cell with at least one game: the
+            time class, color and result, the number of games, and the
+            number of rated games, sum, min and max of the ratings.
+        """
+        first, last = self.day_range(start, end)
+        played = self.prefix["games"][last] > self.prefix["games"][first]
+        summary = {
+            column: values.to_numpy()[played] for column, values in self.cells.items()
+        }
+        for column, prefix in self.prefix.items():
+            summary[column] = (prefix[last] - prefix[first])[played]
+        for column, values in self.extremes.items():
+            if column.endswith("_min"):
+                summary[column] = values[first:last, played].min(axis=0, initial=np.inf)
+            else:
+                summary[column] = values[first:last, played].max(
+                    axis=0, initial=-np.inf
+                )
+        for column in ["games"] + [f"{c}_games" for c in RATING_COLUMNS]:
+            summary[column] = summary[column].astype(np.int64)
+        return pd.DataFrame(summary)
+
+    def daily(self, start, end, time_class: str, column: str = "player_rating"):
+        """
+        It gives the number of games and the average rating of each day
+        of a date range, for one time class.
+
+        Args:
+            start (datetime): The first day of the range.
+            end (datetime): The last day of the range.
+            time_class (str): The time class, like "blitz".
+            column (str): "player_rating" or "opponent_rating".
+
+        Returns:
+            pd.DataFrame: The day, the number of games and the average
+            rating of the days with at least one game.
+        """
+        first, last = self.day_range(start, end)
+        cells = (self.cells["time_class"] == time_class).to_numpy()
+        games = np.diff(self.prefix["games"][first : last + 1][:, cells].sum(axis=1))
+        rated, sums = (
+            np.diff(self.prefix[name][first : last + 1][:, cells].sum(axis=1))
+            for name in [f"{column}_games", f"{column}_sum"]
+        )
+        played = games > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = np.where(rated > 0, sums / rated, np.nan)
+        return pd.DataFrame(
+            {
+                "date": self.days[first:last][played],
+                "games": games[played].astype(np.int64),
+                column: averages[played],
+            }
+        )
+
+
+def read_cube(output_dir: str, username: str):
+    """
+    It reads the aggregate cube of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        DailyCube/None: The cube, or None if the user has no cube.
+    """
+    filepath = cube_filepath(output_dir, username)
+    if not os.path.exists(filepath):
+        return None
+    return DailyCube(pd.read_parquet(filepath))
@@ -0,0 +1,265 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime, timezone
+
+from extract_chess_data import (
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_SECOND,
+    download_and_save_archive,
+    plan_archive_downloads,
+    report_archive_progress,
+)
+from games_database import write_database_version
+from games_storage import write_data_version
+from http_session import ValidatorStore
+from metrics import METRICS, span
+from opening_index import build_opening_index
+from pgn_parser import build_move_store
+from rate_limiter import TokenBucket
+from transform_chess_data import TRANSFORMED_DATA_DIR, transformed_games
+
+STATUS_FILE = "data/batch_status.json"
+
+
+class BatchStatus:
+    """
+    The status of every user of a batch run, saved to a JSON file after
+    each change so that an interrupted run can be resumed. The state of
+    a user goes through "planning", "downloading", "transforming" and
+    ends with "done", "no_data", "failed" or "partial", when some of its
+    archives could not be downloaded (listed in "failed_archives").
+
+    Args:
+        filepath (str): The JSON file where the statuses are saved.
+    """
+
+    def __init__(self, filepath: str = STATUS_FILE):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.users = {}
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    self.users = json.load(f)
+            except (IOError, ValueError) as err:
+                print(f"Error {err} during reading file: {filepath}")
+
+    def get(self, username: str):
+        with self.lock:
+            return dict(self.users.get(username, {}))
+
+    def update(self, username: str, **fields):
+        """
+        It updates the status of a user and saves the file.
+
+        Args:
+            username (str): The chess.com username of the player.
+            **fields: The fields to set, for example state="done".
+        """
+        with self.lock:
+            user = self.users.setdefault(username, {})
+            user.update(fields)
+            user["updated_at"] = datetime.now(timezone.utc).isoformat()
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            tmp_filepath = f"{self.filepath}.tmp"
+            with open(tmp_filepath, "w", encoding="utf-8") as f:
+                json.dump(self.users, f, indent=4)
+            os.replace(tmp_filepath, self.filepath)
+
+
+def transform_user(username: str, database_path: str = None):
+    """
+    It runs the transform step of one user, then builds its move store
+    and its opening index, and increments the data version stamp read
+    by the dashboard if the transform changed the data.
+    It is the function run by the worker processes, so the DataFrame
+    stays in the worker and only the number of games is sent back, with
+    the metrics of the transform, which are added to the metrics of the
+    batch.
+
+    Args:
+        username (str): The chess.com username of the player.
+        database_path (str): If given, the games are also written to
+        this SQLite database.
+
+    Returns:
+        tuple: The number of transformed games and the snapshot of the
+        metrics of the worker for this user.
+    """
+    METRICS.reset()  # a worker process transforms several users
+    with span("transform"):
+        number_games, changed = transformed_games(
+            username=username, database_path=database_path
+        )
+    with span("move_store"):
+        build_move_store(username=username, workers=1)  # already in a worker
+    with span("opening_index"):
+        build_opening_index(username=username)
+    if number_games and changed:
+        version = write_data_version(TRANSFORMED_DATA_DIR, username)
+        if database_path:
+            write_database_version(username, version, database_path)
+    return number_games, METRICS.snapshot()
+
+
+def run_batch_etl(
+    usernames: list,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    transform_workers: int = None,
+    resume: bool = False,
+    status_path: str = STATUS_FILE,
+    database_path: str = None,
+):
+    """
+    Runs the ETL for many users at once. All the requests of all the
+    users go through one pool of `max_workers` download threads and
+    one token bucket, so the whole batch respects a single API rate
+    budget. As soon as all the archives of a user are downloaded, its
+    transform is started in a pool of worker processes, while the
+    downloads of the other users continue. The worker processes are
+    spawned rather than forked, since a fork while download threads
+    write to the SQLite game store would give the workers a copy of
+    the locks of the store.
+
+    The status of every user is saved in `status_path`. With `resume`,
+    the users already done in a previous run are skipped, and the
+    others start again from what is already on disk, since the
+    extraction and the transform are both incremental. A user whose
+    downloads partly failed is transformed with the archives it has,
+    but left "partial", so a resumed run downloads the missing months.
+
+    Args:
+        usernames (list): The chess.com usernames of the players.
+        max_workers (int): The number of download threads.
+        requests_per_second (float): The API rate budget of the batch.
+        transform_workers (int): The number of transform processes.
+        Defaults to the number of CPUs.
+        resume (bool): If True, the users done in a previous run are
+        skipped.
+        status_path (str): The JSON file of the batch status.
+        database_path (str): If given, the games of every user are also
+        written to this SQLite database.
+
+    Returns:
+        dict: The final status of each user of the batch.
+    """
+    status = BatchStatus(status_path)
+    rate_limiter = TokenBucket(requests_per_second)
+    validators = ValidatorStore()
+    usernames = list(dict.fromkeys(usernames))
+    if resume:
+        skipped = [u for u in usernames if status.get(u).get("state") == "done"]
+        usernames = [u for u in usernames if u not in skipped]
+        if skipped:
+            print(f"=>Resume: {len(skipped)} user(s) already done are skipped")
+    print(f"=>Start of the batch ETL of {len(usernames)} user(s)")
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, max_workers)
+    ) as downloads, ProcessPoolExecutor(
+        max_workers=transform_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as transforms:
+        pending = {}  # future -> (kind, username, filepath)
+        remaining_archives = {}
+        downloaded_games = {}
+        failed_archives = {}  # username -> URLs of the failed downloads
+        archive_urls = {}  # download future -> URL of its archive
+
+        def start_transform(username):
+            status.update(username, state="transforming")
+            pending[transforms.submit(transform_user, username, database_path)] = (
+                "transform",
+                username,
+                None,
+            )
+
+        for username in usernames:
+            status.update(username, state="planning", error=None, failed_archives=None)
+            future = downloads.submit(plan_archive_downloads, username, rate_limiter)
+            pending[future] = ("plan", username, None)
+
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, username, filepath = pending.pop(future)
+                if kind == "plan":
+                    try:
+                        archives = future.result()
+                    except Exception as e:
+                        status.update(username, state="failed", error=str(e))
+                        continue
+                    if archives is None:
+                        status.update(username, state="no_data")
+                        continue
+                    status.update(username, state="downloading", archives=len(archives))
+                    remaining_archives[username] = len(archives)
+                    downloaded_games[username] = 0
+                    failed_archives[username] = []
+                    if not archives:
+                        start_transform(username)
+                    for archive_url, archive_path in archives:
+                        download = downloads.submit(
+                            download_and_save_archive,
+                            archive_url,
+                            archive_path,
+                            rate_limiter,
+                            validators,
+                        )
+                        pending[download] = ("download", username, archive_path)
+                        archive_urls[download] = archive_url
+                elif kind == "download":
+                    remaining_archives[username] -= 1
+                    total = status.get(username)["archives"]
+                    done = total - remaining_archives[username]
+                    downloaded_games[username] += report_archive_progress(
+                        done, total, filepath, future
+                    )
+                    if future.exception() is not None:
+                        failed_archives[username].append(archive_urls[future])
+                    del archive_urls[future]
+                    if remaining_archives[username] == 0:
+                        status.update(
+                            username, downloaded_games=downloaded_games[username]
+                        )
+                        start_transform(username)
+                else:
+                    try:
+                        number_games, worker_metrics = future.result()
+                    except Exception as e:
+                        status.update(username, state="failed", error=str(e))
+                        continue
+                    METRICS.merge(worker_metrics)
+                    failed = failed_archives.get(username)
+                    if failed:
+                        status.update(
+                            username,
+                            state="partial",
+                            games=number_games,
+                            failed_archives=failed,
+                            error=f"{len(failed)} archive(s) not downloaded",
+                        )
+                        print(
+                            f"=>{username} partial: {number_games} games, "
+                            f"{len(failed)} archive(s) not downloaded"
+                        )
+                        continue
+                    status.update(username, state="done", games=number_games)
+                    print(f"=>{username} done: {number_games} games")
+    validators.save()
+    final_status = {username: status.get(username) for username in usernames}
+    states = [user.get("state") for user in final_status.values()]
+    print(
+        f"=>Batch done. {states.count('done')} done, "
+        f"{states.count('partial')} partial, {states.count('no_data')} without "
+        f"data, {states.count('failed')} failed"
+    )
+    return final_status
@@ -0,0 +1,192 @@
+import json
+import os
+
+import pandas as pd
+
+from aggregate_cube import fill_rated_games, read_cube
+from games_storage import read_games
+from rating_series import OHLC_COLUMNS, read_rating_series
+
+SNAPSHOT_SUFFIX = "_snapshot.json"
+SNAPSHOT_OPENINGS = 20  # the most openings the dashboard slider can show
+SNAPSHOT_TIME_CLASSES = ["blitz", "bullet", "rapid"]  # the dashboard choices
+
+
+def snapshot_filepath(output_dir: str, username: str):
+    """
+    It builds the path of the dashboard snapshot of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the snapshot file.
+    """
+    return os.path.join(output_dir, username, f"{username}{SNAPSHOT_SUFFIX}")
+
+
+def opening_counts(openings: pd.Series):
+    """
+    It counts the games of each opening, from the most played to the
+    least played, and by name for the same number of games, so the
+    order does not depend on the categories of the column.
+
+    Args:
+        openings (pd.Series): The opening of each game.
+
+    Returns:
+        pd.Series: The number of games of each opening played.
+    """
+    counts = openings.astype(str).value_counts()
+    return counts.sort_index().sort_values(ascending=False, kind="stable")
+
+
+def frame_to_lists(df: pd.DataFrame):
+    """
+    It converts a DataFrame to a dict of lists which JSON can write,
+    with the dates as ISO strings.
+    """
+    columns = {}
+    for column, values in df.items():
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        columns[column] = values.tolist()
+    return columns
+
+
+def write_snapshot(output_dir: str, username: str):
+    """
+    It writes the dashboard snapshot of a user: the number of games,
+    the first and last days, and the data of the widgets for the whole
+    history, which is the first view of the dashboard. It holds the
+    cube cells of the whole range, the rating points of each time class
+    as RatingSeries.select gives them, and the most played openings of
+    each time class. It is built from the cube and the rating series
+    just written, so the dashboard can draw its first charts from one
+    small JSON file, without reading any game.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str/None: The path of the snapshot, or None if the user has no
+        dated game.
+    """
+    filepath = snapshot_filepath(output_dir, username)
+    cube = read_cube(output_dir, username)
+    if cube is None or not len(cube.days):
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return None
+    first_day, last_day = cube.days[0], cube.days[-1]
+    series = read_rating_series(output_dir, username)
+    games = read_games(output_dir, username, ["time_class", "opening"])
+    snapshot = {
+        "games": len(cube),
+        "first_day": first_day.isoformat(),
+        "last_day": last_day.isoformat(),
+        "summary": frame_to_lists(cube.select(first_day, last_day)),
+        "ratings": {},
+        "openings": {},
+    }
+    for time_class in SNAPSHOT_TIME_CLASSES:
+        resolution, points = series.select(time_class, first_day, last_day)
+        snapshot["ratings"][time_class] = {
+            "resolution": resolution,
+            "points": frame_to_lists(points),
+        }
+        counts = opening_counts(
+            games.loc[games["time_class"] == time_class, "opening"]
+        ).head(SNAPSHOT_OPENINGS)
+        snapshot["openings"][time_class] = {
+            "names": counts.index.tolist(),
+            "games": counts.tolist(),
+        }
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_filepath, filepath)
+    return filepath
+
+
+class DashboardSnapshot:
+    """
+    The dashboard snapshot of a user, written by write_snapshot. It
+    answers the widgets of the first view of the dashboard, the whole
+    history, with the same data as the cube, the rating series and the
+    games would.
+
+    Args:
+        snapshot (dict): The content of the snapshot file.
+    """
+
+    def __init__(self, snapshot: dict):
+        self.games = snapshot["games"]
+        self.first_day = pd.Timestamp(snapshot["first_day"])
+        self.last_day = pd.Timestamp(snapshot["last_day"])
+        self.snapshot = snapshot
+
+    def covers(self, start, end):
+        """
+        It tells if a date range is the range of the snapshot.
+        """
+        return (pd.Timestamp(start), pd.Timestamp(end)) == (
+            self.first_day,
+            self.last_day,
+        )
+
+    def summary(self):
+        """
+        It gives the cube cells of the whole history, like
+        DailyCube.select.
+        """
+        return fill_rated_games(pd.DataFrame(self.snapshot["summary"]))
+
+    def rating_points(self, time_class: str):
+        """
+        It gives the rating points of a time class, like
+        RatingSeries.select over the whole history.
+
+        Returns:
+            tuple: The resolution and the points.
+        """
+        ratings = self.snapshot["ratings"].get(time_class)
+        if ratings is None:
+            return "raw", pd.DataFrame(columns=["date"] + OHLC_COLUMNS + ["games"])
+        points = pd.DataFrame(ratings["points"])
+        points["date"] = pd.to_datetime(points["date"])
+        return ratings["resolution"], points
+
+    def opening_counts(self, time_class: str):
+        """
+        It gives the number of games of the most played openings of a
+        time class, like opening_counts.
+        """
+        openings = self.snapshot["openings"].get(time_class, {})
+        return pd.Series(
+            openings.get("games", []),
+            index=openings.get("names", []),
+            dtype="int64",
+            name="count",
+        )
+
+
+def read_snapshot(output_dir: str, username: str):
+    """
+    It reads the dashboard snapshot of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        DashboardSnapshot/None: The snapshot, or None if the user has
+        none or if it cannot be read.
+    """
+    try:
+        with open(snapshot_filepath(output_dir, username), encoding="utf-8") as f:
+            return DashboardSnapshot(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,550 @@
+import os
+import queue
+import shlex
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+import chess.engine
+import chess.polyglot
+import numpy as np
+import pandas as pd
+
+from games_storage import read_games, write_data_version
+from games_storage import analysis_dirpath as games_analysis_dirpath
+from metrics import count, span
+from pgn_parser import TRANSFORMED_DATA_DIR, MoveStore, move_store_dir
+
+EVALUATION_CACHE_FILE = "data/evaluations.sqlite"
+DEFAULT_DEPTH = 12
+DEFAULT_BATCH_GAMES = 500
+POSITIONS_PER_TASK = 32  # positions sent to an engine at a time
+SQL_VARIABLES = 500  # positions looked up per query
+MATE_SCORE = 10_000  # centipawns of a mate, from python-chess
+BLUNDER_DROP = 15  # win percentage lost by a blunder, 0.3 winning chances
+REPLAY_CACHE_SIZE = 2_000_000  # positions kept in memory by GameReplayer
+ANALYSIS_TYPES = {
+    "game_id": np.int64,
+    "white_accuracy": np.float32,
+    "black_accuracy": np.float32,
+    "white_blunders": np.int16,
+    "black_blunders": np.int16,
+    "replayed": bool,  # False for a game the replayer cannot play
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    position INTEGER PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score INTEGER NOT NULL
+);
+"""
+
+
+def position_key(board: chess.Board):
+    """
+    It gives the key of a position in the evaluation cache: its
+    Polyglot Zobrist hash, which only depends on the pieces, the side
+    to move, the castling rights and the en passant square, so the
+    same position reached by different move orders has the same key.
+    The hash is stored as a signed 64-bit SQLite integer.
+    """
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def connect(cache_path: str = EVALUATION_CACHE_FILE):
+    """
+    It opens the evaluation cache, a SQLite database shared by all the
+    players, and creates its table if needed.
+
+    Args:
+        cache_path (str): The SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The connection to the cache.
+    """
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    connection = sqlite3.connect(cache_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def read_evaluations(connection: sqlite3.Connection, keys: list, depth: int):
+    """
+    It reads the cached scores of positions evaluated at `depth` or
+    deeper.
+
+    Args:
+        connection (sqlite3.Connection): The evaluation cache.
+        keys (list): The position keys.
+        depth (int): The minimum depth.
+
+    Returns:
+        dict: The score of each position found, in centipawns from
+        white's side.
+    """
+    scores = {}
+    for start in range(0, len(keys), SQL_VARIABLES):
+        part = keys[start : start + SQL_VARIABLES]
+        scores.update(
+            connection.execute(
+                "SELECT position, score FROM evaluations "
+                f"WHERE position IN ({', '.join('?' * len(part))}) AND depth >= ?",
+                (*part, depth),
+            ).fetchall()
+        )
+    return scores
+
+
+def write_evaluations(connection: sqlite3.Connection, scores: dict, depth: int):
+    """
+    It saves scores in the cache. A position already evaluated deeper
+    keeps its score.
+
+    Args:
+        connection (sqlite3.Connection): The evaluation cache.
+        scores (dict): The score of each position key.
+        depth (int): The depth of the scores.
+    """
+    with connection:
+        connection.executemany(
+            "INSERT INTO evaluations (position, depth, score) VALUES (?, ?, ?) "
+            "ON CONFLICT (position) DO UPDATE SET "
+            "depth = excluded.depth, score = excluded.score "
+            "WHERE excluded.depth > evaluations.depth",
+            [(key, depth, score) for key, score in scores.items()],
+        )
+
+
+class EnginePool:
+    """
+    A pool of UCI engine processes, like Stockfish or any binary which
+    speaks UCI. Each engine runs in its own process with one search
+    thread, and the positions are sent to the engines by a pool of
+    threads, one per engine, which only wait for the answers.
+
+    Args:
+        command (str): The command line of the engine.
+        workers (int): The number of engine processes. Defaults to the
+        number of CPUs.
+        depth (int): The search depth of each position.
+    """
+
+    def __init__(self, command: str, workers: int = None, depth: int = DEFAULT_DEPTH):
+        self.depth = depth
+        self.workers = workers or os.cpu_count() or 1
+        self.engines = queue.Queue()
+        try:
+            for _ in range(self.workers):
+                engine = chess.engine.SimpleEngine.popen_uci(shlex.split(command))
+                self.engines.put(engine)
+                if "Threads" in engine.options:
+                    engine.configure({"Threads": 1})
+        except Exception:
+            self.close()
+            raise
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, "executor", None):
+            self.executor.shutdown()
+        while not self.engines.empty():
+            self.engines.get().quit()
+
+    def evaluate_task(self, fens: list):
+        engine = self.engines.get()
+        try:
+            scores = []
+            for fen in fens:
+                info = engine.analyse(
+                    chess.Board(fen), chess.engine.Limit(depth=self.depth)
+                )
+                score = info.get("score")
+                scores.append(
+                    score.white().score(mate_score=MATE_SCORE) if score else 0
+                )
+            return scores
+        finally:
+            self.engines.put(engine)
+
+    def evaluate(self, fens: list):
+        """
+        It evaluates positions with all the engines at once.
+
+        Args:
+            fens (list): The FEN of each position.
+
+        Returns:
+            list: The score of each position, in centipawns from
+            white's side, mates being +/- MATE_SCORE.
+        """
+        tasks = [
+            fens[start : start + POSITIONS_PER_TASK]
+            for start in range(0, len(fens), POSITIONS_PER_TASK)
+        ]
+        return [
+            score
+            for scores in self.executor.map(self.evaluate_task, tasks)
+            for score in scores
+        ]
+
+
+def terminal_score(board: chess.Board):
+    """
+    It gives the score of a position without legal moves, which is not
+    sent to the engines: a mate or a stalemate.
+
+    Returns:
+        int/None: The score from white's side, or None if the side to
+        move has a legal move.
+    """
+    if any(board.generate_legal_moves()):
+        return None
+    if not board.is_check():
+        return 0
+    return -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+
+
+class GameReplayer:
+    """
+    It replays games and gives the key of every position. The moves
+    played from each position are remembered, so the prefix shared by
+    many games, like an opening line, is only replayed on a board once:
+    the next games follow it with dictionary lookups, and the board is
+    only built again, from the FEN of the position, where a game leaves
+    the known moves. The memory is bounded by clearing everything after
+    `max_positions` positions.
+
+    Args:
+        vocabulary (list): The SAN move of each move id of the move store.
+        max_positions (int): The number of positions kept in memory.
+    """
+
+    def __init__(self, vocabulary: list, max_positions: int = REPLAY_CACHE_SIZE):
+        self.vocabulary = vocabulary
+        self.max_positions = max_positions
+        self.clear()
+
+    def clear(self):
+        board = chess.Board()
+        self.start = position_key(board)
+        self.fens = {self.start: board.fen()}  # key -> FEN of the position
+        self.children = {}  # (key, move id) -> key of the next position
+        self.terminal = {}  # key -> score of a position without legal move
+
+    def positions(self, moves):
+        """
+        It replays a game from the standard initial position.
+
+        Args:
+            moves (np.ndarray): The move ids of the game.
+
+        Returns:
+            list: The keys of the positions, from the initial position to
+            the position after the last move.
+
+        Raises:
+            ValueError: If a move is not legal, like in Chess960 games.
+        """
+        if len(self.fens) > self.max_positions:
+            self.clear()
+        key, board = self.start, None
+        keys = [key]
+        for move in moves.tolist():
+            child = self.children.get((key, move))
+            if child is None:
+                if board is None:
+                    board = chess.Board(self.fens[key])
+                board.push_san(self.vocabulary[move])
+                child = position_key(board)
+                self.children[(key, move)] = child
+                if child not in self.fens:
+                    self.fens[child] = board.fen()
+            else:
+                board = None  # the board is built again at the next new move
+            key = child
+            keys.append(key)
+        if key not in self.terminal:
+            if board is None:
+                board = chess.Board(self.fens[key])
+            self.terminal[key] = terminal_score(board)
+        return keys
+
+
+def win_percentage(scores: np.ndarray):
+    """
+    It converts centipawn scores to the chances of winning, in percent,
+    with the curve Lichess fitted on the results of its games.
+    """
+    return 50 + 50 * (2 / (1 + np.exp(-0.00368208 * scores)) - 1)
+
+
+def game_accuracy(scores: np.ndarray):
+    """
+    It computes the accuracy and the blunders of both players from the
+    scores of the positions of a game. The win percentage lost by each
+    move gives its accuracy (the Lichess formula), the accuracy of a
+    player is the mean of the accuracies of its moves, and a move losing
+    at least BLUNDER_DROP percent is a blunder.
+
+    Args:
+        scores (np.ndarray): The score of each position of the game,
+        from white's side, the initial position first.
+
+    Returns:
+        dict: The accuracy and the number of blunders of each color.
+        The accuracy is NaN for a color without move.
+    """
+    wins = win_percentage(np.clip(scores, -MATE_SCORE, MATE_SCORE))
+    drops = wins[:-1] - wins[1:]
+    drops[1::2] *= -1  # the moves of black lose white's win percentage
+    drops = np.maximum(drops, 0)
+    accuracies = np.clip(103.1668 * np.exp(-0.04354 * drops) - 3.1669, 0, 100)
+    analysis = {}
+    for color, side in [("white", slice(0, None, 2)), ("black", slice(1, None, 2))]:
+        moves = accuracies[side]
+        analysis[f"{color}_accuracy"] = moves.mean() if len(moves) else np.nan
+        analysis[f"{color}_blunders"] = int((drops[side] >= BLUNDER_DROP).sum())
+    return analysis
+
+
+def analysis_dirpath(username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+    """
+    It builds the path of the engine analysis of a user, a directory
+    with one Parquet file per analysed batch of games.
+    """
+    return games_analysis_dirpath(output_dir, username)
+
+
+def read_analysis(username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+    """
+    It reads the engine analysis of a user.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+
+    Returns:
+        pd.DataFrame/None: The game_id, the accuracy and the blunders
+        of each color, whether the game could be replayed and the depth
+        of each analysed game, or None if no game was analysed. The
+        accuracy of a color without move is NaN.
+    """
+    analysis_dir = analysis_dirpath(username, output_dir)
+    if not os.path.isdir(analysis_dir):
+        return None
+    files = sorted(f for f in os.listdir(analysis_dir) if f.endswith(".parquet"))
+    if not files:
+        return None
+    return pd.concat(
+        [pd.read_parquet(os.path.join(analysis_dir, f)) for f in files],
+        ignore_index=True,
+    )
+
+
+def games_to_analyse(username: str, output_dir: str, store: MoveStore):
+    """
+    It finds the games without Chess.com accuracies which are not
+    analysed yet. A game is analysed once it has a row in the analysis,
+    even if a color has no accuracy (a game of one move) or the game
+    could not be replayed, so it is never selected again.
+
+    Returns:
+        dict: The index in the move store of each game_id to analyse,
+        in the order of the store.
+    """
+    games = read_games(
+        output_dir, username, ["game_id", "white_accuracy", "black_accuracy"]
+    )
+    if games is None:
+        return {}
+    missing = games.loc[
+        games["white_accuracy"].isna() | games["black_accuracy"].isna(), "game_id"
+    ]
+    analysis = read_analysis(username, output_dir)
+    if analysis is not None:
+        missing = missing[~missing.isin(analysis["game_id"])]
+    missing = set(missing.tolist())
+    return {
+        game_id: index
+        for index, game_id in enumerate(store.game_ids.tolist())
+        if game_id in missing
+    }
+
+
+def analyse_batch(
+    store: MoveStore,
+    indexes: dict,
+    replayer: GameReplayer,
+    pool: EnginePool,
+    connection: sqlite3.Connection,
+):
+    """
+    It analyses a batch of games: the games are replayed by the
+    replayer, the distinct positions of the batch are looked up in the
+    cache and only the missing ones are sent to the engines.
+
+    Returns:
+        tuple: The analysis of the games, the number of positions of
+        the games, and the numbers of distinct positions found in the
+        cache and evaluated by the engines. The games which cannot be
+        replayed (like Chess960 games) have a row with replayed set to
+        False and no accuracy.
+    """
+    games, known, skipped = [], {}, []
+    for game_id, index in indexes.items():
+        try:
+            keys = replayer.positions(store.game_moves(index))
+        except ValueError as e:
+            print(f"Analysis: game {game_id} is not replayed, {e}")
+            count("analysis_errors")
+            skipped.append({"game_id": game_id, "replayed": False})
+            continue
+        if replayer.terminal[keys[-1]] is not None:
+            known[keys[-1]] = replayer.terminal[keys[-1]]
+        games.append((game_id, keys))
+    distinct = list({key for _, keys in games for key in keys} - set(known))
+    cached = read_evaluations(connection, distinct, pool.depth)
+    missing = [key for key in distinct if key not in cached]
+    evaluated = dict(
+        zip(missing, pool.evaluate([replayer.fens[key] for key in missing]))
+    )
+    write_evaluations(connection, evaluated, pool.depth)
+    scores = {**cached, **evaluated, **known}
+    rows = [
+        {
+            "game_id": game_id,
+            **game_accuracy(np.array([scores[key] for key in keys], dtype=np.float64)),
+            "replayed": True,
+        }
+        for game_id, keys in games
+    ]
+    analysis = pd.DataFrame(rows + skipped, columns=list(ANALYSIS_TYPES))
+    analysis = analysis.fillna({"white_blunders": 0, "black_blunders": 0})
+    analysis = analysis.astype(ANALYSIS_TYPES)
+    analysis["depth"] = np.int16(pool.depth)
+    positions = sum(len(keys) for _, keys in games)
+    return analysis, positions, len(cached), len(evaluated)
+
+
+def analyse_games(
+    username: str,
+    engine_command: str,
+    depth: int = DEFAULT_DEPTH,
+    workers: int = None,
+    batch_games: int = DEFAULT_BATCH_GAMES,
+    output_dir: str = TRANSFORMED_DATA_DIR,
+    cache_path: str = EVALUATION_CACHE_FILE,
+):
+    """
+    It computes the accuracy and the blunders of both players for the
+    games of a user without Chess.com accuracies. The games are
+    replayed from the move store and their positions are evaluated by
+    a pool of UCI engine processes (EnginePool). The scores are kept in
+    a cache shared by all the players, keyed by the Zobrist hash of the
+    position, so the opening positions shared by thousands of games
+    are evaluated once.
+
+    The games are analysed by batches of `batch_games`. The scores of a
+    batch are saved in the cache and its analysis in its own Parquet
+    file before the next batch starts, so an interrupted run resumes
+    with the games not analysed yet. The positions per second of each
+    batch are printed and counted in the metrics of the run. When
+    batches were saved, the data version stamp is incremented, so the
+    dashboard reloads the games with their new accuracies.
+
+    Args:
+        username (str): The chess.com username of the player.
+        engine_command (str): The command line of the UCI engine, like
+        "stockfish".
+        depth (int): The search depth of each position.
+        workers (int): The number of engine processes. Defaults to the
+        number of CPUs.
+        batch_games (int): The number of games of a batch.
+        output_dir (str): The directory of the transformed data.
+        cache_path (str): The SQLite evaluation cache.
+
+    Returns:
+        int: The number of games analysed by this run.
+    """
+    if not os.path.exists(
+        os.path.join(move_store_dir(username, output_dir), "game_id.npy")
+    ):
+        print(f"Analysis: no move store for {username}")
+        return 0
+    store = MoveStore(username, output_dir)
+    indexes = games_to_analyse(username, output_dir, store)
+    if not indexes:
+        print(f"Analysis: every game of {username} is analysed")
+        return 0
+    analysis_dir = analysis_dirpath(username, output_dir)
+    os.makedirs(analysis_dir, exist_ok=True)
+    number_batch = len([f for f in os.listdir(analysis_dir) if f.endswith(".parquet")])
+    game_ids = list(indexes)
+    batches = [
+        game_ids[start : start + batch_games]
+        for start in range(0, len(game_ids), batch_games)
+    ]
+    print(f"Analysis: {len(game_ids)} games of {username} in {len(batches)} batches")
+    connection = connect(cache_path)
+    total_positions, total_evaluated, start = 0, 0, time.perf_counter()
+    saved_batches = 0
+    try:
+        replayer = GameReplayer(store.vocabulary)
+        with EnginePool(engine_command, workers, depth) as pool:
+            for i, batch in enumerate(batches):
+                batch_start = time.perf_counter()
+                with span("analyse_batch"):
+                    analysis, positions, cached, evaluated = analyse_batch(
+                        store,
+                        {game_id: indexes[game_id] for game_id in batch},
+                        replayer,
+                        pool,
+                        connection,
+                    )
+                    if not analysis.empty:
+                        filepath = os.path.join(
+                            analysis_dir,
+                            f"batch-{number_batch + saved_batches:05d}.parquet",
+                        )
+                        analysis.to_parquet(f"{filepath}.tmp", index=False)
+                        os.replace(f"{filepath}.tmp", filepath)
+                        saved_batches += 1
+                seconds = time.perf_counter() - batch_start
+                count("games", len(batch), stage="analysis")
+                count("positions", cached, source="cache")
+                count("positions", evaluated, source="engine")
+                total_positions += positions
+                total_evaluated += evaluated
+                print(
+                    f"Analysis: batch {i + 1}/{len(batches)}, {len(batch)} games, "
+                    f"{positions} positions, {cached} cached, {evaluated} evaluated, "
+                    f"{positions / seconds:,.0f} positions/s"
+                )
+    finally:
+        connection.close()
+        if saved_batches:  # even when a later batch failed
+            write_data_version(output_dir, username)
+    seconds = time.perf_counter() - start
+    print(
+        f"Analysis saved: {analysis_dir}, {len(game_ids)} games, "
+        f"{total_positions} positions at {total_positions / seconds:,.0f} "
+        f"positions/s, {total_evaluated} evaluated by the engines"
+    )
+    return len(game_ids)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit('usage: python etl/engine_analysis.py USERNAME "ENGINE COMMAND"')
+    analyse_games(username=sys.argv[1], engine_command=sys.argv[2])
@@ -1,44 +1,138 @@
 import requests
-import json
 import time
 import os
+import random
 import shutil
+import sqlite3
+import sys
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 
+from http_session import ValidatorStore, get_session
+from rate_limiter import TokenBucket
+from game_store import index_filename, migrate_to_game_store, store_games
+from metrics import count, timed
+from raw_archives import migrate_json_archives
+
+JSON_DATA_DIR = "data/json"
+API_URL = "https://api.chess.com/pub"  # overridden by benchmarks/fake_chess_api.py
 USER_AGENT = "Mozilla/5.0 (compatible; Chess_Analyse/1.0; +https://chess.com)"
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 3.0
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+NOT_MODIFIED = object()  # returned by make_request for a 304 answer
+
+
+def retry_delay(response, attempt: int):
+    """
+    It computes how long to wait before retrying a request. The
+    Retry-After header is used when the server sends one, otherwise an
+    exponential backoff with jitter is used.
+
+    Args:
+        response (requests.Response): The 429 or 5xx response.
+        attempt (int): The number of attempts already done for the URL.
+
+    Returns:
+        tuple: The delay in seconds and the Retry-After value (or None).
+    """
+    retry_after = response.headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after) if retry_after else None
+    except ValueError:  # Retry-After can also be an HTTP date
+        retry_after = None
+    delay = retry_after or (2**attempt + random.uniform(0, 1))
+    return delay, retry_after
 
 
-def make_request(url: str):
+@timed("make_request")
+def make_request(
+    url: str, rate_limiter: TokenBucket = None, validators: ValidatorStore = None
+):
     """
     It makes an HTTP GET request to Chess.com API. This function try to
     retrieve data from URL using the requests library. This includes a
     custom user-agent header to identify the application.
 
+    When a rate limiter is given, a token is taken before each attempt.
+    HTTP 429 and 5xx answers are retried up to MAX_RETRIES times with
+    an exponential backoff, and they slow down the shared rate limiter
+    so that the other threads back off too.
+
+    All the requests go through the shared keep-alive session. When a
+    validator store is given, the request is conditional: the known
+    ETag and Last-Modified of the URL are sent back and a 304 answer
+    returns NOT_MODIFIED instead of downloading the content again.
+
+    The status codes, the downloaded bytes and the retries are counted
+    in the metrics of the run.
+
     Args:
         url (str): The GET request uses this URL.
+        rate_limiter (TokenBucket): The rate limiter shared by all the
+        threads doing requests.
+        validators (ValidatorStore): The store of ETag/Last-Modified
+        used to make a conditional request.
     Returns:
         dict/None: If the request went successfully, the JSON content
-        of the response is returned. If not, None is returned.
+        of the response is returned. If the content did not change
+        since the last request, NOT_MODIFIED is returned. If not, None
+        is returned.
     """
-    try:
-        response = requests.get(url, headers={"User-Agent": USER_AGENT})
-        return response.json()
-    except requests.exceptions.RequestException as err:
-        print(f"Extraction: Error request with {url} which is {err}")
-        return None
+    headers = {"User-Agent": USER_AGENT}
+    if validators:
+        headers.update(validators.conditional_headers(url))
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            response = get_session().get(url, headers=headers)
+            count("http_responses", status=response.status_code)
+            count("bytes_downloaded", len(response.content))
+            if response.status_code in RETRY_STATUS_CODES:
+                delay, retry_after = retry_delay(response, attempt)
+                if rate_limiter:
+                    rate_limiter.penalize(retry_after)
+                if attempt == MAX_RETRIES:
+                    print(f"Extraction: HTTP {response.status_code} with {url}")
+                    return None
+                print(
+                    f"Extraction: HTTP {response.status_code} with {url}, "
+                    f"retry in {delay:.1f}s"
+                )
+                count("http_retries")
+                time.sleep(delay)
+                continue
+            if rate_limiter:
+                rate_limiter.reward()
+            if response.status_code == 304:
+                return NOT_MODIFIED
+            data = response.json()
+            if validators and response.status_code == 200:
+                validators.update(url, response.headers)
+            return data
+        except requests.exceptions.RequestException as err:
+            count("http_errors", error=type(err).__name__)
+            print(f"Extraction: Error request with {url} which is {err}")
+            return None
+    return None
 
 
-def get_chess_data(username: str):
+def get_chess_data(username: str, rate_limiter: TokenBucket = None):
     """
     Retrieves the archive URLs for a Chess.com player.
 
     Args:
         username (str): The chess.com username of the player
+        rate_limiter (TokenBucket): The rate limiter used for the request.
 
     Returns:
         list: A list of archive player's game
     """
-    url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    data = make_request(url)
+    url = f"{API_URL}/player/{username}/games/archives"
+    data = make_request(url, rate_limiter)
     if (
         data and "archives" in data
     ):  # we check if data is not empty and archives key is in data
@@ -46,62 +140,147 @@ def get_chess_data(username: str):
     return []
 
 
-def save_games_to_json(games_data: list, filepath: str):
+@timed("store_archive_games")
+def store_archive_games(games_data: list, filepath: str):
     """
-    It saves list of games to JSON file. This function creates the user
-    directory in data/json and saves provided games list into JSON file.
+    It stores the games of a monthly archive in the shared game store
+    (game_store.sqlite) and writes the index of the month of the
+    player. The games already stored from the archive of another
+    player, the games between two tracked players, are not stored
+    again. An error is printed instead of raised.
 
     Args:
-            username (str): The Chess.com username of the player.
-            month (int): The month of the games.
-            year (int): The year of the games.
             games_data (list): A list of dictionaries, where each dictionary represents a game.
-
-    Raises:
-        IOError: If an error occurs during file saving.
-
+            filepath (str): The ".index.npz" file of the month.
     """
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(games_data, f, ensure_ascii=False, indent=4)
-    except IOError as err:
+        store_games(games_data, filepath)
+        count("games", len(games_data), stage="save")
+    except (IOError, sqlite3.Error) as err:
         print(f"Error {err} during saving file: {filepath}")
 
 
-def download_monthly_games(archive_url: str):
+@timed("download_monthly_games")
+def download_monthly_games(
+    archive_url: str,
+    rate_limiter: TokenBucket = None,
+    validators: ValidatorStore = None,
+    filepath: str = None,
+):
     """
-    Downloads all games from a specific monthly archive URL.
+    Downloads all games from a specific monthly archive URL. When a
+    file path is given, the games are saved to the game store with
+    this index file.
 
     Args:
         archive_url (str): The URL of the monthly game archive.
+        rate_limiter (TokenBucket): The rate limiter used for the request.
+        validators (ValidatorStore): If given, the archive is only
+        downloaded when it changed since the last download.
+        filepath (str): The ".index.npz" file where the games are saved.
 
     Returns:
-        list: A list of dictionaries representing the games. Returns
-        an empty list if the request fails or no games are found.
+        list/None: A list of dictionaries representing the games.
+        Returns an empty list if no games are found, and None if the
+        archive did not change.
+
+    Raises:
+        IOError: If the request failed.
     """
     print(f"Downloading games from: {archive_url}")
-    data = make_request(archive_url)
-    if data and "games" in data:
+    data = make_request(archive_url, rate_limiter, validators)
+    if data is NOT_MODIFIED:
+        return None
+    if data is None:
+        raise IOError(f"the request of {archive_url} failed")
+    if "games" in data:
+        count("games", len(data["games"]), stage="download")
+        if filepath and data["games"]:
+            store_archive_games(data["games"], filepath)
         return data["games"]
     return []
 
 
-def extract_chess_player_data(username: str):
+def download_and_save_archive(
+    archive_url: str,
+    filepath: str,
+    rate_limiter: TokenBucket = None,
+    validators: ValidatorStore = None,
+):
     """
-    Extracts and downloads all game data for a Chess.com player. This
-    function orchestrates the data extraction process. It first gets
-    the list of monthly archives, then iterates through each archive
-    URL to download the games and save them to JSON files. It includes
-    a time delay between requests to comply with API usage policies.
+    It downloads one monthly archive and saves it to its raw file.
+    This is the unit of work run by the threads of the downloader. If
+    the file already exists, the request is conditional and the file
+    is kept as it is when the archive did not change.
+
+    Args:
+        archive_url (str): The URL of the monthly game archive.
+        filepath (str): The ".index.npz" file where the games are saved.
+        rate_limiter (TokenBucket): The rate limiter shared by the threads.
+        validators (ValidatorStore): The store of ETag/Last-Modified.
+
+    Returns:
+        int/None: The number of downloaded games, or None if the
+        archive did not change.
+
+    Raises:
+        IOError: If the request failed.
+    """
+    if validators and not os.path.exists(filepath):
+        validators.forget(archive_url)  # a 304 would leave us without the file
+    games = download_monthly_games(archive_url, rate_limiter, validators, filepath)
+    if games is None:
+        os.utime(filepath)  # the file is up to date at this time
+        return None
+    return len(games)
+
+
+def archive_may_have_changed(filepath: str, year: int, month: int):
+    """
+    It tells if a saved monthly archive can be outdated. An archive
+    only gets new games until the end of its month, so a file written
+    after the end of the month is final, while a file written during
+    the month (the current month, or the last day of the previous one)
+    has to be checked again.
+
+    Args:
+        filepath (str): The raw file of the monthly archive.
+        year (int): The year of the archive.
+        month (int): The month of the archive.
+
+    Returns:
+        bool: True if the archive has to be requested again.
+    """
+    end_of_month = datetime(
+        year, month, monthrange(year, month)[1], 23, 59, 59, tzinfo=timezone.utc
+    )
+    return os.path.getmtime(filepath) <= end_of_month.timestamp()
+
+
+def plan_archive_downloads(
+    username: str, rate_limiter: TokenBucket = None, json_dir: str = JSON_DATA_DIR
+):
+    """
+    It lists the monthly archives of a player that have to be
+    downloaded. The list of archives is requested from the API, then
+    the months already saved are left out, except the ones saved
+    before the end of their month, which may have changed since.
 
     Args:
         username (str): The chess.com username of the player
+        rate_limiter (TokenBucket): The rate limiter used for the request.
+        json_dir (str): The directory of the raw data.
+
+    Returns:
+        list/None: The (archive_url, filepath) pairs to download, or
+        None if the player has no archive.
     """
-    print(f"=>Start of the extraction data of {username}")
-    user_json_dir = os.path.join("data/json", username)
+    user_json_dir = os.path.join(json_dir, username)
     os.makedirs(user_json_dir, exist_ok=True)  # we create the user folder in data/json
+    migrate_json_archives(user_json_dir)  # old indented .json files
+    migrate_to_game_store(user_json_dir, username)  # .jsonl.gz files
     downloaded_files = set(os.listdir(user_json_dir))
-    archives = get_chess_data(username)
+    archives = get_chess_data(username, rate_limiter)
     if not archives:
         print(f"No data found with {username}, play chess then")
         try:
@@ -111,25 +290,123 @@ def extract_chess_player_data(username: str):
             print(f"The folder '{user_json_dir}' does not exist.")
         except OSError as e:
             print(f"Error: {e.strerror}")
-        return 0
-    total_games_downloaded = 0
-    for i, archive_url in enumerate(archives):
+        return None
+    pending_archives = []
+    for archive_url in archives:
         parts = archive_url.split("/")
         year = int(parts[-2])
         month = int(parts[-1])
-        filename = f"{username}_{year}_{month}.json"
+        filename = index_filename(username, year, month)
         filepath = os.path.join(user_json_dir, filename)
-        if filename in downloaded_files:
+        if filename in downloaded_files and not archive_may_have_changed(
+            filepath, year, month
+        ):
             print(f"{filename} already exists.")
             continue  # We skip to the next archive
-        games = download_monthly_games(archive_url)
-        if games:
-            save_games_to_json(games, filepath)
-            total_games_downloaded += len(games)
-        time.sleep(1)
+        pending_archives.append((archive_url, filepath))
+    return pending_archives
+
+
+def report_archive_progress(done: int, total: int, filepath: str, future):
+    """
+    It prints the result of one archive download.
+
+    Args:
+        done (int): The number of archives finished so far.
+        total (int): The number of archives to download.
+        filepath (str): The raw file of the archive.
+        future (Future): The finished download.
+
+    Returns:
+        int: The number of downloaded games, 0 if the download failed
+        or the archive did not change.
+    """
+    filename = os.path.basename(filepath)
+    try:
+        number_games = future.result()
+    except Exception as e:
+        print(f"[{done}/{total}] {filename}: error {e}")
+        return 0
+    if number_games is None:
+        print(f"[{done}/{total}] {filename}: not modified")
+        return 0
+    print(f"[{done}/{total}] {filename}: {number_games} games")
+    return number_games
+
+
+def extract_chess_player_data(
+    username: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    rate_limiter: TokenBucket = None,
+    validators: ValidatorStore = None,
+):
+    """
+    Extracts and downloads all game data for a Chess.com player. This
+    function orchestrates the data extraction process. It first gets
+    the list of archives to download with plan_archive_downloads, then
+    downloads them concurrently with a pool of threads and saves them
+    to the game store shared by all the players, with an index of the
+    games of each month in the directory of the player.
+    All the requests go through a shared token bucket, so the API is
+    never called more than `requests_per_second` times per second, and
+    the rate is lowered automatically when the API answers with HTTP
+    429 or 5xx.
+
+    Months already saved are skipped, except the ones saved before the
+    end of their month: they are requested again with the ETag and
+    Last-Modified of the last download, so they are only downloaded
+    again when the API says they changed.
+
+    Args:
+        username (str): The chess.com username of the player
+        max_workers (int): The maximum number of archives downloaded at
+        the same time.
+        requests_per_second (float): The maximum number of requests per
+        second sent to the API.
+        rate_limiter (TokenBucket): An existing rate limiter to share
+        with other extractions. If None, a new one is created with
+        `requests_per_second`.
+        validators (ValidatorStore): An existing validator store to
+        share with other extractions. If None, the store saved in
+        data/json is used.
+
+    Returns:
+        int: The number of downloaded games.
+    """
+    print(f"=>Start of the extraction data of {username}")
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(requests_per_second)
+    save_validators = validators is None
+    if validators is None:
+        validators = ValidatorStore()
+    pending_archives = plan_archive_downloads(username, rate_limiter)
+    if pending_archives is None:
+        return 0
+    total_games_downloaded = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(
+                download_and_save_archive,
+                archive_url,
+                filepath,
+                rate_limiter,
+                validators,
+            ): filepath
+            for archive_url, filepath in pending_archives
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            total_games_downloaded += report_archive_progress(
+                done, len(futures), futures[future], future
+            )
+    if save_validators:
+        validators.save()
     print(f"=>Extraction done. {total_games_downloaded} games for {username}")
+    return total_games_downloaded
 
 
 if __name__ == "__main__":
-    username_input = input("Which username do you want to extract data of? ")
-    extract_chess_player_data(username_input)
+    if len(sys.argv) < 2:
+        sys.exit("usage: python etl/extract_chess_data.py USERNAME...")
+    for username_input in sys.argv[1:]:
+        extract_chess_player_data(username_input)
@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from raw_archives import INDEX_SUFFIX, RAW_SUFFIX, iter_games
+
+STORE_FILENAME = "game_store.sqlite"
+CODEC = pa.Codec("zstd", compression_level=9)
+BLOCK_SIZE = 1 << 20  # bytes of JSON lines of a chunk decoded per batch
+INDEX_COLUMNS = ["game_id", "is_white", "chunk_id", "line"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id INTEGER PRIMARY KEY,
+    games BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    transformed BLOB
+);
+CREATE TABLE IF NOT EXISTS games (
+    game_id INTEGER PRIMARY KEY,
+    chunk_id INTEGER NOT NULL,
+    line INTEGER NOT NULL
+);
+"""
+
+
+def index_filename(username: str, year: int, month: int):
+    """
+    It builds the name of the index file of a monthly archive.
+
+    Args:
+        username (str): The chess.com username of the player.
+        year (int): The year of the games.
+        month (int): The month of the games.
+
+    Returns:
+        str: The file name, for example "hikaru_2024_5.index.npz".
+    """
+    return f"{username}_{year}_{month}{INDEX_SUFFIX}"
+
+
+def store_path(index_path: str):
+    """
+    It gives the game store shared by all the players, which is in the
+    raw data directory, next to the directories of the users.
+
+    Args:
+        index_path (str): An index file, in the directory of its user.
+
+    Returns:
+        str: The path of the SQLite game store.
+    """
+    raw_dir = os.path.dirname(os.path.dirname(os.path.abspath(index_path)))
+    return os.path.join(raw_dir, STORE_FILENAME)
+
+
+def game_id_of(game: dict):
+    """
+    It gives the id of a raw game, the last part of its URL, like the
+    game_id column of the transformed games.
+    """
+    return int(game["url"].split("/")[-1])
+
+
+def connect(database_path: str):
+    """
+    It opens the game store and creates its tables if needed. The store
+    is in WAL mode with a long timeout, so the extraction threads and
+    the transform processes of a batch can write to it together.
+
+    Args:
+        database_path (str): The SQLite game store.
+
+    Returns:
+        sqlite3.Connection: The connection, in autocommit mode.
+    """
+    connection = sqlite3.connect(database_path, timeout=60, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def write_index(index_path: str, index: dict):
+    """
+    It writes the index of a monthly archive: for each game, in the
+    order of the archive, its id, the side played by the user and where
+    it is in the store. It is a compressed NumPy file of a few bytes
+    per game, written next to its final path and then renamed.
+
+    Args:
+        index_path (str): The ".index.npz" file of the month.
+        index (dict): The INDEX_COLUMNS arrays.
+    """
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **index)
+    os.replace(tmp_path, index_path)
+
+
+def save_array(filepath: str, array: np.ndarray):
+    """
+    It writes a NumPy array next to its final path and then renames it,
+    so a reader that has the previous file memory-mapped keeps reading
+    it instead of a file truncated under its feet.
+
+    Args:
+        filepath (str): The ".npy" file of the array.
+        array (np.ndarray): The array to write.
+    """
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, filepath)
+
+
+def read_index(index_path: str):
+    """
+    It reads the index of a monthly archive.
+
+    Args:
+        index_path (str): The ".index.npz" file of the month.
+
+    Returns:
+        dict: The INDEX_COLUMNS arrays: game_id, is_white (True where
+        the user played white), chunk_id and line.
+    """
+    with np.load(index_path) as index:
+        return {column: index[column] for column in INDEX_COLUMNS}
+
+
+def store_games(games, index_path: str, username: str = None):
+    """
+    It saves the games of a monthly archive to the shared game store
+    and writes the index of the month for the user. Only the games
+    that are not in the store yet are saved: a game between two
+    tracked players is stored once, by whichever archive comes first.
+    The new games of the call are saved together as one chunk of JSON
+    Lines compressed with zstd, which is smaller than a gzip monthly
+    file and faster to decompress.
+
+    Args:
+        games (iterable): The games of the month, as dictionaries.
+        index_path (str): The ".index.npz" file of the month.
+        username (str): The chess.com username of the player. If None,
+        it is the name of the directory of the index file.
+
+    Returns:
+        tuple: The number of games of the month and the number of games
+        added to the store.
+    """
+    if username is None:
+        username = os.path.basename(os.path.dirname(os.path.abspath(index_path)))
+    username = username.lower()
+    lines, is_white = {}, []
+    for game in games:
+        game_id = game_id_of(game)
+        if game_id in lines:
+            continue
+        white = (game.get("white") or {}).get("username", "")
+        is_white.append(white.lower() == username)
+        lines[game_id] = json.dumps(game, ensure_ascii=False, separators=(",", ":"))
+    connection = connect(store_path(index_path))
+    try:
+        connection.execute("BEGIN IMMEDIATE")  # one writer decides what is new
+        locations = {
+            game_id: (chunk_id, line)
+            for game_id, chunk_id, line in connection.execute(
+                "SELECT game_id, chunk_id, line FROM games WHERE game_id IN "
+                "(SELECT value FROM json_each(?))",
+                (json.dumps(list(lines)),),
+            )
+        }
+        new_ids = [game_id for game_id in lines if game_id not in locations]
+        if new_ids:
+            chunk = "\n".join(lines[game_id] for game_id in new_ids).encode("utf-8")
+            chunk_id = connection.execute(
+                "INSERT INTO chunks (games, size) VALUES (?, ?)",
+                (CODEC.compress(chunk, asbytes=True), len(chunk)),
+            ).lastrowid
+            for line, game_id in enumerate(new_ids):
+                locations[game_id] = (chunk_id, line)
+            connection.executemany(
+                "INSERT INTO games (game_id, chunk_id, line) VALUES (?, ?, ?)",
+                [(game_id, *locations[game_id]) for game_id in new_ids],
+            )
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    write_index(
+        index_path,
+        {
+            "game_id": np.fromiter(lines, np.int64, len(lines)),
+            "is_white": np.array(is_white, bool),
+            "chunk_id": np.array([locations[i][0] for i in lines], np.int64),
+            "line": np.array([locations[i][1] for i in lines], np.int64),
+        },
+    )
+    return len(lines), len(new_ids)
+
+
+def iter_chunk(database_path: str, chunk_id: int, schema: pa.Schema):
+    """
+    It decodes the games of a chunk as Arrow record batches of about
+    BLOCK_SIZE bytes of JSON lines. The chunk is decompressed by a zstd
+    stream reader while its lines are parsed, so only its compressed
+    bytes and one block of lines are in memory, whatever the size of
+    the month.
+
+    Args:
+        database_path (str): The SQLite game store.
+        chunk_id (int): The chunk.
+        schema (pa.Schema): The fields to decode, like RAW_GAME_SCHEMA.
+
+    Returns:
+        iterator: The record batches, in the order of the lines.
+    """
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        (chunk,) = connection.execute(
+            "SELECT games FROM chunks WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+    finally:
+        connection.close()
+    return pa_json.open_json(
+        pa.CompressedInputStream(pa.BufferReader(chunk), CODEC.name),
+        read_options=pa_json.ReadOptions(block_size=BLOCK_SIZE),
+        parse_options=pa_json.ParseOptions(
+            explicit_schema=schema, unexpected_field_behavior="ignore"
+        ),
+    )
+
+
+def read_chunk(database_path: str, chunk_id: int, schema: pa.Schema):
+    """
+    It decodes all the games of a chunk into an Arrow table, one row
+    per line of the chunk (see iter_chunk).
+
+    Args:
+        database_path (str): The SQLite game store.
+        chunk_id (int): The chunk.
+        schema (pa.Schema): The fields to decode, like RAW_GAME_SCHEMA.
+
+    Returns:
+        pa.Table: The games of the chunk.
+    """
+    return iter_chunk(database_path, chunk_id, schema).read_all()
+
+
+def take_lines(chunks: dict, chunk_ids: np.ndarray, lines: np.ndarray):
+    """
+    It gathers rows of several chunks into one table.
+
+    Args:
+        chunks (dict): The table of each chunk, one row per line, with
+        the same schema. There is at least one chunk.
+        chunk_ids (np.ndarray): The chunk of each row to take.
+        lines (np.ndarray): The line of each row to take in its chunk.
+
+    Returns:
+        pa.Table: The rows, in the order of `chunk_ids` and `lines`.
+    """
+    keys = np.fromiter(chunks, np.int64, len(chunks))
+    sizes = np.fromiter((table.num_rows for table in chunks.values()), np.int64)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rows = offsets[np.searchsorted(keys, chunk_ids)] + lines
+    return pa.concat_tables(chunks.values()).take(pa.array(rows))
+
+
+def read_raw_games(index_path: str, schema: pa.Schema):
+    """
+    It reads the raw games of an index file from the store into an
+    Arrow table. Each chunk holding some of the games is decoded once.
+
+    Args:
+        index_path (str): The ".index.npz" file of the month.
+        schema (pa.Schema): The fields to decode, like RAW_GAME_SCHEMA.
+
+    Returns:
+        pa.Table: The games, in the order of the index.
+    """
+    index = read_index(index_path)
+    if not len(index["game_id"]):
+        return schema.empty_table()
+    database_path = store_path(index_path)
+    chunks = {
+        chunk_id: read_chunk(database_path, chunk_id, schema)
+        for chunk_id in np.unique(index["chunk_id"]).tolist()
+    }
+    return take_lines(chunks, index["chunk_id"], index["line"])
+
+
+def read_transformed_chunk(database_path: str, chunk_id: int):
+    """
+    It reads the transformed columns saved for a chunk by
+    write_transformed_chunk.
+
+    Args:
+        database_path (str): The SQLite game store.
+        chunk_id (int): The chunk.
+
+    Returns:
+        pa.Table/None: The columns, or None if they were not saved yet.
+    """
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        (transformed,) = connection.execute(
+            "SELECT transformed FROM chunks WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+    finally:
+        connection.close()
+    if transformed is None:
+        return None
+    return pq.read_table(pa.BufferReader(transformed))
+
+
+def write_transformed_chunk(database_path: str, chunk_id: int, table: pa.Table):
+    """
+    It saves the transformed columns of the games of a chunk which do
+    not depend on the player, as a small Parquet file, so the chunk is
+    decoded and transformed once for all the players of its games.
+
+    Args:
+        database_path (str): The SQLite game store.
+        chunk_id (int): The chunk.
+        table (pa.Table): The columns, one row per line of the chunk.
+    """
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="zstd")
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.execute(
+                "UPDATE chunks SET transformed = ? WHERE chunk_id = ?",
+                (sink.getvalue().to_pybytes(), chunk_id),
+            )
+    finally:
+        connection.close()
+
+
+def migrate_to_game_store(user_dir: str, username: str):
+    """
+    It moves the ".jsonl.gz" archives of a user to the shared game
+    store, replacing each of them with an index file. The modification
+    time of each file is kept, since it tells the extraction whether
+    the month was complete when it was saved.
+
+    Args:
+        user_dir (str): The raw data directory of the user.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        int: The number of migrated files.
+    """
+    if not os.path.isdir(user_dir):
+        return 0
+    migrated = 0
+    for file in os.listdir(user_dir):
+        filepath = os.path.join(user_dir, file)
+        if not file.endswith(RAW_SUFFIX) or not os.path.isfile(filepath):
+            continue
+        index_path = filepath[: -len(RAW_SUFFIX)] + INDEX_SUFFIX
+        try:
+            mtime = os.path.getmtime(filepath)
+            store_games(iter_games(filepath), index_path, username)
+            os.utime(index_path, (mtime, mtime))
+            os.remove(filepath)
+            migrated += 1
+        except (IOError, ValueError, sqlite3.Error) as err:
+            print(f"Error {err} during migration of file: {filepath}")
+    if migrated:
+        print(f"{migrated} archive(s) moved to the game store from {user_dir}")
+    return migrated
@@ -0,0 +1,296 @@
+import os
+import sqlite3
+
+import pandas as pd
+
+from games_storage import game_urls, set_column_types
+
+DATABASE_FILE = "data/games.sqlite"
+DATABASE_VERSION = 2  # the version of the schema, bumped when it changes
+GAME_COLUMNS = [
+    "game_url",
+    "game_id",
+    "date",
+    "rated",
+    "time_class",
+    "opening",
+    "white_accuracy",
+    "black_accuracy",
+    "player_color",
+    "player_rating",
+    "opponent_username",
+    "opponent_rating",
+    "player_result",
+]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    username TEXT NOT NULL,
+    game_id INTEGER NOT NULL,
+    game_url TEXT,
+    date TEXT,
+    rated INTEGER,
+    time_class TEXT,
+    opening TEXT,
+    white_accuracy REAL,
+    black_accuracy REAL,
+    player_color TEXT,
+    player_rating INTEGER,
+    opponent_username TEXT,
+    opponent_rating INTEGER,
+    player_result TEXT,
+    PRIMARY KEY (username, game_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS games_username_date_time_class
+    ON games (username, date, time_class);
+CREATE INDEX IF NOT EXISTS games_opponent_username ON games (opponent_username);
+CREATE TABLE IF NOT EXISTS versions (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def connect(database_path: str = DATABASE_FILE):
+    """
+    It opens the SQLite database of the games and creates its table and
+    indexes if needed. The tables of a database written with an older
+    schema are dropped, so the next ETL run writes every game again.
+    The database is in WAL mode, so the dashboard can read while the
+    ETL writes, and writers wait for each other instead of failing.
+
+    Args:
+        database_path (str): The SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The connection to the database.
+    """
+    os.makedirs(os.path.dirname(database_path) or ".", exist_ok=True)
+    connection = sqlite3.connect(database_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("BEGIN IMMEDIATE")
+    if connection.execute("PRAGMA user_version").fetchone()[0] < DATABASE_VERSION:
+        connection.execute("DROP TABLE IF EXISTS games")
+        connection.execute("DROP TABLE IF EXISTS versions")
+        connection.execute(f"PRAGMA user_version = {DATABASE_VERSION}")
+    connection.commit()
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def game_rows(df: pd.DataFrame, username: str):
+    """
+    It converts transformed games to rows of the games table: the
+    game_url is derived from the id, the dates become "YYYY-MM-DD"
+    texts, which sort like dates, and the missing values become NULL.
+    """
+    df = df.assign(game_url=game_urls(df)).reindex(columns=GAME_COLUMNS)
+    df = df.assign(
+        date=pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m-%d"),
+        rated=df["rated"].astype("boolean").astype("Int64"),
+    )
+    df = df.astype(object).where(df.notna(), None)
+    df.insert(0, "username", username)
+    return list(df.itertuples(index=False, name=None))
+
+
+def write_games_database(
+    df,
+    username: str,
+    changed_game_ids: set = None,
+    database_path: str = DATABASE_FILE,
+):
+    """
+    It synchronises the games of a user in the database with the
+    transformed games, in one transaction. The games that are no longer
+    in `df` are deleted, and the games missing from the database or
+    listed in `changed_game_ids` are upserted, keyed by (username,
+    game_id), so an incremental transform only writes its new games.
+
+    Args:
+        df (pd.DataFrame/iterable): All the transformed games of the
+        user, or an iterable of DataFrames like the months given by
+        games_storage.iter_partitions, read one at a time.
+        username (str): The chess.com username of the player.
+        changed_game_ids (set): The ids of the games transformed again.
+        If None, every game is upserted.
+        database_path (str): The SQLite database file.
+
+    Returns:
+        int: The number of upserted games.
+    """
+    connection = connect(database_path)
+    try:
+        with connection:
+            stored = {
+                row[0]
+                for row in connection.execute(
+                    "SELECT game_id FROM games WHERE username = ?", (username,)
+                )
+            }
+            columns = ["username"] + GAME_COLUMNS
+            updates = ", ".join(
+                f"{column} = excluded.{column}"
+                for column in GAME_COLUMNS
+                if column != "game_id"
+            )
+            seen, upserted = set(), 0
+            for frame in [df] if isinstance(df, pd.DataFrame) else df:
+                game_ids = frame["game_id"].astype("int64")
+                seen.update(game_ids.tolist())
+                if changed_game_ids is not None:
+                    frame = frame[
+                        ~game_ids.isin(stored) | game_ids.isin(changed_game_ids)
+                    ]
+                connection.executemany(
+                    f"INSERT INTO games ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))}) "
+                    f"ON CONFLICT (username, game_id) DO UPDATE SET {updates}",
+                    game_rows(frame, username),
+                )
+                upserted += len(frame)
+            connection.executemany(
+                "DELETE FROM games WHERE username = ? AND game_id = ?",
+                [(username, game_id) for game_id in stored - seen],
+            )
+    finally:
+        connection.close()
+    print(f"Database: {database_path}, {upserted} games of {username} upserted")
+    return upserted
+
+
+def query_games(
+    usernames: list = None,
+    columns: list = None,
+    start_date=None,
+    end_date=None,
+    time_class: str = None,
+    database_path: str = DATABASE_FILE,
+):
+    """
+    It reads games from the database with the filters applied by SQLite,
+    using the (username, date, time_class) index, so only the matching
+    rows are read whatever the number of players and games.
+
+    Args:
+        usernames (list): The players. If None, every player.
+        columns (list): The columns to read. If None, every column.
+        start_date (datetime): The first day. If None, no lower bound.
+        end_date (datetime): The last day. If None, no upper bound.
+        time_class (str): A time class like "blitz". If None, all.
+        database_path (str): The SQLite database file.
+
+    Returns:
+        pd.DataFrame: The games with converted types, and a username
+        column when several players are read. The game_url is not read,
+        like in the Parquet files.
+    """
+    columns = list(columns) if columns else [c for c in GAME_COLUMNS if c != "game_url"]
+    if usernames is None or len(usernames) != 1:
+        columns = ["username"] + [c for c in columns if c != "username"]
+    conditions, parameters = [], []
+    if usernames is not None:
+        conditions.append(f"username IN ({', '.join('?' * len(usernames))})")
+        parameters += list(usernames)
+    if start_date is not None:
+        conditions.append("date >= ?")
+        parameters.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+    if end_date is not None:
+        conditions.append("date <= ?")
+        parameters.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+    if time_class is not None:
+        conditions.append("time_class = ?")
+        parameters.append(time_class)
+    query = f"SELECT {', '.join(columns)} FROM games"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        df = pd.read_sql_query(query, connection, params=parameters)
+    finally:
+        connection.close()
+    if "rated" in df:
+        df["rated"] = df["rated"].fillna(0)
+    return set_column_types(df)
+
+
+def has_user(username: str, database_path: str = DATABASE_FILE):
+    """
+    It tells whether the database has games of a user.
+
+    Args:
+        username (str): The chess.com username of the player.
+        database_path (str): The SQLite database file.
+
+    Returns:
+        bool: True if the database exists and has games of the user.
+    """
+    if not os.path.exists(database_path):
+        return False
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        row = connection.execute(
+            "SELECT 1 FROM games WHERE username = ? LIMIT 1", (username,)
+        ).fetchone()
+    except sqlite3.OperationalError:  # the games table does not exist yet
+        row = None
+    finally:
+        connection.close()
+    return row is not None
+
+
+def write_database_version(
+    username: str, version: int, database_path: str = DATABASE_FILE
+):
+    """
+    It records in the database the data version stamp of a user, once
+    the stamp of the Parquet data is written. The database only holds
+    the games of this version when it was written by the same run.
+
+    Args:
+        username (str): The chess.com username of the player.
+        version (int): The data version, as written by
+        games_storage.write_data_version.
+        database_path (str): The SQLite database file.
+    """
+    connection = connect(database_path)
+    try:
+        with connection:
+            connection.execute(
+                "INSERT INTO versions (username, version) VALUES (?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET version = excluded.version",
+                (username, version),
+            )
+    finally:
+        connection.close()
+
+
+def read_database_version(username: str, database_path: str = DATABASE_FILE):
+    """
+    It reads the data version of the games of a user in the database.
+    The dashboard only reads the database when this version is as new
+    as the data version of the Parquet files, since the transform or
+    the engine analysis can update them without the database.
+
+    Args:
+        username (str): The chess.com username of the player.
+        database_path (str): The SQLite database file.
+
+    Returns:
+        int: The version of the games in the database, 0 if none was
+        recorded or the database has an older schema.
+    """
+    if not os.path.exists(database_path):
+        return 0
+    connection = sqlite3.connect(database_path, timeout=60)
+    try:
+        if connection.execute("PRAGMA user_version").fetchone()[0] < DATABASE_VERSION:
+            return 0
+        row = connection.execute(
+            "SELECT version FROM versions WHERE username = ?", (username,)
+        ).fetchone()
+    except sqlite3.OperationalError:  # the versions table does not exist yet
+        row = None
+    finally:
+        connection.close()
+    return row[0] if row is not None else 0
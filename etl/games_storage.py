@@ -0,0 +1,566 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import count, span, timed
+
+PARQUET_SUFFIX = "_transformed_games.parquet"  # single file of older versions
+CSV_SUFFIX = "_transformed_games.csv"
+DATASET_SUFFIX = "_games"
+VERSION_SUFFIX = "_version.json"
+ANALYSIS_SUFFIX = "_analysis"  # the engine analysis of engine_analysis.py
+PARTITION_FILENAME = "part-0.parquet"
+UNDATED = (0, 0)  # the partition of the games without a date
+GAME_URL_PREFIX = "https://www.chess.com/game"
+CATEGORY_COLUMNS = [
+    "time_class",
+    "opening",
+    "player_color",
+    "opponent_username",
+    "player_result",
+]
+RATING_COLUMNS = ["player_rating", "opponent_rating"]
+ACCURACY_COLUMNS = ["white_accuracy", "black_accuracy"]
+
+
+def games_filepath(output_dir: str, username: str, file_format: str = "parquet"):
+    """
+    It builds the path of the transformed games of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data, which
+        contains one folder per user.
+        username (str): The chess.com username of the player.
+        file_format (str): "parquet" or "csv".
+
+    Returns:
+        str: The path of the transformed games file.
+    """
+    suffix = PARQUET_SUFFIX if file_format == "parquet" else CSV_SUFFIX
+    return os.path.join(output_dir, username, f"{username}{suffix}")
+
+
+def games_dirpath(output_dir: str, username: str):
+    """
+    It builds the path of the dataset of the transformed games of a
+    user, which holds one Parquet file per month of games, in
+    year=YYYY/month=M folders.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the dataset directory.
+    """
+    return os.path.join(output_dir, username, f"{username}{DATASET_SUFFIX}")
+
+
+def partition_filepath(dataset_dir: str, year: int, month: int):
+    """
+    It builds the path of the Parquet file of the games of one month.
+    """
+    return os.path.join(
+        dataset_dir, f"year={year}", f"month={month}", PARTITION_FILENAME
+    )
+
+
+def list_partitions(dataset_dir: str, start_date=None, end_date=None):
+    """
+    It lists the months of a dataset, leaving out the months outside a
+    date range. The months are found from the folder names, so the
+    files of the months left out are never opened. The games without a
+    date are only listed when there is no date range.
+
+    Args:
+        dataset_dir (str): The dataset directory.
+        start_date (datetime): If given, the first day of the range.
+        end_date (datetime): If given, the last day of the range.
+
+    Returns:
+        list: The sorted (year, month) pairs.
+    """
+    if not os.path.isdir(dataset_dir):
+        return []
+    partitions = []
+    for year_dir in os.listdir(dataset_dir):
+        if not year_dir.startswith("year="):
+            continue
+        for month_dir in os.listdir(os.path.join(dataset_dir, year_dir)):
+            if not month_dir.startswith("month="):
+                continue
+            key = (int(year_dir[len("year=") :]), int(month_dir[len("month=") :]))
+            if os.path.exists(partition_filepath(dataset_dir, *key)):
+                partitions.append(key)
+    partitions.sort()
+    if start_date is not None or end_date is not None:
+        partitions = [key for key in partitions if key != UNDATED]
+    if start_date is not None:
+        start = pd.Timestamp(start_date)
+        partitions = [key for key in partitions if key >= (start.year, start.month)]
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        partitions = [key for key in partitions if key <= (end.year, end.month)]
+    return partitions
+
+
+def split_partitions(df: pd.DataFrame):
+    """
+    It splits games by the month of their date.
+
+    Args:
+        df (pd.DataFrame): The transformed games, with converted types.
+
+    Returns:
+        dict: The games of each (year, month), UNDATED for the games
+        without a date.
+    """
+    dates = df["date"]
+    keys = dates.dt.year.fillna(0).astype(int) * 100 + dates.dt.month.fillna(0)
+    return {
+        (int(key) // 100, int(key) % 100): games
+        for key, games in df.groupby(keys.astype(int).to_numpy(), sort=True)
+    }
+
+
+@timed("write_partition")
+def write_partition(df: pd.DataFrame, dataset_dir: str, year: int, month: int):
+    """
+    It writes the games of one month, replacing its Parquet file
+    atomically. The month is removed when there is no game left.
+
+    Args:
+        df (pd.DataFrame): The games of the month, with converted types.
+        dataset_dir (str): The dataset directory.
+        year (int): The year of the month.
+        month (int): The month.
+    """
+    filepath = partition_filepath(dataset_dir, year, month)
+    if df.empty:
+        shutil.rmtree(os.path.dirname(filepath), ignore_errors=True)
+        return
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = f"{filepath}.tmp"
+    df.to_parquet(tmp_filepath, index=False)
+    os.replace(tmp_filepath, filepath)
+    count("games", len(df), stage="write")
+
+
+def read_partition(
+    dataset_dir: str, year: int, month: int, columns: list = None, memory_map=False
+):
+    """
+    It reads the games of one month.
+
+    Returns:
+        pd.DataFrame/None: The games, or None if the month has no file.
+    """
+    filepath = partition_filepath(dataset_dir, year, month)
+    if not os.path.exists(filepath):
+        return None
+    return pd.read_parquet(
+        filepath, columns=list(columns) if columns else None, memory_map=memory_map
+    )
+
+
+def iter_partitions(dataset_dir: str, columns: list = None):
+    """
+    It reads the games of a dataset one month at a time, so that the
+    whole history is never in memory.
+
+    Args:
+        dataset_dir (str): The dataset directory.
+        columns (list): The columns to read. If None, every column.
+
+    Yields:
+        pd.DataFrame: The games of each month, in the order of the months.
+    """
+    for key in list_partitions(dataset_dir):
+        df = read_partition(dataset_dir, *key, columns)
+        if df is not None:
+            yield df
+
+
+def replace_dataset(new_dataset_dir: str, dataset_dir: str):
+    """
+    It replaces a dataset with a dataset written next to it, and
+    removes the single Parquet file written by older versions.
+
+    Args:
+        new_dataset_dir (str): The dataset written from scratch.
+        dataset_dir (str): The dataset to replace.
+    """
+    old_dataset_dir = f"{dataset_dir}.old"
+    shutil.rmtree(old_dataset_dir, ignore_errors=True)
+    if os.path.isdir(dataset_dir):
+        os.rename(dataset_dir, old_dataset_dir)
+    os.makedirs(new_dataset_dir, exist_ok=True)
+    os.rename(new_dataset_dir, dataset_dir)
+    shutil.rmtree(old_dataset_dir, ignore_errors=True)
+    user_dir = os.path.dirname(dataset_dir)
+    username = os.path.basename(user_dir)
+    legacy_filepath = games_filepath(os.path.dirname(user_dir), username)
+    if os.path.exists(legacy_filepath):
+        os.remove(legacy_filepath)
+
+
+def count_games(output_dir: str, username: str):
+    """
+    It counts the transformed games of a user from the metadata of the
+    Parquet files, without reading the games.
+
+    Returns:
+        int: The number of games.
+    """
+    dataset_dir = games_dirpath(output_dir, username)
+    return sum(
+        pq.read_metadata(partition_filepath(dataset_dir, *key)).num_rows
+        for key in list_partitions(dataset_dir)
+    )
+
+
+def has_games(output_dir: str, username: str):
+    """
+    It tells if a user has transformed games, in the dataset or in the
+    single Parquet or CSV file of older versions.
+    """
+    return bool(
+        list_partitions(games_dirpath(output_dir, username))
+        or os.path.exists(games_filepath(output_dir, username))
+        or os.path.exists(games_filepath(output_dir, username, "csv"))
+    )
+
+
+def export_games_csv(output_dir: str, username: str):
+    """
+    It exports the transformed games of a user to one CSV file for
+    other tools. The months are appended one at a time, so the whole
+    history is never in memory. The game_url column, which is not
+    stored, is derived again for the CSV file.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the CSV file.
+    """
+    filepath = games_filepath(output_dir, username, "csv")
+    tmp_filepath = f"{filepath}.tmp"
+    with span("write_csv"):
+        with open(tmp_filepath, "w", encoding="utf-8", newline="") as f:
+            header = True
+            for df in iter_partitions(games_dirpath(output_dir, username)):
+                df.insert(0, "game_url", game_urls(df))
+                df.to_csv(f, index=False, header=header)
+                header = False
+        os.replace(tmp_filepath, filepath)
+    return filepath
+
+
+def game_urls(df: pd.DataFrame):
+    """
+    It derives the chess.com URLs of games from their game_id and
+    time_class, since the URL is not stored: the daily games are under
+    /game/daily/ and the others under /game/live/.
+
+    Args:
+        df (pd.DataFrame): The games, with game_id and time_class.
+
+    Returns:
+        pd.Series: The URL of each game.
+    """
+    kinds = np.where(df["time_class"].astype(str) == "daily", "daily", "live")
+    return pd.Series(
+        [
+            f"{GAME_URL_PREFIX}/{kind}/{game_id}"
+            for kind, game_id in zip(kinds, df["game_id"])
+        ],
+        index=df.index,
+        dtype=object,
+    )
+
+
+def set_column_types(df: pd.DataFrame):
+    """
+    It converts the columns of the transformed games to the compact
+    types used in memory and on disk: the repeated strings are
+    dictionary encoded as categories (CATEGORY_COLUMNS), the ids are
+    int64, the ratings Int16 and the accuracies float32. The game_url
+    column is dropped, since game_urls derives it from the id when it
+    is needed. It is applied after the transformation and after reading
+    a CSV file, which does not keep the types. Only the columns present
+    in the DataFrame are converted.
+
+    Args:
+        df (pd.DataFrame): The transformed games.
+
+    Returns:
+        pd.DataFrame: The DataFrame with converted columns.
+    """
+    if "game_url" in df:
+        df = df.drop(columns="game_url")
+    if "game_id" in df:
+        df["game_id"] = df["game_id"].astype(np.int64)
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    if "opening" in df and df["opening"].isna().any():
+        opening = df["opening"]
+        if "N/A" not in opening.cat.categories:
+            opening = opening.cat.add_categories("N/A")
+        df["opening"] = opening.fillna("N/A")
+    for column in RATING_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("Int16")
+    for column in ACCURACY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype(np.float32)
+    if "rated" in df:
+        df["rated"] = df["rated"].astype(bool)
+    if "date" in df:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df
+
+
+def version_filepath(output_dir: str, username: str):
+    """
+    It builds the path of the data version stamp of a user.
+    """
+    return os.path.join(output_dir, username, f"{username}{VERSION_SUFFIX}")
+
+
+def read_data_version(output_dir: str, username: str):
+    """
+    It reads the data version stamp of a user. The dashboard reads it
+    at each rerun and gives it to its cached loaders, so their cache
+    is only invalidated when the ETL changed the data.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        int: The version of the data, 0 if no stamp was written yet.
+    """
+    try:
+        with open(version_filepath(output_dir, username), encoding="utf-8") as f:
+            return int(json.load(f)["version"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def write_data_version(output_dir: str, username: str):
+    """
+    It increments the data version stamp of a user, once the games,
+    the dashboard data and the opening index are written. The file is
+    replaced atomically, so a reader never sees a partial stamp.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        int: The new version.
+    """
+    version = read_data_version(output_dir, username) + 1
+    filepath = version_filepath(output_dir, username)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": version, "updated_at": pd.Timestamp.now("UTC").isoformat()}, f
+        )
+    os.replace(tmp_filepath, filepath)
+    return version
+
+
+def analysis_dirpath(output_dir: str, username: str):
+    """
+    It builds the path of the engine analysis of a user, a directory
+    with one Parquet file per analysed batch of games.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the analysis directory.
+    """
+    return os.path.join(output_dir, username, f"{username}{ANALYSIS_SUFFIX}")
+
+
+def fill_engine_accuracies(df: pd.DataFrame, output_dir: str, username: str):
+    """
+    It fills the missing accuracies of the games with the accuracies
+    computed by the engine analysis, joined by game_id. The Chess.com
+    accuracies are kept when the game has them.
+
+    Args:
+        df (pd.DataFrame): The games, with a game_id column.
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        pd.DataFrame: The games with the engine accuracies.
+    """
+    columns = [column for column in ACCURACY_COLUMNS if column in df]
+    analysis_dir = analysis_dirpath(output_dir, username)
+    if not columns or df.empty or not os.path.isdir(analysis_dir):
+        return df
+    files = sorted(f for f in os.listdir(analysis_dir) if f.endswith(".parquet"))
+    if not files:
+        return df
+    analysis = pd.concat(
+        [
+            pd.read_parquet(
+                os.path.join(analysis_dir, f), columns=["game_id"] + columns
+            )
+            for f in files
+        ],
+        ignore_index=True,
+    ).drop_duplicates("game_id", keep="last")
+    positions = pd.Index(analysis["game_id"]).get_indexer(df["game_id"])
+    found = positions >= 0
+    for column in columns:
+        engine = analysis[column].to_numpy(np.float32)[positions]
+        engine[~found] = np.nan
+        df[column] = df[column].fillna(pd.Series(engine, index=df.index))
+    return df
+
+
+def read_partition_table(
+    dataset_dir: str,
+    key: tuple,
+    columns: list = None,
+    memory_map: bool = False,
+    table_cache: dict = None,
+):
+    """
+    It reads the Arrow table of the games of one month. With a table
+    cache, the table is kept by file, columns and memory_map, with the
+    size and mtime of the file: it is only read again when the file
+    was replaced, so after an update of the current month the other
+    months come from the cache.
+
+    Args:
+        dataset_dir (str): The dataset directory.
+        key (tuple): The (year, month) of the partition.
+        columns (list): The columns to read. If None, every column.
+        memory_map (bool): If True, the file is memory-mapped.
+        table_cache (dict): If given, the cache of the tables read.
+
+    Returns:
+        pa.Table: The games of the month.
+    """
+    filepath = partition_filepath(dataset_dir, *key)
+    if table_cache is None:
+        return pq.read_table(filepath, columns=columns, memory_map=memory_map)
+    stat = os.stat(filepath)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cache_key = (filepath, tuple(columns) if columns else None, memory_map)
+    cached = table_cache.get(cache_key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    table = pq.read_table(filepath, columns=columns, memory_map=memory_map)
+    table_cache[cache_key] = (stamp, table)
+    return table
+
+
+def filter_dates(df: pd.DataFrame, start_date=None, end_date=None):
+    """
+    It keeps the games between two dates, both included.
+    """
+    if start_date is not None:
+        df = df[df["date"] >= start_date]
+    if end_date is not None:
+        df = df[df["date"] <= end_date]
+    return df
+
+
+def read_games(
+    output_dir: str,
+    username: str,
+    columns: list = None,
+    memory_map: bool = False,
+    start_date=None,
+    end_date=None,
+    table_cache: dict = None,
+):
+    """
+    It reads the transformed games of a user. The monthly Parquet files
+    of the dataset are read when it exists, with only the requested
+    columns and without any type conversion. With a date range, only
+    the months overlapping the range are read, so the memory used by a
+    narrow range does not depend on the length of the history.
+    Otherwise the single Parquet file or the CSV file written by older
+    versions is read. The missing accuracies are filled from the engine
+    analysis of the user, if any (fill_engine_accuracies).
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+        columns (list): The columns to read. If None, every column is read.
+        memory_map (bool): If True, the Parquet files are memory-mapped
+        instead of being read into a buffer first.
+        start_date (datetime): If given, the first day of the games.
+        end_date (datetime): If given, the last day of the games.
+        table_cache (dict): If given, the tables of the months are kept
+        in this cache and only the months whose file changed are read
+        again (see read_partition_table).
+
+    Returns:
+        pd.DataFrame/None: The transformed games, or None if the user
+        has no transformed data.
+    """
+    filtered = start_date is not None or end_date is not None
+    read_columns = list(columns) if columns else None
+    if read_columns and filtered and "date" not in read_columns:
+        read_columns.append("date")
+    if read_columns and set(read_columns) & set(ACCURACY_COLUMNS):
+        if "game_id" not in read_columns:  # the key of the engine analysis
+            read_columns.append("game_id")
+    dataset_dir = games_dirpath(output_dir, username)
+    partitions = list_partitions(dataset_dir)
+    if partitions:
+        selected = list_partitions(dataset_dir, start_date, end_date)
+        tables = [
+            read_partition_table(
+                dataset_dir, key, read_columns, memory_map, table_cache
+            )
+            for key in selected
+        ]
+        if tables:  # the dictionaries of the months are unified
+            table = pa.concat_tables(tables, promote_options="permissive")
+        else:  # no game in the range, but the columns are still typed
+            schema = pq.read_schema(partition_filepath(dataset_dir, *partitions[0]))
+            table = schema.empty_table()
+            table = table.select(read_columns) if read_columns else table
+        df = table.to_pandas()
+    elif os.path.exists(games_filepath(output_dir, username)):
+        df = pd.read_parquet(
+            games_filepath(output_dir, username),
+            columns=read_columns,
+            memory_map=memory_map,
+        )
+        df = set_column_types(df)
+    elif os.path.exists(games_filepath(output_dir, username, "csv")):
+        df = pd.read_csv(
+            games_filepath(output_dir, username, "csv"),
+            usecols=read_columns,
+            dtype={"game_id": str},
+            keep_default_na=False,  # "N/A" is a valid player_result
+            na_values=[""],
+        )
+        df = set_column_types(df)
+    else:
+        return None
+    df = fill_engine_accuracies(df, output_dir, username)
+    if filtered:
+        df = filter_dates(df, start_date, end_date)
+    return df[list(columns)] if columns and len(columns) < df.shape[1] else df
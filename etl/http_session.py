@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+VALIDATORS_FILE = "data/json/http_validators.json"
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    It returns the HTTP session shared by the whole process. The
+    session keeps the connections to the API alive, so the archive
+    downloads reuse the same TCP+TLS connections instead of opening a
+    new one for every URL. The connection pool is large enough for all
+    the download threads.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class ValidatorStore:
+    """
+    An on-disk store of the HTTP validators (ETag and Last-Modified)
+    received for each URL. They are sent back with If-None-Match and
+    If-Modified-Since, so the API answers 304 Not Modified with an
+    empty body when an archive did not change. The store is shared by
+    the download threads and saved atomically to a JSON file.
+
+    Args:
+        filepath (str): The JSON file where the validators are stored.
+    """
+
+    def __init__(self, filepath: str = VALIDATORS_FILE):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.validators = {}
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    self.validators = json.load(f)
+            except (IOError, ValueError) as err:
+                print(f"Error {err} during reading file: {filepath}")
+
+    def conditional_headers(self, url: str):
+        """
+        It builds the conditional request headers for a URL.
+
+        Args:
+            url (str): The requested URL.
+
+        Returns:
+            dict: The If-None-Match and If-Modified-Since headers, empty
+            if no validator is known for the URL.
+        """
+        with self.lock:
+            validator = self.validators.get(url, {})
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        return headers
+
+    def update(self, url: str, response_headers):
+        """
+        It records the validators of a successful response.
+
+        Args:
+            url (str): The requested URL.
+            response_headers (Mapping): The headers of the response.
+        """
+        validator = {
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+        }
+        if not validator["etag"] and not validator["last_modified"]:
+            return
+        with self.lock:
+            self.validators[url] = validator
+
+    def forget(self, url: str):
+        """
+        It removes the validators of a URL, so the next request for it
+        downloads the full content.
+
+        Args:
+            url (str): The requested URL.
+        """
+        with self.lock:
+            self.validators.pop(url, None)
+
+    def save(self):
+        """
+        It writes the validators to disk. The file is written next to
+        its final path and then renamed, so it is never left half written.
+        """
+        with self.lock:
+            validators = dict(self.validators)
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        tmp_filepath = f"{self.filepath}.tmp"
+        try:
+            with open(tmp_filepath, "w", encoding="utf-8") as f:
+                json.dump(validators, f)
+            os.replace(tmp_filepath, self.filepath)
+        except IOError as err:
+            print(f"Error {err} during saving file: {self.filepath}")
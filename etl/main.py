@@ -1,21 +1,375 @@
-from extract_chess_data import extract_chess_player_data
-from transform_chess_data import transformed_games
+import argparse
+import os
+import subprocess
+import sys
 
+from metrics import METRICS, METRICS_DIR, PROFILE_ENV, PROMETHEUS_FILE, profiling, span
 
-def run_etl(username: str):
+# The modules of each step are imported by the commands which use them:
+# pandas, pyarrow and python-chess take most of the start-up time, and
+# an extraction or the help never needs them.
+COMMANDS = ["extract", "transform", "refresh", "serve"]
+APP_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "visualisation",
+    "chess_data_app.py",
+)
+
+
+def read_usernames(filepath: str):
+    """
+    It reads a list of usernames from a text file, one username per
+    line. Empty lines and lines starting with "#" are ignored.
+
+    Args:
+        filepath (str): The text file.
+
+    Returns:
+        list: The usernames, without duplicates, in the file order.
+    """
+    with open(filepath, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and line[0] != "#"))
+
+
+def run_transform(username: str, database_path: str = None, export_csv: bool = True):
+    """
+    It runs the transform steps of a user from its raw data: the games,
+    the dashboard data, the move store and the opening index. At the
+    end, if the transform changed the data, the data version stamp
+    tells the dashboard to reload it.
+
+    Args:
+        username (str): The Chess.com username to process.
+        database_path (str): If given, the games are also written to
+        this SQLite database.
+        export_csv (bool): If True, a CSV copy of the games is exported.
+
+    Returns:
+        int: The number of transformed games.
+    """
+    from games_database import write_database_version
+    from games_storage import write_data_version
+    from opening_index import build_opening_index
+    from pgn_parser import build_move_store
+    from transform_chess_data import TRANSFORMED_DATA_DIR, transformed_games
+
+    with span("transform"):
+        number_games, changed = transformed_games(
+            username=username, export_csv=export_csv, database_path=database_path
+        )
+    with span("move_store"):
+        build_move_store(username=username)
+    with span("opening_index"):
+        build_opening_index(username=username)
+    if number_games and changed:
+        version = write_data_version(TRANSFORMED_DATA_DIR, username)
+        if database_path:
+            write_database_version(username, version, database_path)
+    return number_games
+
+
+def run_etl(
+    username: str,
+    database_path: str = None,
+    max_workers: int = None,
+    requests_per_second: float = None,
+):
     """
     Orchestrates the complete ETL (Extract, Transform, Load) process.
 
     This function calls the data extraction, then transformation functions
-    to download and process a user's chess data.
+    to download and process a user's chess data, and finally parses the
+    moves and clocks of the games into the move store and updates the
+    opening index (run_transform). Each step is timed in the metrics of
+    the run.
 
     Args:
         username (str): The Chess.com username to process.
+        database_path (str): If given, the games are also written to
+        this SQLite database.
+        max_workers (int): The number of download threads.
+        requests_per_second (float): The maximum number of requests per
+        second sent to the API.
+    """
+    from extract_chess_data import (
+        DEFAULT_MAX_WORKERS,
+        DEFAULT_REQUESTS_PER_SECOND,
+        extract_chess_player_data,
+    )
+
+    with span("extract"):
+        extract_chess_player_data(
+            username=username,
+            max_workers=max_workers or DEFAULT_MAX_WORKERS,
+            requests_per_second=requests_per_second or DEFAULT_REQUESTS_PER_SECOND,
+        )
+    run_transform(username, database_path)
+
+
+def database_path(arguments):
+    """
+    It gives the path of the SQLite database of --database, or None.
+    """
+    if arguments.database is True:
+        from games_database import DATABASE_FILE
+
+        return DATABASE_FILE
+    return arguments.database
+
+
+def extract_command(arguments):
+    """
+    It downloads the new archives of the users, without transforming
+    them. All the users share one API rate budget and one store of
+    ETag/Last-Modified.
+    """
+    from extract_chess_data import (
+        DEFAULT_MAX_WORKERS,
+        DEFAULT_REQUESTS_PER_SECOND,
+        extract_chess_player_data,
+    )
+    from http_session import ValidatorStore
+    from rate_limiter import TokenBucket
+
+    rate_limiter = TokenBucket(arguments.rps or DEFAULT_REQUESTS_PER_SECOND)
+    validators = ValidatorStore()
+    try:
+        for username in arguments.usernames:
+            with span("extract"):
+                extract_chess_player_data(
+                    username,
+                    max_workers=arguments.workers or DEFAULT_MAX_WORKERS,
+                    rate_limiter=rate_limiter,
+                    validators=validators,
+                )
+    finally:
+        validators.save()
+
+
+def transform_command(arguments):
+    """
+    It transforms the raw data already downloaded for the users.
+    """
+    for username in arguments.usernames:
+        run_transform(username, database_path(arguments), not arguments.no_csv)
+
+
+def refresh_command(arguments):
+    """
+    It runs the whole ETL of the users: one user in this process, or a
+    batch with a shared scheduler, then the optional engine analysis
+    and watch mode.
+    """
+    from extract_chess_data import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+
+    requests_per_second = arguments.rps or DEFAULT_REQUESTS_PER_SECOND
+    if len(arguments.usernames) == 1 and not arguments.resume:
+        run_etl(
+            username=arguments.usernames[0],
+            database_path=database_path(arguments),
+            max_workers=arguments.workers,
+            requests_per_second=requests_per_second,
+        )
+    else:
+        from batch_etl import run_batch_etl
+
+        run_batch_etl(
+            arguments.usernames,
+            max_workers=arguments.workers or DEFAULT_MAX_WORKERS,
+            requests_per_second=requests_per_second,
+            transform_workers=arguments.transform_workers,
+            resume=arguments.resume,
+            database_path=database_path(arguments),
+        )
+    if arguments.engine:
+        from engine_analysis import DEFAULT_DEPTH, analyse_games
+
+        for username in arguments.usernames:
+            with span("analysis"):
+                analyse_games(
+                    username,
+                    arguments.engine,
+                    depth=arguments.depth or DEFAULT_DEPTH,
+                    workers=arguments.engine_workers,
+                )
+    if arguments.watch:
+        from watch import DEFAULT_INTERVAL, watch_users
+
+        watch_users(
+            arguments.usernames,
+            interval=DEFAULT_INTERVAL if arguments.watch is True else arguments.watch,
+            requests_per_second=requests_per_second,
+            database_path=database_path(arguments),
+        )
+
+
+def serve_command(arguments):
+    """
+    It starts the Streamlit dashboard, from the visualisation folder
+    like its relative data paths expect.
+
+    Returns:
+        int: The exit code of Streamlit.
     """
-    extract_chess_player_data(username=username)
-    transformed_games(username=username)
+    command = [sys.executable, "-m", "streamlit", "run", os.path.abspath(APP_PATH)]
+    if arguments.port:
+        command += ["--server.port", str(arguments.port)]
+    try:
+        return subprocess.call(command, cwd=os.path.dirname(os.path.abspath(APP_PATH)))
+    except KeyboardInterrupt:
+        return 0
+
+
+def write_metrics(metrics_dir: str):
+    """
+    It writes the metrics of the run: a JSON run report and the
+    Prometheus text file, replaced at each run.
+
+    Args:
+        metrics_dir (str): The directory of the metrics.
+    """
+    report_path = METRICS.write_report(metrics_dir)
+    METRICS.write_prometheus(os.path.join(metrics_dir, PROMETHEUS_FILE))
+    print(f"Run report saved: {report_path}")
+
+
+def parse_arguments(argv: list = None):
+    """
+    It parses the command line. The defaults which live in the modules
+    of the steps are left to None here and resolved by the commands, so
+    that parsing the command line imports none of them. A command line
+    without a command, like `main.py magnus hikaru --rps 3`, runs the
+    refresh command, as the script did before it had commands.
+
+    Args:
+        argv (list): The arguments, sys.argv[1:] by default.
+
+    Returns:
+        argparse.Namespace: The arguments, with the list of usernames
+        read from the command line and from --users-file.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv.insert(0, "refresh")
+    parser = argparse.ArgumentParser(
+        description="Download and transform the games of Chess.com players, "
+        "and serve their dashboard."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    users = argparse.ArgumentParser(add_help=False)
+    users.add_argument("usernames", nargs="*", help="Chess.com usernames")
+    users.add_argument(
+        "--users-file", help="text file with one Chess.com username per line"
+    )
+    users.add_argument(
+        "--metrics-dir",
+        default=METRICS_DIR,
+        help=f"directory of the run reports and {PROMETHEUS_FILE} "
+        f"(default: {METRICS_DIR})",
+    )
+    users.add_argument(
+        "--profile",
+        default=None,
+        help=f"cpu, memory or cpu,memory (default: the {PROFILE_ENV} variable)",
+    )
+    download = argparse.ArgumentParser(add_help=False)
+    download.add_argument("--workers", type=int, help="number of download threads")
+    download.add_argument(
+        "--rps",
+        type=float,
+        help="maximum number of API requests per second for all the users",
+    )
+    database = argparse.ArgumentParser(add_help=False)
+    database.add_argument(
+        "--database",
+        nargs="?",
+        const=True,  # the DATABASE_FILE of games_database.py
+        default=None,
+        help="also write the games to a SQLite database (default: data/games.sqlite)",
+    )
+
+    commands.add_parser(
+        "extract",
+        parents=[users, download],
+        help="download the new monthly archives of the users",
+    )
+    transform = commands.add_parser(
+        "transform",
+        parents=[users, database],
+        help="transform the downloaded games of the users",
+    )
+    transform.add_argument(
+        "--no-csv", action="store_true", help="do not write the CSV export"
+    )
+    refresh = commands.add_parser(
+        "refresh",
+        parents=[users, download, database],
+        help="download and transform the games of the users (the whole ETL)",
+    )
+    refresh.add_argument(
+        "--transform-workers",
+        type=int,
+        default=None,
+        help="number of transform processes (default: number of CPUs)",
+    )
+    refresh.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the users already done in the previous batch run",
+    )
+    refresh.add_argument(
+        "--engine",
+        default=None,
+        help="command of a UCI engine, like stockfish, to analyse the games "
+        "without Chess.com accuracies",
+    )
+    refresh.add_argument(
+        "--depth", type=int, help="search depth of the engine analysis"
+    )
+    refresh.add_argument(
+        "--engine-workers",
+        type=int,
+        default=None,
+        help="number of engine processes (default: number of CPUs)",
+    )
+    refresh.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=True,  # the default interval of watch.py
+        default=None,
+        metavar="SECONDS",
+        help="after the ETL, keep polling the current month of the users and "
+        "append their new games",
+    )
+    serve = commands.add_parser("serve", help="start the Streamlit dashboard")
+    serve.add_argument("--port", type=int, default=None, help="port of the app")
+
+    arguments = parser.parse_args(argv)
+    if arguments.command != "serve":
+        usernames = list(arguments.usernames)
+        if arguments.users_file:
+            usernames += read_usernames(arguments.users_file)
+        if not usernames:
+            parser.error("give at least one username or --users-file")
+        arguments.usernames = list(dict.fromkeys(usernames))
+    return arguments
 
 
 if __name__ == "__main__":
-    username_input = input("Which username do you want to extract data of? ")
-    run_etl(username=username_input)
+    arguments = parse_arguments()
+    if arguments.command == "serve":
+        sys.exit(serve_command(arguments))
+    command = {
+        "extract": extract_command,
+        "transform": transform_command,
+        "refresh": refresh_command,
+    }[arguments.command]
+    try:
+        with profiling(arguments.profile, arguments.metrics_dir):
+            command(arguments)
+    finally:
+        write_metrics(arguments.metrics_dir)
@@ -0,0 +1,372 @@
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+METRICS_DIR = "data/metrics"
+PROMETHEUS_FILE = "etl.prom"
+PROFILE_ENV = "CHESS_ETL_PROFILE"  # "cpu", "memory" or "cpu,memory"
+PREFIX = "chess_etl"
+MAX_EVENTS = 10_000  # spans kept one by one in the JSON report
+STAGE_SPANS = {  # the span whose time is used for the games/sec of a stage
+    "download": "download_monthly_games",
+    "save": "store_archive_games",
+    "transform": "transform_file",
+    "write": "write_partition",
+    "analysis": "analyse_batch",
+}
+
+
+class Metrics:
+    """
+    The metrics of an ETL run: timing spans, aggregated by name, and
+    counters with labels, like the HTTP status codes or the games
+    handled by each stage. It is shared by the threads of the process,
+    and the metrics of worker processes are sent back with snapshot
+    and added with merge.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.spans = {}  # name -> [calls, seconds, max seconds]
+            self.counters = {}  # (name, sorted labels) -> value
+            self.events = []  # (name, detail, seconds)
+            self.extra = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, detail: str = None):
+        """
+        It times the code of a `with` block.
+
+        Args:
+            name (str): The name of the span, like "make_request".
+            detail (str): What the span is about, like a file name. It is
+            only kept in the list of events of the JSON report.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, detail)
+
+    def record(self, name: str, seconds: float, detail: str = None):
+        with self.lock:
+            calls, total, longest = self.spans.get(name, (0, 0.0, 0.0))
+            self.spans[name] = [calls + 1, total + seconds, max(longest, seconds)]
+            if detail is not None and len(self.events) < MAX_EVENTS:
+                self.events.append((name, detail, seconds))
+
+    def count(self, name: str, value: float = 1, **labels):
+        """
+        It adds a value to a counter.
+
+        Args:
+            name (str): The name of the counter, like "http_responses".
+            value (float): The value to add.
+            **labels: The labels of the counter, like status=200.
+        """
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        """
+        It gives the metrics as plain data, to send them from a worker
+        process to the main one.
+        """
+        with self.lock:
+            return {
+                "spans": {name: list(span) for name, span in self.spans.items()},
+                "counters": list(self.counters.items()),
+                "events": list(self.events),
+            }
+
+    def merge(self, snapshot: dict):
+        """
+        It adds the metrics of a snapshot, from a worker process.
+        """
+        with self.lock:
+            for name, (calls, seconds, longest) in snapshot["spans"].items():
+                old = self.spans.get(name, (0, 0.0, 0.0))
+                self.spans[name] = [
+                    old[0] + calls,
+                    old[1] + seconds,
+                    max(old[2], longest),
+                ]
+            for (name, labels), value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                self.counters[key] = self.counters.get(key, 0) + value
+            room = MAX_EVENTS - len(self.events)
+            self.events.extend(map(tuple, snapshot["events"][:room]))
+
+    def games_per_second(self):
+        """
+        It computes the games per second of each stage: the games
+        counted for the stage divided by the time spent in its span
+        (STAGE_SPANS). The time of the threads running at the same time
+        is added, so it is the speed of one thread.
+
+        Returns:
+            dict: The games per second of each stage with games.
+        """
+        with self.lock:
+            games = {}
+            for (name, labels), value in self.counters.items():
+                if name == "games":
+                    stage = dict(labels).get("stage")
+                    games[stage] = games.get(stage, 0) + value
+            throughput = {}
+            for stage, number_games in games.items():
+                seconds = self.spans.get(STAGE_SPANS.get(stage), (0, 0.0))[1]
+                if seconds:
+                    throughput[stage] = number_games / seconds
+            return throughput
+
+    def report(self):
+        """
+        It builds the JSON run report.
+
+        Returns:
+            dict: The start and duration of the run, the spans, the
+            counters, the games per second of each stage and the
+            slowest spans with their detail.
+        """
+        throughput = self.games_per_second()
+        with self.lock:
+            events = sorted(self.events, key=lambda event: -event[2])
+            return {
+                "started": datetime.fromtimestamp(
+                    self.started, timezone.utc
+                ).isoformat(),
+                "duration_seconds": time.time() - self.started,
+                "spans": {
+                    name: {"calls": calls, "seconds": seconds, "max_seconds": longest}
+                    for name, (calls, seconds, longest) in sorted(self.spans.items())
+                },
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "games_per_second": throughput,
+                "slowest": [
+                    {"span": name, "detail": detail, "seconds": seconds}
+                    for name, detail, seconds in events[:50]
+                ],
+                **self.extra,
+            }
+
+    def write_report(self, directory: str = METRICS_DIR):
+        """
+        It writes the JSON run report, named after the start of the run.
+
+        Args:
+            directory (str): The directory of the reports.
+
+        Returns:
+            str: The path of the report.
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = datetime.fromtimestamp(self.started).strftime("%Y%m%dT%H%M%S")
+        filepath = os.path.join(directory, f"run_{name}.json")
+        write_atomically(filepath, json.dumps(self.report(), indent=2))
+        return filepath
+
+    def prometheus_text(self):
+        """
+        It formats the metrics in the Prometheus text format, with
+        the span times and calls, the counters and the games per second.
+
+        Returns:
+            str: The text of the metrics.
+        """
+        throughput = self.games_per_second()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}_{name}{format_labels(labels)} {value}")
+
+        with self.lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+            metric(
+                "span_seconds_total",
+                "counter",
+                "Time spent in each span.",
+                [({"span": name}, span[1]) for name, span in spans],
+            )
+            metric(
+                "span_calls_total",
+                "counter",
+                "Number of times each span ran.",
+                [({"span": name}, span[0]) for name, span in spans],
+            )
+            metric(
+                "span_max_seconds",
+                "gauge",
+                "Longest run of each span.",
+                [({"span": name}, span[2]) for name, span in spans],
+            )
+            for counter in sorted({name for (name, _), _ in counters}):
+                metric(
+                    f"{counter}_total",
+                    "counter",
+                    f"Total of the {counter} counter.",
+                    [
+                        (dict(labels), value)
+                        for (name, labels), value in counters
+                        if name == counter
+                    ],
+                )
+            started = self.started
+        metric(
+            "games_per_second",
+            "gauge",
+            "Games per second of each stage.",
+            [({"stage": stage}, value) for stage, value in sorted(throughput.items())],
+        )
+        metric(
+            "run_duration_seconds",
+            "gauge",
+            "Duration of the run.",
+            [({}, time.time() - started)],
+        )
+        metric(
+            "run_start_timestamp_seconds",
+            "gauge",
+            "Start of the run.",
+            [({}, started)],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filepath: str):
+        """
+        It writes the metrics to a Prometheus text file, for example in
+        the directory read by the textfile collector of node_exporter.
+        The file is replaced atomically, so it is never read half
+        written.
+
+        Args:
+            filepath (str): The ".prom" file.
+        """
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        write_atomically(filepath, self.prometheus_text())
+
+
+def format_labels(labels: dict):
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in sorted(labels.items())
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def write_atomically(filepath: str, text: str):
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_filepath, filepath)
+
+
+METRICS = Metrics()  # the metrics of the process
+
+
+def span(name: str, detail: str = None):
+    """
+    It times a `with` block in the metrics of the process.
+    """
+    return METRICS.span(name, detail)
+
+
+def count(name: str, value: float = 1, **labels):
+    """
+    It adds a value to a counter of the metrics of the process.
+    """
+    METRICS.count(name, value, **labels)
+
+
+def timed(name: str):
+    """
+    A decorator timing every call of a function in a span.
+
+    Args:
+        name (str): The name of the span.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with METRICS.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def profiling(mode: str = None, directory: str = METRICS_DIR):
+    """
+    It profiles the code of a `with` block. With "cpu", cProfile runs
+    and its statistics are saved to profile_<time>.pstats, which can be
+    read with `python -m pstats` or snakeviz. With "memory",
+    tracemalloc runs and the 30 lines which allocated the most are
+    saved to memory_<time>.txt. Both can be given, like "cpu,memory".
+    The mode defaults to the CHESS_ETL_PROFILE environment variable,
+    so profiling needs no code change. Only the main thread is seen by
+    cProfile, and the worker processes are not profiled.
+
+    Args:
+        mode (str): "cpu", "memory", both separated by a comma, or None.
+        directory (str): The directory of the profiles.
+    """
+    mode = mode if mode is not None else os.environ.get(PROFILE_ENV, "")
+    modes = {part.strip() for part in mode.split(",") if part.strip()}
+    unknown = modes - {"cpu", "memory"}
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(sorted(unknown))}")
+    profiler = cProfile.Profile() if "cpu" in modes else None
+    if "memory" in modes:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        name = datetime.now().strftime("%Y%m%dT%H%M%S")
+        if modes:
+            os.makedirs(directory, exist_ok=True)
+        if profiler:
+            filepath = os.path.join(directory, f"profile_{name}.pstats")
+            profiler.dump_stats(filepath)
+            METRICS.extra["cpu_profile"] = filepath
+            print(f"CPU profile saved: {filepath}")
+        if "memory" in modes:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            filepath = os.path.join(directory, f"memory_{name}.txt")
+            top = snapshot.statistics("lineno")[:30]
+            write_atomically(filepath, "\n".join(str(stat) for stat in top) + "\n")
+            METRICS.extra["memory_profile"] = filepath
+            METRICS.extra["traced_memory_peak_bytes"] = peak
+            print(f"Memory profile saved: {filepath}")
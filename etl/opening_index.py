@@ -0,0 +1,358 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from game_store import save_array
+from games_storage import read_games
+from pgn_parser import TRANSFORMED_DATA_DIR, MoveStore
+
+OPENING_DEPTH = 12  # the first 6 moves of each side
+COLORS = ["white", "black"]
+RESULTS = ["win", "draw", "loss"]
+NO_MOVE = -1
+
+
+def opening_index_dir(username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+    """
+    It builds the path of the opening index of a user.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+
+    Returns:
+        str: The directory of the opening index.
+    """
+    return os.path.join(output_dir, username, f"{username}_openings")
+
+
+def opening_lines(store: MoveStore, indexes: np.ndarray, depth: int):
+    """
+    It gathers the first `depth` moves of some games of the move store
+    in a matrix, padded with NO_MOVE for the shorter games.
+
+    Args:
+        store (MoveStore): The move store of the player.
+        indexes (np.ndarray): The indexes of the games in the store.
+        depth (int): The number of plies kept per game.
+
+    Returns:
+        np.ndarray: An int64 matrix with one row per game.
+    """
+    starts = np.asarray(store.offsets[indexes], dtype=np.int64)
+    lengths = np.minimum(np.asarray(store.offsets[indexes + 1]) - starts, depth)
+    lines = np.full((len(indexes), depth), NO_MOVE, dtype=np.int64)
+    plies = np.arange(depth)
+    has_ply = plies < lengths[:, None]
+    lines[has_ply] = store.moves[(starts[:, None] + plies)[has_ply]]
+    return lines
+
+
+def merge_level(old_keys: np.ndarray, new_keys: np.ndarray, first_node: int):
+    """
+    It numbers the nodes of one level of the tree. A node is identified
+    by the key parent * vocabulary size + move, and the nodes of a level
+    are numbered in the order of their keys, so the children of a node
+    are contiguous and sorted by move.
+
+    Args:
+        old_keys (np.ndarray): The keys of the nodes already in the index.
+        new_keys (np.ndarray): The keys reached by the new games.
+        first_node (int): The number of the first node of the level.
+
+    Returns:
+        tuple: The sorted keys of the level, the new numbers of the old
+        nodes and the node reached by each new game.
+    """
+    keys = np.union1d(old_keys, new_keys)
+    return (
+        keys,
+        first_node + np.searchsorted(keys, old_keys),
+        first_node + np.searchsorted(keys, new_keys),
+    )
+
+
+def build_opening_index(
+    username: str,
+    output_dir: str = TRANSFORMED_DATA_DIR,
+    depth: int = OPENING_DEPTH,
+):
+    """
+    It builds the opening tree of a user from its move store: one node
+    per move sequence of the first `depth` plies, with the number of
+    wins, draws and losses of the player split by color and time class.
+    The tree is stored as flat arrays that np.load can memory-map:
+
+    - parent.npy: the parent of each node (-1 for the root),
+    - move.npy: the move leading to each node, an index of the
+      vocabulary of meta.json,
+    - counts.npy: the results of each node, shaped (nodes, color,
+      time class, result),
+    - indexed_games.npy: the sorted ids of the games already counted.
+
+    The nodes are numbered level by level and the children of a node
+    are contiguous and sorted by move, so a move sequence is found with
+    one binary search per move. The tree is updated incrementally: only
+    the games missing from indexed_games.npy are added, and it is only
+    rebuilt when games were removed or the depth changed. The games
+    with a "N/A" result are not counted.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+        depth (int): The number of plies of the tree.
+
+    Returns:
+        int: The number of games in the index.
+    """
+    index_dir = opening_index_dir(username, output_dir)
+    store = MoveStore(username, output_dir)
+    games = read_games(
+        output_dir,
+        username,
+        columns=["game_id", "player_color", "time_class", "player_result"],
+    )
+    # the "N/A" results (a result code the transform does not know) are
+    # left out on purpose: the tree only counts wins, draws and losses,
+    # so the games of a node can be fewer than the games of the opening
+    games = games[
+        games["player_color"].isin(COLORS) & games["player_result"].isin(RESULTS)
+    ]
+    games = games.assign(game_id=games["game_id"].astype(np.int64))
+    store_ids = np.asarray(store.game_ids)
+    games = games[games["game_id"].isin(store_ids)].drop_duplicates("game_id")
+
+    meta, parent, move, counts = None, None, None, None
+    indexed = np.array([], dtype=np.int64)
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        indexed = np.load(os.path.join(index_dir, "indexed_games.npy"))
+        if meta["depth"] != depth or not np.isin(indexed, games["game_id"]).all():
+            print(f"Opening index: {index_dir} is rebuilt")
+            meta, indexed = None, np.array([], dtype=np.int64)
+    if meta is None:
+        meta = {"depth": depth, "vocabulary": [], "time_classes": []}
+        parent = np.array([-1], dtype=np.int32)
+        move = np.array([0], dtype=np.uint16)
+        counts = np.zeros((1, len(COLORS), 0, len(RESULTS)), dtype=np.int32)
+    else:
+        parent = np.load(os.path.join(index_dir, "parent.npy"))
+        move = np.load(os.path.join(index_dir, "move.npy"))
+        counts = np.load(os.path.join(index_dir, "counts.npy"))
+
+    games = games[~games["game_id"].isin(indexed)]
+    if games.empty and os.path.exists(os.path.join(index_dir, "meta.json")):
+        print(f"Opening index: {index_dir} is up to date")
+        return len(indexed)
+
+    # the move ids of the store are mapped to the vocabulary of the index
+    vocabulary = {san: i for i, san in enumerate(meta["vocabulary"])}
+    store_to_index = np.array(
+        [vocabulary.setdefault(san, len(vocabulary)) for san in store.vocabulary],
+        dtype=np.int64,
+    )
+    time_classes = {name: i for i, name in enumerate(meta["time_classes"])}
+    for name in games["time_class"].astype(str).unique():
+        time_classes.setdefault(name, len(time_classes))
+    store_index = pd.Series(np.arange(len(store_ids)), index=store_ids)
+    store_index = store_index[~store_index.index.duplicated(keep="last")]
+    lines = opening_lines(
+        store, store_index.loc[games["game_id"]].to_numpy(), meta["depth"]
+    )
+    lines[lines != NO_MOVE] = store_to_index[lines[lines != NO_MOVE]]
+
+    # the old and the new nodes are merged level by level
+    number_moves = max(len(vocabulary), 1)
+    levels = meta.get("levels", [1])  # the first node of each level
+    levels = levels + [len(parent)] * (meta["depth"] + 1 - len(levels))
+    renumbered = np.zeros(len(parent), dtype=np.int64)
+    paths = np.zeros((len(games), meta["depth"] + 1), dtype=np.int64)
+    new_parent, new_move = [np.array([-1])], [np.array([0])]
+    first_node = 1
+    meta["levels"] = [1]
+    for level in range(1, meta["depth"] + 1):
+        old_nodes = np.arange(levels[level - 1], levels[level])
+        playing = np.flatnonzero(lines[:, level - 1] != NO_MOVE)
+        old_keys = renumbered[parent[old_nodes]] * number_moves + move[old_nodes]
+        new_keys = paths[playing, level - 1] * number_moves + lines[playing, level - 1]
+        keys, renumbered[old_nodes], paths[playing, level] = merge_level(
+            old_keys, new_keys, first_node
+        )
+        paths[lines[:, level - 1] == NO_MOVE, level] = -1
+        new_parent.append(keys // number_moves)
+        new_move.append(keys % number_moves)
+        first_node += len(keys)
+        meta["levels"].append(first_node)
+        if len(keys) == 0:
+            paths[:, level + 1 :] = -1
+            break
+
+    new_counts = np.zeros(
+        (first_node, len(COLORS), len(time_classes), len(RESULTS)), dtype=np.int32
+    )
+    new_counts[renumbered, :, : counts.shape[2]] = counts
+    colors = games["player_color"].astype(str).map(COLORS.index).to_numpy()
+    classes = games["time_class"].astype(str).map(time_classes).to_numpy()
+    results = games["player_result"].astype(str).map(RESULTS.index).to_numpy()
+    reached = paths >= 0
+    np.add.at(
+        new_counts,
+        (
+            paths[reached],
+            np.broadcast_to(colors[:, None], paths.shape)[reached],
+            np.broadcast_to(classes[:, None], paths.shape)[reached],
+            np.broadcast_to(results[:, None], paths.shape)[reached],
+        ),
+        1,
+    )
+
+    # each file is renamed into place, the dashboard may have the tree
+    # mapped, and meta.json is written last
+    os.makedirs(index_dir, exist_ok=True)
+    indexed = np.union1d(indexed, games["game_id"].to_numpy())
+    save_array(
+        os.path.join(index_dir, "parent.npy"),
+        np.concatenate(new_parent).astype(np.int32),
+    )
+    save_array(
+        os.path.join(index_dir, "move.npy"), np.concatenate(new_move).astype(np.uint16)
+    )
+    save_array(os.path.join(index_dir, "counts.npy"), new_counts)
+    save_array(os.path.join(index_dir, "indexed_games.npy"), indexed)
+    meta["vocabulary"] = list(vocabulary)
+    meta["time_classes"] = list(time_classes)
+    meta_filepath = os.path.join(index_dir, "meta.json")
+    with open(f"{meta_filepath}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_filepath}.tmp", meta_filepath)
+    print(
+        f"Opening index saved: {index_dir}, {len(games)} new games, "
+        f"{first_node} nodes"
+    )
+    return len(indexed)
+
+
+class OpeningIndex:
+    """
+    A read-only view of the opening tree of a user. The arrays are
+    memory-mapped and a move sequence is found with one binary search
+    per move, so a query costs O(depth) whatever the number of games.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+    """
+
+    def __init__(self, username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+        index_dir = opening_index_dir(username, output_dir)
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.depth = meta["depth"]
+        self.vocabulary = meta["vocabulary"]
+        self.time_classes = meta["time_classes"]
+        self.move_ids = {san: i for i, san in enumerate(self.vocabulary)}
+        self.parent = np.load(os.path.join(index_dir, "parent.npy"), mmap_mode="r")
+        self.move = np.load(os.path.join(index_dir, "move.npy"), mmap_mode="r")
+        self.counts = np.load(os.path.join(index_dir, "counts.npy"), mmap_mode="r")
+
+    def children(self, node: int):
+        """
+        It returns the range of the children of a node.
+        """
+        return (
+            int(np.searchsorted(self.parent, node, side="left")),
+            int(np.searchsorted(self.parent, node, side="right")),
+        )
+
+    def find(self, moves: list):
+        """
+        It finds the node reached by a sequence of SAN moves.
+
+        Args:
+            moves (list): The moves from the starting position.
+
+        Returns:
+            int/None: The node, or None if no game of the index
+            started with these moves.
+        """
+        node = 0
+        for san in moves:
+            if san not in self.move_ids:
+                return None
+            first, last = self.children(node)
+            child = first + int(
+                np.searchsorted(self.move[first:last], self.move_ids[san])
+            )
+            if child == last or self.move[child] != self.move_ids[san]:
+                return None
+            node = child
+        return node
+
+    def node_stats(self, node: int, color: str = None, time_class: str = None):
+        """
+        It sums the results of a node for a color and a time class.
+        """
+        counts = self.counts[node]
+        if color is not None:
+            counts = counts[[COLORS.index(color)]]
+        if time_class is not None:
+            if time_class not in self.time_classes:
+                counts = counts[:, :0]
+            else:
+                counts = counts[:, [self.time_classes.index(time_class)]]
+        wins, draws, losses = (int(n) for n in counts.sum(axis=(0, 1)))
+        return {
+            "games": wins + draws + losses,
+            "wins": wins,
+            "draws": draws,
+            "losses": losses,
+        }
+
+    def stats(self, moves: list, color: str = None, time_class: str = None):
+        """
+        It gives the results of the player after a sequence of moves.
+
+        Args:
+            moves (list): The SAN moves from the starting position,
+            at most the depth of the index.
+            color (str): "white" or "black". If None, both colors.
+            time_class (str): A time class like "blitz". If None, all
+            the time classes.
+
+        Returns:
+            dict: The number of games, wins, draws and losses.
+        """
+        node = self.find(moves)
+        if node is None:
+            return {"games": 0, "wins": 0, "draws": 0, "losses": 0}
+        return self.node_stats(node, color, time_class)
+
+    def continuations(self, moves: list, color: str = None, time_class: str = None):
+        """
+        It gives the results of every move played after a sequence of
+        moves, the most played first.
+
+        Args:
+            moves (list): The SAN moves from the starting position.
+            color (str): "white" or "black". If None, both colors.
+            time_class (str): A time class like "blitz". If None, all
+            the time classes.
+
+        Returns:
+            pd.DataFrame: One row per next move with its number of
+            games, wins, draws and losses.
+        """
+        node = self.find(moves)
+        rows = []
+        if node is not None:
+            first, last = self.children(node)
+            for child in range(first, last):
+                row = self.node_stats(child, color, time_class)
+                if row["games"]:
+                    rows.append({"move": self.vocabulary[self.move[child]], **row})
+        columns = ["move", "games", "wins", "draws", "losses"]
+        df = pd.DataFrame(rows, columns=columns)
+        return df.sort_values("games", ascending=False, ignore_index=True)
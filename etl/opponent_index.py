@@ -0,0 +1,522 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from game_store import save_array
+from games_storage import games_dirpath, iter_partitions, read_partition
+
+OPPONENT_INDEX_SUFFIX = "_opponents"
+OPPONENT_COLUMNS = [
+    "game_id",
+    "date",
+    "time_class",
+    "player_result",
+    "player_rating",
+    "opponent_username",
+    "opponent_rating",
+]
+RESULTS = ["win", "draw", "loss"]
+DIFFERENCE_STEP = 50  # width of the rating difference brackets
+DIFFERENCE_LIMIT = 400  # the larger differences are in the two outer brackets
+NO_DIFFERENCE = np.iinfo(np.int16).min  # a game without both ratings
+NO_DAY = np.iinfo(np.int32).min  # a game without a date
+TOP_OPPONENTS = 100  # the most played opponents, answered without a search
+ROW_ARRAYS = [
+    "opponent",
+    "game_id",
+    "day",
+    "month",
+    "time_class",
+    "result",
+    "difference",
+]
+
+
+def opponent_index_dir(output_dir: str, username: str):
+    """
+    It builds the path of the opponent index of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The directory of the opponent index.
+    """
+    return os.path.join(output_dir, username, f"{username}{OPPONENT_INDEX_SUFFIX}")
+
+
+def opponent_meta_filepath(output_dir: str, username: str):
+    """
+    It builds the path of the meta.json of the opponent index, written
+    last, so the index is complete when it exists.
+    """
+    return os.path.join(opponent_index_dir(output_dir, username), "meta.json")
+
+
+def month_key(year: int, month: int):
+    """
+    It gives the int key of a month, 0 for the games without a date
+    (the UNDATED partition).
+    """
+    return year * 100 + month
+
+
+def difference_brackets(step: int = DIFFERENCE_STEP, limit: int = DIFFERENCE_LIMIT):
+    """
+    It names the brackets of the rating difference (opponent rating
+    minus player rating): one bracket below -limit, one bracket per
+    `step` points from -limit to +limit, and one bracket from +limit.
+
+    Returns:
+        list: The names of the brackets, in order.
+    """
+    starts = range(-limit, limit, step)
+    return (
+        [f"< {-limit}"]
+        + [f"{start:+d} to {start + step - 1:+d}" for start in starts]
+        + [f">= {limit:+d}"]
+    )
+
+
+def game_rows(games: pd.DataFrame, time_classes: dict):
+    """
+    It converts the games of one month to the rows of the index. The
+    opponents are identified by their lowercase username, since the
+    chess.com usernames are case-insensitive.
+
+    Args:
+        games (pd.DataFrame): The games, with the OPPONENT_COLUMNS.
+        time_classes (dict): The number of each time class, completed
+        with the new ones.
+
+    Returns:
+        tuple: The sorted keys of the opponents, their display names
+        and a dict of the row arrays, with the opponent as an index in
+        the keys.
+    """
+    games = games[
+        games["player_result"].isin(RESULTS)
+        & games["opponent_username"].notna()
+        & games["time_class"].notna()
+    ]
+    codes, names = pd.factorize(games["opponent_username"])
+    names = np.asarray(names, dtype=str)
+    keys, name_keys = np.unique(np.char.lower(names), return_inverse=True)
+    display_names = np.empty(len(keys), dtype=names.dtype)
+    display_names[name_keys] = names
+    class_codes, class_names = pd.factorize(games["time_class"])
+    for name in class_names:
+        time_classes.setdefault(str(name), len(time_classes))
+    result_codes, result_names = pd.factorize(games["player_result"])
+
+    dates = games["date"]
+    has_date = dates.notna().to_numpy()
+    days = np.full(len(games), NO_DAY, dtype=np.int32)
+    days[has_date] = dates[has_date].to_numpy().astype("datetime64[D]").astype(np.int64)
+    months = np.zeros(len(games), dtype=np.int32)
+    months[has_date] = month_key(
+        dates[has_date].dt.year.to_numpy(), dates[has_date].dt.month.to_numpy()
+    )
+    differences = games["opponent_rating"].astype("float64") - games[
+        "player_rating"
+    ].astype("float64")
+    rows = {
+        "opponent": name_keys[codes].astype(np.int32),
+        "game_id": games["game_id"].to_numpy(dtype=np.int64),
+        "day": days,
+        "month": months,
+        "time_class": np.array(
+            [time_classes[str(name)] for name in class_names], dtype=np.uint8
+        )[class_codes],
+        "result": np.array(
+            [RESULTS.index(str(name)) for name in result_names], dtype=np.uint8
+        )[result_codes],
+        "difference": np.nan_to_num(
+            differences.clip(NO_DIFFERENCE + 1, -NO_DIFFERENCE - 1).to_numpy(),
+            nan=NO_DIFFERENCE,
+        ),
+    }
+    rows["difference"] = rows["difference"].astype(np.int16)
+    return keys, display_names, rows
+
+
+def merge_rows(parts: list):
+    """
+    It merges the rows of several parts, each with its own sorted keys
+    of the opponents, into rows numbered by the union of the keys. The
+    opponents without any row left are dropped.
+
+    Args:
+        parts (list): The (keys, names, rows) of each part, the latest
+        last, whose names are kept.
+
+    Returns:
+        tuple: The sorted keys, their names and the merged rows.
+    """
+    keys = np.unique(np.concatenate([part[0] for part in parts]))
+    names = np.empty(len(keys), dtype=object)
+    merged = {name: [] for name in ROW_ARRAYS}
+    for part_keys, part_names, rows in parts:
+        numbers = np.searchsorted(keys, part_keys)
+        names[numbers] = part_names
+        for name in ROW_ARRAYS:
+            merged[name].append(
+                numbers[rows[name]] if name == "opponent" else rows[name]
+            )
+    rows = {name: np.concatenate(values) for name, values in merged.items()}
+    used = np.bincount(rows["opponent"], minlength=len(keys)) > 0
+    renumbered = np.cumsum(used) - 1
+    rows["opponent"] = renumbered[rows["opponent"]].astype(np.int32)
+    return keys[used], names[used].astype(str), rows
+
+
+def write_opponent_index(output_dir: str, username: str, months: list = None):
+    """
+    It builds the opponent index of a user from a few columns of the
+    dataset. The games are stored as rows grouped by opponent (CSR),
+    the latest last, and the results are pre-aggregated, so the record
+    against an opponent, their games and the results by rating
+    difference are read without scanning the games. It is stored as
+    flat arrays that np.load can memory-map:
+
+    - keys.npy and names.npy: the lowercase usernames of the opponents,
+      sorted for the prefix search, and their usernames as written in
+      their latest game,
+    - offsets.npy: the first row of each opponent, and the number of
+      rows at the end,
+    - row_<name>.npy: the game id, day, month, time class, result and
+      rating difference of each row,
+    - counts.npy: the wins, draws and losses of each opponent, shaped
+      (opponents, time class, result),
+    - difference_sums.npy and rated_games.npy: the sum of the rating
+      differences and the number of games with both ratings of each
+      opponent and time class,
+    - brackets.npy: the results of all the games by bracket of rating
+      difference, shaped (time class, bracket, result),
+    - top.npy: the most played opponents.
+
+    When the changed months are given, only their games are read: the
+    rows of these months are replaced by their current games and the
+    aggregates are computed again from the rows, which costs a few
+    array operations per game, without reading the other months.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+        months (list): If given, the (year, month) pairs of the months
+        changed since the index was written.
+
+    Returns:
+        int: The number of games in the index.
+    """
+    index_dir = opponent_index_dir(output_dir, username)
+    meta_filepath = opponent_meta_filepath(output_dir, username)
+    dataset_dir = games_dirpath(output_dir, username)
+    meta = None
+    if months is not None and os.path.exists(meta_filepath):
+        with open(meta_filepath, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta["difference_step"], meta["difference_limit"]) != (
+            DIFFERENCE_STEP,
+            DIFFERENCE_LIMIT,
+        ):
+            meta = None
+    parts = []
+    if meta is None:
+        meta = {"time_classes": []}
+        frames = iter_partitions(dataset_dir, OPPONENT_COLUMNS)
+    else:
+        rows = {
+            name: np.load(os.path.join(index_dir, f"row_{name}.npy"))
+            for name in ROW_ARRAYS
+        }
+        # the rows of the changed months are replaced by their games
+        kept = ~np.isin(rows["month"], [month_key(*key) for key in months])
+        parts.append(
+            (
+                np.load(os.path.join(index_dir, "keys.npy")),
+                np.load(os.path.join(index_dir, "names.npy")),
+                {name: values[kept] for name, values in rows.items()},
+            )
+        )
+        frames = (
+            read_partition(dataset_dir, *key, OPPONENT_COLUMNS)
+            for key in sorted(months)
+        )
+    time_classes = {name: i for i, name in enumerate(meta["time_classes"])}
+    for games in frames:
+        if games is not None:
+            parts.append(game_rows(games, time_classes))
+    if not parts:
+        parts.append(
+            (
+                np.array([], dtype=str),
+                np.array([], dtype=str),
+                {name: np.array([], dtype=np.int32) for name in ROW_ARRAYS},
+            )
+        )
+    keys, names, rows = merge_rows(parts)
+
+    order = np.lexsort((rows["game_id"], rows["day"], rows["opponent"]))
+    rows = {name: values[order] for name, values in rows.items()}
+    number_opponents, number_classes = len(keys), len(time_classes)
+    brackets = difference_brackets()
+    games_by_opponent = np.bincount(rows["opponent"], minlength=number_opponents)
+    offsets = np.zeros(number_opponents + 1, dtype=np.int64)
+    np.cumsum(games_by_opponent, out=offsets[1:])
+    cells = (
+        rows["opponent"].astype(np.int64) * number_classes + rows["time_class"]
+    ) * len(RESULTS) + rows["result"]
+    counts = np.bincount(
+        cells, minlength=number_opponents * number_classes * len(RESULTS)
+    ).reshape(number_opponents, number_classes, len(RESULTS))
+    rated = rows["difference"] != NO_DIFFERENCE
+    opponent_classes = (
+        rows["opponent"].astype(np.int64) * number_classes + rows["time_class"]
+    )[rated]
+    difference_sums = np.bincount(
+        opponent_classes,
+        weights=rows["difference"][rated],
+        minlength=number_opponents * number_classes,
+    ).reshape(number_opponents, number_classes)
+    rated_games = np.bincount(
+        opponent_classes, minlength=number_opponents * number_classes
+    ).reshape(number_opponents, number_classes)
+    bracket = np.clip(
+        (rows["difference"][rated].astype(np.int64) + DIFFERENCE_LIMIT)
+        // DIFFERENCE_STEP
+        + 1,
+        0,
+        len(brackets) - 1,
+    )
+    bracket_cells = (
+        rows["time_class"][rated].astype(np.int64) * len(brackets) + bracket
+    ) * len(RESULTS) + rows["result"][rated]
+    bracket_counts = np.bincount(
+        bracket_cells, minlength=number_classes * len(brackets) * len(RESULTS)
+    ).reshape(number_classes, len(brackets), len(RESULTS))
+    top = np.lexsort((keys, -games_by_opponent))[:TOP_OPPONENTS]
+
+    # each array is renamed into place, the dashboard may have it mapped
+    os.makedirs(index_dir, exist_ok=True)
+    if os.path.exists(meta_filepath):
+        os.remove(meta_filepath)
+    arrays = {
+        "keys": keys,
+        "names": names,
+        "offsets": offsets,
+        **{f"row_{name}": rows[name] for name in ROW_ARRAYS},
+        "counts": counts.astype(np.int32),
+        "difference_sums": difference_sums,
+        "rated_games": rated_games.astype(np.int32),
+        "brackets": bracket_counts.astype(np.int32),
+        "top": top.astype(np.int32),
+    }
+    for name, array in arrays.items():
+        save_array(os.path.join(index_dir, f"{name}.npy"), array)
+    meta = {
+        "time_classes": list(time_classes),
+        "difference_step": DIFFERENCE_STEP,
+        "difference_limit": DIFFERENCE_LIMIT,
+        "brackets": brackets,
+        "games": int(offsets[-1]),
+        "opponents": number_opponents,
+    }
+    with open(f"{meta_filepath}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_filepath}.tmp", meta_filepath)
+    return meta["games"]
+
+
+class OpponentIndex:
+    """
+    A read-only view of the opponent index of a user. The arrays are
+    memory-mapped: an opponent is found with a binary search of their
+    username, their record and games are slices of the arrays, and the
+    results by rating difference are pre-aggregated, so a query costs
+    the same whatever the number of games.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+    """
+
+    def __init__(self, username: str, output_dir: str):
+        index_dir = opponent_index_dir(output_dir, username)
+        with open(
+            opponent_meta_filepath(output_dir, username), "r", encoding="utf-8"
+        ) as f:
+            meta = json.load(f)
+        self.time_classes = meta["time_classes"]
+        self.brackets = meta["brackets"]
+        self.games = meta["games"]
+
+        def load(name: str):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.keys = load("keys")
+        self.names = load("names")
+        self.offsets = load("offsets")
+        self.rows = {name: load(f"row_{name}") for name in ROW_ARRAYS}
+        self.counts = load("counts")
+        self.difference_sums = load("difference_sums")
+        self.rated_games = load("rated_games")
+        self.bracket_counts = load("brackets")
+        self.top = load("top")
+
+    def class_number(self, time_class: str = None):
+        """
+        It gives the slice of the time classes of a query: all of them,
+        one of them, or none for a time class without games.
+        """
+        if time_class is None:
+            return slice(None)
+        if time_class not in self.time_classes:
+            return slice(0, 0)
+        number = self.time_classes.index(time_class)
+        return slice(number, number + 1)
+
+    def find(self, username: str):
+        """
+        It finds the number of an opponent from their username, in any
+        case.
+
+        Returns:
+            int/None: The opponent, or None if the player never met them.
+        """
+        key = username.strip().lower()
+        number = int(np.searchsorted(self.keys, key))
+        if number < len(self.keys) and self.keys[number] == key:
+            return number
+        return None
+
+    def search(self, prefix: str, limit: int = 10):
+        """
+        It finds the opponents whose username starts with a prefix, in
+        any case, the most played first. The opponents of the prefix
+        are contiguous in the sorted keys and are found with two binary
+        searches; an empty prefix gives the most played opponents.
+
+        Args:
+            prefix (str): The first letters of the username.
+            limit (int): The maximum number of opponents.
+
+        Returns:
+            pd.DataFrame: One row per opponent with their username and
+            number of games.
+        """
+        prefix = prefix.strip().lower()
+        if prefix:
+            first = int(np.searchsorted(self.keys, prefix, side="left"))
+            last = int(np.searchsorted(self.keys, prefix + "\U0010ffff", side="left"))
+            numbers = np.arange(first, last)
+            games = self.offsets[numbers + 1] - self.offsets[numbers]
+            numbers = numbers[np.argsort(-games, kind="stable")][:limit]
+        else:
+            numbers = np.asarray(self.top[:limit], dtype=np.int64)
+        return pd.DataFrame(
+            {
+                "opponent": self.names[numbers].astype(str),
+                "games": (self.offsets[numbers + 1] - self.offsets[numbers]).astype(
+                    np.int64
+                ),
+            }
+        )
+
+    def record(self, username: str, time_class: str = None):
+        """
+        It gives the record of the player against an opponent.
+
+        Args:
+            username (str): The username of the opponent, in any case.
+            time_class (str): A time class like "blitz". If None, all
+            the time classes.
+
+        Returns:
+            dict: The number of games, wins, draws and losses, and the
+            average rating difference (opponent minus player, None
+            without rated games).
+        """
+        number = self.find(username)
+        if number is None:
+            wins = draws = losses = 0
+            difference = None
+        else:
+            classes = self.class_number(time_class)
+            wins, draws, losses = (
+                int(n) for n in self.counts[number, classes].sum(axis=0)
+            )
+            rated = int(self.rated_games[number, classes].sum())
+            difference = (
+                round(float(self.difference_sums[number, classes].sum()) / rated)
+                if rated
+                else None
+            )
+        return {
+            "games": wins + draws + losses,
+            "wins": wins,
+            "draws": draws,
+            "losses": losses,
+            "average_difference": difference,
+        }
+
+    def opponent_games(self, username: str, last: int = None):
+        """
+        It gives the games of the player against an opponent, the
+        latest first.
+
+        Args:
+            username (str): The username of the opponent, in any case.
+            last (int): If given, only the latest `last` games.
+
+        Returns:
+            pd.DataFrame: The game_id, date, time_class, player_result
+            and rating_difference of each game.
+        """
+        number = self.find(username)
+        first, end = (
+            (0, 0)
+            if number is None
+            else (int(self.offsets[number]), int(self.offsets[number + 1]))
+        )
+        if last is not None:
+            first = max(first, end - last)
+        rows = {
+            name: np.asarray(values[first:end])[::-1]
+            for name, values in self.rows.items()
+        }
+        dated = rows["day"] != NO_DAY
+        days = np.where(dated, rows["day"], 0).astype("datetime64[D]")
+        differences = pd.array(rows["difference"], dtype="Int16")
+        differences[rows["difference"] == NO_DIFFERENCE] = pd.NA
+        return pd.DataFrame(
+            {
+                "game_id": rows["game_id"],
+                "date": pd.Series(days.astype("datetime64[ns]")).where(dated),
+                "time_class": [self.time_classes[n] for n in rows["time_class"]],
+                "player_result": [RESULTS[n] for n in rows["result"]],
+                "rating_difference": differences,
+            }
+        )
+
+    def results_by_difference(self, time_class: str = None):
+        """
+        It gives the results of the player by bracket of rating
+        difference (opponent rating minus player rating).
+
+        Args:
+            time_class (str): A time class like "blitz". If None, all
+            the time classes.
+
+        Returns:
+            pd.DataFrame: One row per bracket with its number of games,
+            wins, draws and losses.
+        """
+        counts = self.bracket_counts[self.class_number(time_class)].sum(axis=0)
+        df = pd.DataFrame(counts, columns=["wins", "draws", "losses"])
+        df.insert(0, "games", df.sum(axis=1))
+        df.insert(0, "bracket", self.brackets)
+        return df
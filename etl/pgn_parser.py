@@ -0,0 +1,482 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+from game_store import read_raw_games, save_array
+from raw_archives import INDEX_SUFFIX, RAW_SUFFIX, is_raw_archive, iter_games
+
+JSON_DATA_DIR = "data/json"
+TRANSFORMED_DATA_DIR = "data/transformed"
+# a SAN move with its check sign, followed by its optional clock comment
+MOVE_PATTERN = re.compile(
+    r"([NBRQK]?[a-h]?[1-8]?x?[a-h][1-8](?:=[NBRQ])?[+#]?|O-O-O[+#]?|O-O[+#]?)"
+    r"(?:\s*\{\[%clk (\d+):(\d+):(\d+(?:\.\d+)?)\]\})?"
+)
+NO_CLOCK = -1
+OPENING_PLIES = 20  # the first 10 moves of each side
+MIDDLEGAME_PLIES = 60
+TIME_TROUBLE_RATIO = 0.1
+PGN_SCHEMA = pa.schema(
+    [
+        ("url", pa.string()),
+        ("pgn", pa.string()),
+        ("time_control", pa.string()),
+        ("white", pa.struct([("username", pa.string())])),
+    ]
+)
+FEATURE_COLUMNS = [
+    "ply_count",
+    "time_used_opening",
+    "time_used_middlegame",
+    "time_used_endgame",
+    "min_clock",
+    "time_trouble",
+]
+
+
+def parse_movetext(pgn: str):
+    """
+    It reads the moves and the %clk annotations of a PGN.
+
+    Args:
+        pgn (str): The PGN of the game, with or without its headers.
+
+    Returns:
+        tuple: The SAN moves and, for each move, the hours, minutes and
+        seconds of its clock as strings (empty when there is no clock).
+    """
+    headers_end = pgn.find("\n\n")
+    movetext = pgn[headers_end + 2 :] if headers_end >= 0 else pgn
+    found = MOVE_PATTERN.findall(movetext)
+    if not found:
+        return (), (), (), ()
+    return tuple(zip(*found))
+
+
+def clocks_to_deciseconds(hours: list, minutes: list, seconds: list):
+    """
+    It converts the clock strings read by parse_movetext into tenths
+    of a second, all at once.
+
+    Args:
+        hours (list): The hours of each clock.
+        minutes (list): The minutes of each clock.
+        seconds (list): The seconds of each clock, maybe with decimals.
+
+    Returns:
+        np.ndarray: The int32 clocks, NO_CLOCK where there is no clock.
+    """
+    hours = np.array(hours, dtype=object)
+    missing = hours == ""
+    if missing.all():
+        return np.full(len(hours), NO_CLOCK, dtype=np.int32)
+    hours[missing] = "0"
+    minutes = np.array(minutes, dtype=object)
+    minutes[missing] = "0"
+    seconds = np.array(seconds, dtype=object)
+    seconds[missing] = "0"
+    clocks = (
+        hours.astype(np.int64) * 36000
+        + minutes.astype(np.int64) * 600
+        + np.round(seconds.astype(np.float64) * 10).astype(np.int64)
+    )
+    clocks[missing] = NO_CLOCK
+    return clocks.astype(np.int32)
+
+
+def parse_time_control(time_control: str):
+    """
+    It reads a Chess.com time control like "180+2".
+
+    Args:
+        time_control (str): The time control of the game.
+
+    Returns:
+        tuple: The base time and the increment in tenths of a second,
+        or (None, None) for daily games and unknown formats.
+    """
+    if not time_control or "/" in time_control:
+        return None, None
+    base, _, increment = time_control.partition("+")
+    try:
+        return int(base) * 10, int(increment or 0) * 10
+    except ValueError:
+        return None, None
+
+
+def clock_features(
+    clocks: np.ndarray,
+    offsets: np.ndarray,
+    player_is_white: np.ndarray,
+    bases: np.ndarray,
+    increments: np.ndarray,
+):
+    """
+    It computes the clock features of many games at once, from the
+    player's side: the time used in the opening (first OPENING_PLIES
+    plies), the middlegame (up to MIDDLEGAME_PLIES) and the endgame,
+    the lowest clock, and whether the player got in time trouble, with
+    less than TIME_TROUBLE_RATIO of the base time left. Every ply of
+    every game is handled by the same numpy operations.
+
+    Args:
+        clocks (np.ndarray): The clocks after each ply of all the games,
+        in tenths of a second.
+        offsets (np.ndarray): Where the plies of each game start in
+        `clocks`, with the total number of plies at the end.
+        player_is_white (np.ndarray): True where the player had white.
+        bases (np.ndarray): The base time of each game in tenths of a
+        second, NaN when unknown (daily games).
+        increments (np.ndarray): The increment of each game.
+
+    Returns:
+        dict: The time used per phase and the lowest clock in seconds
+        (NaN when unknown), and the time trouble flags, per game.
+    """
+    number_games = len(offsets) - 1
+    lengths = np.diff(offsets)
+    game = np.repeat(np.arange(number_games), lengths)
+    ply = np.arange(len(clocks)) - offsets[:-1][game]
+    player_ply = (ply % 2 == 0) == player_is_white[game]
+    previous = np.empty(len(clocks), dtype=np.float64)
+    previous[2:] = clocks[:-2]
+    previous[ply < 2] = bases[game[ply < 2]]  # the clock before the first move
+    used = np.maximum(previous - clocks + increments[game], 0) / 10
+    known = ~np.isnan(bases) & (
+        np.bincount(game, weights=clocks < 0, minlength=number_games) == 0
+    )
+    known &= np.bincount(game, weights=player_ply, minlength=number_games) > 0
+    features = {}
+    for column, phase in [
+        ("time_used_opening", ply < OPENING_PLIES),
+        ("time_used_middlegame", (ply >= OPENING_PLIES) & (ply < MIDDLEGAME_PLIES)),
+        ("time_used_endgame", ply >= MIDDLEGAME_PLIES),
+    ]:
+        mask = player_ply & phase
+        features[column] = np.where(
+            known,
+            np.bincount(game[mask], weights=used[mask], minlength=number_games),
+            np.nan,
+        )
+    min_clock = np.full(number_games, np.inf)
+    np.minimum.at(min_clock, game[player_ply], clocks[player_ply])
+    features["min_clock"] = np.where(known, min_clock / 10, np.nan)
+    features["time_trouble"] = known & (min_clock < TIME_TROUBLE_RATIO * bases)
+    return features
+
+
+def read_pgn_table(filepath: str):
+    """
+    It reads the url, pgn, time control and white player of the games
+    of a raw monthly file, or of the games of an index file from the
+    shared game store.
+
+    Args:
+        filepath (str): The raw monthly file.
+
+    Returns:
+        pa.Table: The columns of PGN_SCHEMA.
+    """
+    if filepath.endswith(INDEX_SUFFIX):
+        return read_raw_games(filepath, PGN_SCHEMA)
+    if filepath.endswith(RAW_SUFFIX):
+        return pa_json.read_json(
+            filepath,
+            parse_options=pa_json.ParseOptions(
+                explicit_schema=PGN_SCHEMA, unexpected_field_behavior="ignore"
+            ),
+        )
+    return pa.Table.from_pylist(list(iter_games(filepath)), schema=PGN_SCHEMA)
+
+
+def parse_archive(filepath: str, username: str):
+    """
+    It parses the PGN of every game of a raw monthly file. This is the
+    unit of work of the worker processes: the moves are encoded with a
+    vocabulary local to the file, which build_move_store merges later.
+
+    Args:
+        filepath (str): The raw monthly file.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        dict: The arrays of the file (game_id, offsets, moves, clocks
+        and the FEATURE_COLUMNS) and its local vocabulary.
+    """
+    table = read_pgn_table(filepath)
+    username = username.lower()
+    vocabulary = {}
+    game_ids, lengths, moves = [], [], []
+    hours, minutes, seconds = [], [], []
+    player_is_white, bases, increments = [], [], []
+    for url, pgn, time_control, white in zip(
+        table.column("url").to_pylist(),
+        table.column("pgn").to_pylist(),
+        table.column("time_control").to_pylist(),
+        table.column("white").to_pylist(),
+    ):
+        if not url:
+            continue
+        game_moves, game_hours, game_minutes, game_seconds = parse_movetext(pgn or "")
+        game_ids.append(int(url.rsplit("/", 1)[-1]))
+        lengths.append(len(game_moves))
+        moves.extend(
+            [vocabulary.setdefault(san, len(vocabulary)) for san in game_moves]
+        )
+        hours.extend(game_hours)
+        minutes.extend(game_minutes)
+        seconds.extend(game_seconds)
+        player_is_white.append(
+            bool(white) and (white["username"] or "").lower() == username
+        )
+        base, increment = parse_time_control(time_control)
+        bases.append(np.nan if base is None else base)
+        increments.append(increment or 0)
+    if len(vocabulary) > np.iinfo(np.uint16).max:
+        raise ValueError(f"Too many distinct moves in {filepath}")
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    clocks = clocks_to_deciseconds(hours, minutes, seconds)
+    features = clock_features(
+        clocks,
+        offsets,
+        np.array(player_is_white, dtype=bool),
+        np.array(bases, dtype=np.float64),
+        np.array(increments, dtype=np.float64),
+    )
+    return {
+        "game_id": np.array(game_ids, dtype=np.int64),
+        "offsets": offsets,
+        "moves": np.array(moves, dtype=np.uint16),
+        "clocks": clocks,
+        "vocabulary": list(vocabulary),
+        "ply_count": np.array(lengths, dtype=np.int16),
+        **features,
+    }
+
+
+def move_store_dir(username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+    """
+    It builds the path of the move store of a user.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+
+    Returns:
+        str: The directory of the move store.
+    """
+    return os.path.join(output_dir, username, f"{username}_moves")
+
+
+def build_move_store(
+    username: str,
+    raw_dir: str = JSON_DATA_DIR,
+    output_dir: str = TRANSFORMED_DATA_DIR,
+    workers: int = None,
+):
+    """
+    It parses the moves and clocks of all the games of a user and
+    stores them next to the transformed games in a compact layout:
+
+    - moves.npy: the moves of all the games, one uint16 per ply, which
+      indexes vocabulary.json (the distinct SAN moves),
+    - clocks.npy: the clock after each ply, one int32 in tenths of a
+      second (-1 if unknown),
+    - offsets.npy: where the plies of each game start in these arrays,
+    - game_id.npy: the int64 id of each game.
+
+    An average game takes about 6 bytes per ply, so millions of games
+    fit in memory, and the arrays can be memory-mapped by np.load.
+    The derived per-game columns (ply count, time used per phase,
+    lowest clock and time trouble flag) are saved in
+    {username}_pgn_features.parquet.
+
+    The raw files are parsed in parallel by a pool of processes. Each
+    parsed month is kept in the months/ folder and only parsed again
+    when its raw file changes.
+
+    Args:
+        username (str): The chess.com username of the player.
+        raw_dir (str): The directory of the raw data.
+        output_dir (str): The directory of the transformed data.
+        workers (int): The number of processes. Defaults to the number
+        of CPUs, and 1 parses the files in the current process.
+
+    Returns:
+        int: The number of games in the store.
+    """
+    user_raw_dir = os.path.join(raw_dir, username)
+    store_dir = move_store_dir(username, output_dir)
+    months_dir = os.path.join(store_dir, "months")
+    os.makedirs(months_dir, exist_ok=True)
+    manifest_path = os.path.join(months_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    raw_files = {}
+    for file in sorted(os.listdir(user_raw_dir)):
+        filepath = os.path.join(user_raw_dir, file)
+        if is_raw_archive(file) and os.path.isfile(filepath):
+            stat = os.stat(filepath)
+            raw_files[file] = [stat.st_size, stat.st_mtime]
+    to_parse = [file for file, stat in raw_files.items() if manifest.get(file) != stat]
+    if to_parse:
+        filepaths = [os.path.join(user_raw_dir, file) for file in to_parse]
+        executor = None
+        if workers != 1 and len(to_parse) > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            parsed = (executor.map if executor else map)(
+                parse_archive, filepaths, [username] * len(to_parse)
+            )
+            for file, month in zip(to_parse, parsed):
+                print(f"Parsing PGN: {file}, {len(month['game_id'])} games")
+                vocabulary = month.pop("vocabulary")
+                np.savez(
+                    os.path.join(months_dir, f"{file}.npz"),
+                    vocabulary=np.array(vocabulary, dtype=str),
+                    **month,
+                )
+                manifest[file] = raw_files[file]
+        finally:
+            if executor:
+                executor.shutdown()
+    deleted = [file for file in manifest if file not in raw_files]
+    for file in deleted:
+        os.remove(os.path.join(months_dir, f"{file}.npz"))
+        del manifest[file]
+    if (
+        not to_parse
+        and not deleted
+        and os.path.exists(os.path.join(store_dir, "vocabulary.json"))
+    ):
+        print(f"Move store: {store_dir} is up to date")
+        return len(np.load(os.path.join(store_dir, "game_id.npy"), mmap_mode="r"))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return consolidate_move_store(username, output_dir, sorted(manifest))
+
+
+def consolidate_move_store(username: str, output_dir: str, files: list):
+    """
+    It merges the parsed months of a user into the arrays of the move
+    store. The local vocabularies of the months are merged into one,
+    and the moves are re-encoded with a single numpy lookup per month.
+    A game present in several months (never in practice) is kept once.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+        files (list): The raw file names of the parsed months.
+
+    Returns:
+        int: The number of games in the store.
+    """
+    store_dir = move_store_dir(username, output_dir)
+    vocabulary = {}
+    game_ids, lengths, moves, clocks = [], [], [], []
+    features = {column: [] for column in FEATURE_COLUMNS}
+    for file in files:
+        with np.load(os.path.join(store_dir, "months", f"{file}.npz")) as month:
+            remap = np.array(
+                [
+                    vocabulary.setdefault(san, len(vocabulary))
+                    for san in month["vocabulary"]
+                ],
+                dtype=np.uint16,
+            )
+            game_ids.append(month["game_id"])
+            lengths.append(np.diff(month["offsets"]))
+            moves.append(remap[month["moves"]] if len(remap) else month["moves"])
+            clocks.append(month["clocks"])
+            for column in FEATURE_COLUMNS:
+                features[column].append(month[column])
+    if not game_ids:
+        return 0
+    game_ids = np.concatenate(game_ids)
+    offsets = np.concatenate(([0], np.cumsum(np.concatenate(lengths))))
+    # each file is renamed into place, the dashboard may have the store open
+    save_array(os.path.join(store_dir, "game_id.npy"), game_ids)
+    save_array(os.path.join(store_dir, "offsets.npy"), offsets.astype(np.int64))
+    save_array(os.path.join(store_dir, "moves.npy"), np.concatenate(moves))
+    save_array(os.path.join(store_dir, "clocks.npy"), np.concatenate(clocks))
+    vocabulary_filepath = os.path.join(store_dir, "vocabulary.json")
+    with open(f"{vocabulary_filepath}.tmp", "w", encoding="utf-8") as f:
+        json.dump(list(vocabulary), f)
+    os.replace(f"{vocabulary_filepath}.tmp", vocabulary_filepath)
+    features_df = pd.DataFrame(
+        {
+            "game_id": game_ids.astype(np.int64),
+            **{column: np.concatenate(values) for column, values in features.items()},
+        }
+    ).drop_duplicates(subset="game_id", keep="last")
+    features_df["ply_count"] = features_df["ply_count"].astype(np.int16)
+    features_df["time_trouble"] = features_df["time_trouble"].astype(bool)
+    features_filepath = os.path.join(
+        output_dir, username, f"{username}_pgn_features.parquet"
+    )
+    features_df.to_parquet(f"{features_filepath}.tmp", index=False)
+    os.replace(f"{features_filepath}.tmp", features_filepath)
+    print(f"Move store saved: {store_dir}, {len(game_ids)} games")
+    return len(game_ids)
+
+
+class MoveStore:
+    """
+    A read-only view of the move store of a user. The arrays are
+    memory-mapped, so opening the store costs almost nothing and only
+    the games that are read are loaded from disk.
+
+    Args:
+        username (str): The chess.com username of the player.
+        output_dir (str): The directory of the transformed data.
+    """
+
+    def __init__(self, username: str, output_dir: str = TRANSFORMED_DATA_DIR):
+        store_dir = move_store_dir(username, output_dir)
+        self.game_ids = np.load(os.path.join(store_dir, "game_id.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode="r")
+        self.moves = np.load(os.path.join(store_dir, "moves.npy"), mmap_mode="r")
+        self.clocks = np.load(os.path.join(store_dir, "clocks.npy"), mmap_mode="r")
+        with open(
+            os.path.join(store_dir, "vocabulary.json"), "r", encoding="utf-8"
+        ) as f:
+            self.vocabulary = json.load(f)
+        self.move_ids = {san: i for i, san in enumerate(self.vocabulary)}
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    def game_moves(self, index: int):
+        """
+        It returns the moves of the game at `index` as encoded ids.
+        """
+        return self.moves[self.offsets[index] : self.offsets[index + 1]]
+
+    def game_clocks(self, index: int):
+        """
+        It returns the clocks of the game at `index`, in tenths of a second.
+        """
+        return self.clocks[self.offsets[index] : self.offsets[index + 1]]
+
+    def game_san(self, index: int):
+        """
+        It returns the moves of the game at `index` in SAN.
+        """
+        return [self.vocabulary[move] for move in self.game_moves(index)]
+
+    def nbytes(self):
+        """
+        It returns the size of the arrays of the store in bytes.
+        """
+        return sum(
+            array.nbytes
+            for array in [self.game_ids, self.offsets, self.moves, self.clocks]
+        )
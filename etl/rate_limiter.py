@@ -0,0 +1,80 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket shared by every thread that calls the
+    Chess.com API. Each request takes one token, tokens are refilled at
+    `rate` per second and at most `capacity` tokens can be stored, so
+    short bursts are allowed but the average request rate stays bounded.
+
+    The rate is adaptive: `penalize` divides it when the API answers
+    with HTTP 429 or 5xx, and `reward` slowly brings it back up to the
+    configured rate after successful requests.
+
+    Args:
+        rate (float): The maximum number of requests per second.
+        capacity (float): The maximum burst size. Defaults to `rate`.
+        min_rate (float): The lowest rate `penalize` can go down to.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = 0.1):
+        if rate <= 0:
+            raise ValueError("rate must be strictly positive")
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """
+        It blocks until a token is available and takes it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(
+                    self.blocked_until - now, (1 - self.tokens) / self.rate, 0.001
+                )
+            time.sleep(wait)
+
+    def penalize(self, retry_after: float = None):
+        """
+        It halves the request rate after a 429 or 5xx answer. If the
+        server sent a Retry-After delay, no token is handed out before
+        this delay is over, for every thread sharing the bucket.
+
+        Args:
+            retry_after (float): The delay in seconds asked by the server.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self):
+        """
+        It increases the request rate a little after a successful
+        request, without going above the configured rate.
+        """
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
@@ -0,0 +1,238 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+SERIES_SUFFIX = "_rating_series.parquet"
+RESOLUTIONS = ["raw", "daily", "weekly"]  # from the finest to the coarsest
+MAX_POINTS = 1000
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+
+
+def series_filepath(output_dir: str, username: str):
+    """
+    It builds the path of the rating series of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the rating series file.
+    """
+    return os.path.join(output_dir, username, f"{username}{SERIES_SUFFIX}")
+
+
+def ohlc(games: pd.DataFrame, frequency: str):
+    """
+    It aggregates the ratings of the games of one time class by period:
+    the rating after the first and the last game of the period, the
+    highest and lowest ratings, and the number of games.
+
+    Args:
+        games (pd.DataFrame): The date and player_rating of the games,
+        in the order they were played.
+        frequency (str): "D" for days or "W-SUN" for weeks starting on
+        Monday.
+
+    Returns:
+        pd.DataFrame: One row per period with games, with the first day
+        of the period as date.
+    """
+    periods = games["date"].dt.to_period(frequency).dt.start_time
+    grouped = games.groupby(periods, sort=True)["player_rating"]
+    series = grouped.agg(
+        open="first", high="max", low="min", close="last", games="size"
+    )
+    return series.rename_axis("date").reset_index()
+
+
+def build_rating_series(df: pd.DataFrame):
+    """
+    It builds the rating series of each time class at every resolution
+    of RESOLUTIONS: every game, one OHLC row per day and one per week.
+    The games of a day are ordered by game_id, which grows with time.
+
+    Args:
+        df (pd.DataFrame): The transformed games, with converted types.
+
+    Returns:
+        pd.DataFrame: The time class, resolution, date, OHLC ratings and
+        number of games of every point, sorted by date.
+    """
+    df = df.dropna(subset=["date", "player_rating"])
+    df = df.assign(
+        game_number=pd.to_numeric(df["game_id"], errors="coerce"),
+        player_rating=df["player_rating"].astype(np.int64),
+    )
+    df = df.sort_values(["date", "game_number"], kind="stable")
+    frames = []
+    for time_class, games in df.groupby("time_class", observed=True):
+        games = games[["date", "player_rating"]]
+        raw = pd.DataFrame(
+            {
+                "date": games["date"].to_numpy(),
+                **{
+                    column: games["player_rating"].to_numpy() for column in OHLC_COLUMNS
+                },
+                "games": 1,
+            }
+        )
+        for resolution, series in [
+            ("raw", raw),
+            ("daily", ohlc(games, "D")),
+            ("weekly", ohlc(games, "W-SUN")),
+        ]:
+            frames.append(
+                series.assign(time_class=str(time_class), resolution=resolution)
+            )
+    columns = ["time_class", "resolution", "date"] + OHLC_COLUMNS + ["games"]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def write_rating_series(df: pd.DataFrame, output_dir: str, username: str):
+    """
+    It builds and saves the rating series of the transformed games.
+
+    Args:
+        df (pd.DataFrame): The transformed games, with converted types.
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        str: The path of the rating series file.
+    """
+    filepath = series_filepath(output_dir, username)
+    tmp_filepath = f"{filepath}.tmp"
+    build_rating_series(df).to_parquet(tmp_filepath, index=False)
+    os.replace(tmp_filepath, filepath)
+    return filepath
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int):
+    """
+    It downsamples a series with the Largest-Triangle-Three-Buckets
+    algorithm: the first and last points are kept, the others are split
+    in `threshold - 2` buckets and each bucket keeps the point forming
+    the largest triangle with the point kept in the previous bucket and
+    the average of the next bucket, which keeps the peaks of the curve.
+
+    Args:
+        x (np.ndarray): The x values, sorted.
+        y (np.ndarray): The y values.
+        threshold (int): The number of points to keep, at least 3.
+
+    Returns:
+        tuple: The indexes of the kept points and the first index of
+        each bucket, including the first and last points.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size), np.arange(size)
+    edges = (np.arange(threshold - 1) * (size - 2) / (threshold - 2)).astype(
+        np.int64
+    ) + 1
+    edges[-1] = size - 1
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, size - 1
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        previous_x, previous_y = x[kept[bucket]], y[kept[bucket]]
+        areas = np.abs(
+            (previous_x - next_x) * (y[start:end] - previous_y)
+            - (previous_x - x[start:end]) * (next_y - previous_y)
+        )
+        kept[bucket + 1] = start + int(np.argmax(areas))
+    return kept, np.concatenate(([0], edges))
+
+
+class RatingSeries:
+    """
+    The rating series of a user at every resolution. A date range is
+    answered by the finest resolution which has at most `max_points`
+    points in the range, and by the daily series downsampled with LTTB
+    when even the weekly one is too long, so a chart never has more
+    than `max_points` points whatever the number of games.
+
+    Args:
+        series (pd.DataFrame): The series, as returned by
+        build_rating_series.
+    """
+
+    def __init__(self, series: pd.DataFrame):
+        self.series = {
+            key: group.reset_index(drop=True)
+            for key, group in series.groupby(["time_class", "resolution"])
+        }
+
+    def time_classes(self):
+        return sorted({time_class for time_class, _ in self.series})
+
+    def in_range(self, time_class: str, resolution: str, start, end):
+        """
+        It returns the points of one series between two dates. A weekly
+        point is kept when its week overlaps the range.
+        """
+        series = self.series.get((time_class, resolution))
+        if series is None:
+            return pd.DataFrame(columns=["date"] + OHLC_COLUMNS + ["games"])
+        start = pd.Timestamp(start).normalize()
+        if resolution == "weekly":
+            start -= pd.Timedelta(days=6)
+        dates = series["date"].to_numpy()
+        first = np.searchsorted(dates, start.to_datetime64(), "left")
+        last = np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), "right")
+        return series.iloc[first:last]
+
+    def select(self, time_class: str, start, end, max_points: int = MAX_POINTS):
+        """
+        It gives the rating series of a time class over a date range,
+        with at most `max_points` points.
+
+        Args:
+            time_class (str): The time class, like "blitz".
+            start (datetime): The first day of the range.
+            end (datetime): The last day of the range.
+            max_points (int): The maximum number of points.
+
+        Returns:
+            tuple: The resolution used ("raw", "daily", "weekly" or
+            "lttb") and the points, with their date, OHLC ratings and
+            number of games.
+        """
+        for resolution in RESOLUTIONS:
+            points = self.in_range(time_class, resolution, start, end)
+            if len(points) <= max_points:
+                return resolution, points.reset_index(drop=True)
+        daily = self.in_range(time_class, "daily", start, end)
+        kept, buckets = lttb(
+            daily["date"].to_numpy().astype(np.int64), daily["close"], max_points
+        )
+        points = daily.iloc[kept].reset_index(drop=True)
+        points["high"] = np.maximum.reduceat(daily["high"].to_numpy(), buckets)
+        points["low"] = np.minimum.reduceat(daily["low"].to_numpy(), buckets)
+        points["games"] = np.add.reduceat(daily["games"].to_numpy(), buckets)
+        return "lttb", points
+
+
+def read_rating_series(output_dir: str, username: str):
+    """
+    It reads the rating series of a user.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        RatingSeries/None: The series, or None if the user has none.
+    """
+    filepath = series_filepath(output_dir, username)
+    if not os.path.exists(filepath):
+        return None
+    return RatingSeries(pd.read_parquet(filepath))
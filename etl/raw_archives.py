@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+
+RAW_SUFFIX = ".jsonl.gz"
+LEGACY_SUFFIX = ".json"
+INDEX_SUFFIX = ".index.npz"  # games kept in the shared game store
+
+
+def is_raw_archive(filename: str):
+    """
+    It tells if a file of a user raw data directory is a monthly
+    archive: an index of games of the shared game store, a compact
+    file or a legacy JSON file.
+
+    Args:
+        filename (str): The file name.
+
+    Returns:
+        bool: True for ".index.npz", ".jsonl.gz" and ".json" files.
+    """
+    return filename.endswith((INDEX_SUFFIX, RAW_SUFFIX, LEGACY_SUFFIX))
+
+
+def write_games_jsonl(games, filepath: str):
+    """
+    It writes games to a gzip-compressed JSON Lines file, one game per
+    line and without indentation. The file is written next to its
+    final path and then renamed, so a reader never sees half a month.
+
+    Args:
+        games (iterable): The games, as dictionaries.
+        filepath (str): The ".jsonl.gz" file to write.
+
+    Returns:
+        int: The number of written games.
+    """
+    number_games = 0
+    tmp_filepath = f"{filepath}.tmp"
+    with gzip.open(tmp_filepath, "wt", encoding="utf-8", compresslevel=6) as f:
+        for game in games:
+            f.write(json.dumps(game, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            number_games += 1
+    os.replace(tmp_filepath, filepath)
+    return number_games
+
+
+def iter_games(filepath: str):
+    """
+    It reads the games of a raw monthly file one at a time, so the
+    memory used does not depend on the number of games of the month.
+    Legacy ".json" files, which hold a single JSON list, are loaded
+    at once.
+
+    Args:
+        filepath (str): The raw monthly file.
+
+    Yields:
+        dict: The games of the file.
+    """
+    if filepath.endswith(RAW_SUFFIX):
+        with gzip.open(filepath, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(filepath, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def migrate_json_archives(user_dir: str):
+    """
+    It converts in place the legacy ".json" archives of a user to the
+    compact ".jsonl.gz" format. The modification time of each file is
+    kept, since it tells the extraction whether the month was complete
+    when it was saved.
+
+    Args:
+        user_dir (str): The raw data directory of the user.
+
+    Returns:
+        int: The number of migrated files.
+    """
+    if not os.path.isdir(user_dir):
+        return 0
+    migrated = 0
+    for file in os.listdir(user_dir):
+        filepath = os.path.join(user_dir, file)
+        if not file.endswith(LEGACY_SUFFIX) or not os.path.isfile(filepath):
+            continue
+        new_filepath = filepath[: -len(LEGACY_SUFFIX)] + RAW_SUFFIX
+        try:
+            mtime = os.path.getmtime(filepath)
+            write_games_jsonl(iter_games(filepath), new_filepath)
+            os.utime(new_filepath, (mtime, mtime))
+            os.remove(filepath)
+            migrated += 1
+        except (IOError, ValueError) as err:
+            print(f"Error {err} during migration of file: {filepath}")
+    if migrated:
+        print(f"{migrated} archive(s) migrated to {RAW_SUFFIX} in {user_dir}")
+    return migrated
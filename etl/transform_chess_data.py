@@ -1,148 +1,669 @@
+import functools
+import hashlib
 import json
+import numpy as np
 import pandas as pd
 import os
-import re
+import shutil
+import sys
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+
+from aggregate_cube import cube_filepath, write_cube
+from dashboard_snapshot import snapshot_filepath, write_snapshot
+from game_store import (
+    iter_chunk,
+    read_index,
+    read_transformed_chunk,
+    store_path,
+    take_lines,
+    write_transformed_chunk,
+)
+from games_database import write_database_version, write_games_database
+from games_storage import (
+    count_games,
+    export_games_csv,
+    games_dirpath,
+    iter_partitions,
+    list_partitions,
+    read_data_version,
+    read_games,
+    read_partition,
+    replace_dataset,
+    set_column_types,
+    split_partitions,
+    write_partition,
+)
+from metrics import count, span
+from opponent_index import opponent_meta_filepath, write_opponent_index
+from rating_series import series_filepath, write_rating_series
+from raw_archives import (
+    INDEX_SUFFIX,
+    RAW_SUFFIX,
+    is_raw_archive,
+    iter_games,
+    migrate_json_archives,
+)
 
 JSON_DATA_DIR = "data/json"
 TRANSFORMED_DATA_DIR = "data/transformed"
+BLOCK_SIZE = 8 << 20  # bytes of raw JSON decoded per batch
+CHUNK_CACHE_SIZE = 16  # transformed chunks of the game store kept in memory
+MANIFEST_VERSION = 2  # version of the dataset schema the manifest describes
+CUBE_COLUMNS = [
+    "date",
+    "time_class",
+    "player_color",
+    "player_result",
+    "player_rating",
+    "opponent_rating",
+]
+SERIES_COLUMNS = ["game_id", "date", "time_class", "player_rating"]
+DATE_PATTERN = r'\[Date "(?P<date>[^"]*)"\]'
+GAME_ID_PATTERN = r"(?P<id>[^/]*)$"
+OPENING_PATTERN = r"(?P<opening>[^/]*)$"
+PLAYER_SCHEMA = pa.struct(
+    [("username", pa.string()), ("rating", pa.int64()), ("result", pa.string())]
+)
+RAW_GAME_SCHEMA = pa.schema(
+    [
+        ("url", pa.string()),
+        ("pgn", pa.string()),
+        ("rated", pa.bool_()),
+        ("time_class", pa.string()),
+        ("eco", pa.string()),
+        ("accuracies", pa.struct([("white", pa.float64()), ("black", pa.float64())])),
+        ("white", PLAYER_SCHEMA),
+        ("black", PLAYER_SCHEMA),
+    ]
+)
+GAME_SCHEMA = pa.schema(
+    [
+        ("game_id", pa.int64()),
+        ("date", pa.string()),
+        ("rated", pa.bool_()),
+        ("time_class", pa.string()),
+        ("opening", pa.string()),
+        ("white_accuracy", pa.float64()),
+        ("black_accuracy", pa.float64()),
+        ("white_username", pa.string()),
+        ("white_rating", pa.int64()),
+        ("white_result", pa.string()),
+        ("black_username", pa.string()),
+        ("black_rating", pa.int64()),
+        ("black_result", pa.string()),
+    ]
+)
+RESULT_LOOKUP = {
+    "win": "win",
+    "resigned": "loss",
+    "timeout": "loss",
+    "checkmated": "loss",
+    "draw": "draw",
+    "stalemate": "draw",
+    "insufficientmaterial": "draw",
+    "50move": "draw",
+    "agreed": "draw",
+    "repetition": "draw",
+}
+
+
+def file_fingerprint(filepath: str, with_hash: bool = True):
+    """
+    It computes what the manifest records about a raw file: its size,
+    its modification time and the SHA-256 of its content.
+
+    Args:
+        filepath (str): The raw JSON file.
+        with_hash (bool): If False, the content hash is not computed.
+
+    Returns:
+        dict: The size, mtime and sha256 (or None) of the file.
+    """
+    stat = os.stat(filepath)
+    sha256 = None
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+
+def load_manifest(manifest_path: str):
+    """
+    It reads the manifest of the files already transformed for a user.
+
+    Args:
+        manifest_path (str): The path of the manifest JSON file.
+
+    Returns:
+        dict: For each raw file name, its size, mtime, sha256 and the
+        ids of the games it produced. Empty if there is no manifest or
+        if it was written for another version of the dataset schema
+        (MANIFEST_VERSION), so that the dataset is rebuilt.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("files", {})
+    except (IOError, ValueError) as e:
+        print(f"Transform step: Error {e} from {manifest_path}")
+        return {}
+
+
+def save_manifest(manifest_path: str, files: dict):
+    """
+    It writes the manifest of the transformed files. The file is
+    written next to its final path and then renamed, so that an
+    interrupted run never leaves a manifest that does not match the
+    output.
+
+    Args:
+        manifest_path (str): The path of the manifest JSON file.
+        files (dict): The manifest entries of the raw files.
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def game_table(table: pa.Table):
+    """
+    It transforms a table of raw games into the columns which do not
+    depend on the player: the ids, dates and openings extracted by
+    regular expressions compiled once per batch, and both players.
+
+    Args:
+        table (pa.Table): The raw games, with the RAW_GAME_SCHEMA columns.
+
+    Returns:
+        pa.Table: The GAME_SCHEMA columns of the games.
+    """
+    white, black = table.column("white"), table.column("black")
+    accuracies = table.column("accuracies")
+    urls = table.column("url")
+    return pa.table(
+        {
+            "game_id": pc.cast(
+                pc.struct_field(pc.extract_regex(urls, GAME_ID_PATTERN), "id"),
+                pa.int64(),
+            ),
+            "date": pc.struct_field(
+                pc.extract_regex(table.column("pgn"), DATE_PATTERN), "date"
+            ),
+            "rated": table.column("rated"),
+            "time_class": table.column("time_class"),
+            "opening": pc.struct_field(
+                pc.extract_regex(table.column("eco"), OPENING_PATTERN), "opening"
+            ),
+            "white_accuracy": pc.struct_field(accuracies, "white"),
+            "black_accuracy": pc.struct_field(accuracies, "black"),
+            "white_username": pc.struct_field(white, "username"),
+            "white_rating": pc.struct_field(white, "rating"),
+            "white_result": pc.struct_field(white, "result"),
+            "black_username": pc.struct_field(black, "username"),
+            "black_rating": pc.struct_field(black, "rating"),
+            "black_result": pc.struct_field(black, "result"),
+        },
+        schema=GAME_SCHEMA,
+    )
+
+
+def player_games(games: pa.Table, is_white):
+    """
+    It gives the games from the side of the player: the player's side
+    is chosen with a boolean mask and the results are mapped through a
+    single lookup table (RESULT_LOOKUP) applied to the dictionary of
+    distinct values.
+
+    Args:
+        games (pa.Table): The GAME_SCHEMA columns of the games.
+        is_white: A boolean Arrow array, True where the player is white.
+
+    Returns:
+        pd.DataFrame: The transformed games of the player (id, date,
+        rated, time class, opening, accuracies, color, ratings,
+        opponent and result), without the game_url, which is derived
+        from the id, and without type conversion.
+    """
+    white_names = games.column("white_username")
+    black_names = games.column("black_username")
+    white_ratings = games.column("white_rating")
+    black_ratings = games.column("black_rating")
+    player_results = pc.if_else(
+        is_white, games.column("white_result"), games.column("black_result")
+    ).combine_chunks()
+    player_results = player_results.dictionary_encode()
+    result_lookup = pa.array(
+        [RESULT_LOOKUP.get(r, "N/A") for r in player_results.dictionary.to_pylist()],
+        pa.string(),
+    )
+    player_results = pc.fill_null(result_lookup.take(player_results.indices), "N/A")
+    transformed = pa.table(
+        {
+            "game_id": games.column("game_id"),
+            "date": games.column("date"),
+            "rated": games.column("rated"),
+            "time_class": games.column("time_class"),
+            "opening": games.column("opening"),
+            "white_accuracy": games.column("white_accuracy"),
+            "black_accuracy": games.column("black_accuracy"),
+            "player_color": pc.if_else(is_white, "white", "black"),
+            "player_rating": pc.if_else(is_white, white_ratings, black_ratings),
+            "opponent_username": pc.if_else(is_white, black_names, white_names),
+            "opponent_rating": pc.if_else(is_white, black_ratings, white_ratings),
+            "player_result": player_results,
+        }
+    )
+    return transformed.to_pandas()
+
+
+def transform_games_table(table: pa.Table, username: str):
+    """
+    It transforms a table of raw games into the transformed games of
+    the player. The whole batch is processed column by column with
+    Arrow compute kernels, by game_table and then player_games, with
+    the player's side found by comparing the usernames, whatever their
+    case.
+
+    Args:
+        table (pa.Table): The raw games, with the RAW_GAME_SCHEMA columns.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        pd.DataFrame: The transformed games of the player, with the
+        columns of player_games and without type conversion.
+    """
+    username = username.lower()
+    white_names = pc.struct_field(table.column("white"), "username")
+    black_names = pc.struct_field(table.column("black"), "username")
+    is_white = pc.fill_null(pc.equal(pc.utf8_lower(white_names), username), False)
+    is_black = pc.fill_null(pc.equal(pc.utf8_lower(black_names), username), False)
+    keep = pc.or_(is_white, is_black)
+    if not pc.any(keep).as_py():
+        return pd.DataFrame()
+    games = game_table(table)
+    if not pc.all(keep).as_py():  # games of the archive without the player
+        games, is_white = games.filter(keep), is_white.filter(keep)
+    return player_games(games, is_white)
+
+
+@functools.lru_cache(maxsize=CHUNK_CACHE_SIZE)
+def chunk_game_table(database_path: str, store_id: int, chunk_id: int):
+    """
+    It gives the game_table columns of all the games of a chunk of the
+    game store. The chunk is decoded and transformed by the first
+    player who needs it and its columns are saved in the store, so the
+    games between two tracked players are decoded once. The columns
+    saved by an older version, with another schema, are computed again.
+    The raw games are decoded block by block (iter_chunk) and only the
+    transformed columns of the chunk are built whole. The chunks are
+    never modified, so the last CHUNK_CACHE_SIZE are also kept in
+    memory for the next users of a batch; older ones are read again
+    from their saved columns.
+
+    Args:
+        database_path (str): The SQLite game store.
+        store_id (int): The inode of the store, so that a store created
+        again at the same path is not confused with the old one.
+        chunk_id (int): The chunk.
+
+    Returns:
+        pa.Table: The GAME_SCHEMA columns, one row per line of the chunk.
+    """
+    table = read_transformed_chunk(database_path, chunk_id)
+    if table is None or not table.schema.equals(GAME_SCHEMA):
+        table = pa.concat_tables(
+            game_table(pa.Table.from_batches([batch]))
+            for batch in iter_chunk(database_path, chunk_id, RAW_GAME_SCHEMA)
+        )
+        write_transformed_chunk(database_path, chunk_id, table)
+    return table
+
+
+def transform_index_file(filepath: str):
+    """
+    It transforms the games of an index file from the shared game
+    store: the rows of the games are taken from the transformed chunks
+    of chunk_game_table and the player's side is given by the index.
+
+    Args:
+        filepath (str): The ".index.npz" file of the month.
 
+    Returns:
+        pd.DataFrame: The transformed games of the file.
+    """
+    index = read_index(filepath)
+    if not len(index["game_id"]):
+        return pd.DataFrame()
+    database_path = store_path(filepath)
+    store_id = os.stat(database_path).st_ino
+    chunks = {
+        chunk_id: chunk_game_table(database_path, store_id, chunk_id)
+        for chunk_id in np.unique(index["chunk_id"]).tolist()
+    }
+    games = take_lines(chunks, index["chunk_id"], index["line"])
+    return player_games(games, pa.array(index["is_white"]))
 
-def transformed_single_game(game: dict, username: str):
+
+def transform_games_batch(games: list, username: str):
     """
-    Transforms a single raw game dictionary into a clean, standardised
-    format. This function extracts key data points from a raw game
-    dictionary from the Chess.com API. It also determines the player's
-    color, rating, opponent's details, and standardises the game
-    result (win, loss, or draw).
+    It transforms a list of raw games, already loaded as dictionaries,
+    with the batch engine of transform_games_table.
 
     Args:
-        game (dict): A dictionary representing a single chess game.
-        username (str): The chess.com username of the player
+        games (list): The raw games, as dictionaries.
+        username (str): The chess.com username of the player.
 
     Returns:
-        dict/None: A dictionary containing the transformed game data,
-        or None if there is data from the user.
-    """
-    transformed_data = {}
-    transformed_data["game_url"] = game.get("url")
-    transformed_data["game_id"] = game["url"].split("/")[-1]
-    date_pattern = r"\[Date \"(.*?)\"\]"
-    date_match = re.search(date_pattern, game.get("pgn", ""))
-    transformed_data["date"] = date_match.group(1) if date_match else None
-    transformed_data["rated"] = game.get("rated")
-    transformed_data["time_class"] = game.get("time_class")
-    opening = game.get("eco")
-    transformed_data["opening"] = opening.split("/")[-1]
-    accuracies = game.get(
-        "accuracies", {}
-    )  # get {} if there are no accuracies availables
-    transformed_data["white_accuracy"] = accuracies.get("white")
-    transformed_data["black_accuracy"] = accuracies.get("black")
-
-    player = False
-    if game["white"]["username"].lower() == username.lower():
-        transformed_data["player_color"] = "white"
-        transformed_data["player_rating"] = game["white"]["rating"]
-        transformed_data["opponent_username"] = game["black"]["username"]
-        transformed_data["opponent_rating"] = game["black"]["rating"]
-        player_result = game["white"]["result"]
-        player = True
-    elif game["black"]["username"].lower() == username.lower():
-        transformed_data["player_color"] = "black"
-        transformed_data["player_rating"] = game["black"]["rating"]
-        transformed_data["opponent_username"] = game["white"]["username"]
-        transformed_data["opponent_rating"] = game["white"]["rating"]
-        player_result = game["black"]["result"]
-        player = True
-
-    if not player:
-        return None
-
-    if player_result == "win":
-        transformed_data["player_result"] = "win"
-    elif player_result in ["resigned", "timeout", "checkmated"]:
-        transformed_data["player_result"] = "loss"
-    elif player_result in [
-        "draw",
-        "stalemate",
-        "insufficientmaterial",
-        "50move",
-        "agreed",
-        "repetition",
-    ]:
-        transformed_data["player_result"] = "draw"
-    else:
-        transformed_data["player_result"] = "N/A"
-    return transformed_data
-
-
-def transformed_games(username: str, raw_dir: str = JSON_DATA_DIR):
-    """
-    Reads raw JSON game data, transforms it, and saves it as a CSV.
-
-    This function iterates through all JSON files in a user's raw data
-    directory. It processes each game using transformed_single_game
-    function and compiles the results into a single list. This list is
-    then converted into a pandas DataFrame. Finally, the DataFrame is
-    saved as a CSV file in the user's transformed data directory.
+        pd.DataFrame: The transformed games of the player.
+    """
+    if not games:
+        return pd.DataFrame()
+    return transform_games_table(
+        pa.Table.from_pylist(games, schema=RAW_GAME_SCHEMA), username
+    )
+
+
+def transform_file(filepath: str, username: str):
+    """
+    It transforms all the games of one raw monthly file. An index file
+    is read from the shared game store by transform_index_file. A
+    ".jsonl.gz" file is decoded directly into Arrow record batches of a
+    bounded size, without creating a Python dictionary per game, and
+    each batch is transformed by transform_games_table. Legacy ".json"
+    files are loaded with iter_games.
+
+    Args:
+        filepath (str): The raw monthly file.
+        username (str): The chess.com username of the player.
+
+    Returns:
+        pd.DataFrame: The transformed games of the file.
+    """
+    print(f"Processing: {filepath}")
+    if filepath.endswith(INDEX_SUFFIX):
+        return transform_index_file(filepath)
+    if not filepath.endswith(RAW_SUFFIX):
+        return transform_games_batch(list(iter_games(filepath)), username)
+    reader = pa_json.open_json(
+        filepath,
+        read_options=pa_json.ReadOptions(block_size=BLOCK_SIZE),
+        parse_options=pa_json.ParseOptions(
+            explicit_schema=RAW_GAME_SCHEMA, unexpected_field_behavior="ignore"
+        ),
+    )
+    frames = []
+    for batch in reader:
+        frame = transform_games_table(pa.Table.from_batches([batch]), username)
+        if not frame.empty:
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def update_partitions(
+    dataset_dir: str,
+    games: pd.DataFrame,
+    stale_game_ids: set = frozenset(),
+    stale_partitions: list = (),
+):
+    """
+    It writes the games of one raw file to the monthly partitions of
+    the dataset, one month at a time. The games the file produced
+    before (`stale_game_ids`, in `stale_partitions`) are removed and
+    the new games replace the games with the same game_id, so only
+    the months of the file are read and written.
+
+    Args:
+        dataset_dir (str): The dataset directory.
+        games (pd.DataFrame): The transformed games of the file, with
+        converted types.
+        stale_game_ids (set): The ids of the games the file produced
+        in a previous run.
+        stale_partitions (list): The months of these games.
+
+    Returns:
+        list: The [year, month] of the months of the new games.
+    """
+    new_games = split_partitions(games) if not games.empty else {}
+    for key in sorted(set(new_games) | {tuple(key) for key in stale_partitions}):
+        frames = []
+        existing = read_partition(dataset_dir, *key)
+        if existing is not None:
+            replaced = set(stale_game_ids)
+            if key in new_games:
+                replaced.update(new_games[key]["game_id"])
+            frames.append(existing[~existing["game_id"].isin(replaced)])
+        if key in new_games:
+            frames.append(new_games[key])
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:  # every game of the month was removed
+            write_partition(pd.DataFrame(), dataset_dir, *key)
+            continue
+        df = pd.concat(frames, ignore_index=True)
+        df = df.drop_duplicates(subset="game_id", keep="last", ignore_index=True)
+        write_partition(set_column_types(df), dataset_dir, *key)
+    return [list(key) for key in new_games]
+
+
+def write_dashboard_data(output_dir: str, username: str, months: list = None):
+    """
+    It builds the daily aggregate cube and the rating series of a user
+    from a few columns of the dataset. The cube is built one month at a
+    time, and when the changed months are given, only their rows are
+    rebuilt. The rating series need every game in order, so only the
+    four SERIES_COLUMNS of all the games are read. The dashboard
+    snapshot of the first view is then written from both, and the
+    opponent index is updated from the changed months.
+
+    Args:
+        output_dir (str): The directory of the transformed data.
+        username (str): The chess.com username of the player.
+        months (list): If given, the (year, month) pairs of the months
+        changed since the cube was written.
+    """
+    dataset_dir = games_dirpath(output_dir, username)
+    with span("write_dashboard_data"):
+        if months is not None and os.path.exists(cube_filepath(output_dir, username)):
+            frames = (read_partition(dataset_dir, *key, CUBE_COLUMNS) for key in months)
+            write_cube(
+                (frame for frame in frames if frame is not None),
+                output_dir,
+                username,
+                sorted(months),
+            )
+        else:
+            write_cube(iter_partitions(dataset_dir, CUBE_COLUMNS), output_dir, username)
+        games = pd.concat(
+            list(iter_partitions(dataset_dir, SERIES_COLUMNS)), ignore_index=True
+        )
+        write_rating_series(games, output_dir, username)
+        write_snapshot(output_dir, username)
+        write_opponent_index(
+            output_dir, username, sorted(months) if months is not None else None
+        )
+
+
+def transformed_games(
+    username: str,
+    raw_dir: str = JSON_DATA_DIR,
+    incremental: bool = True,
+    export_csv: bool = True,
+    database_path: str = None,
+):
+    """
+    Reads raw JSON game data, transforms it, and saves it as Parquet.
+
+    This function iterates through all monthly files in a user's raw
+    data directory, after migrating the legacy ".json" files to
+    ".jsonl.gz". It transforms the games of each file by batches with
+    transform_games_table, or from the shared game store for the index
+    files, and flushes them right away to a dataset with one Parquet
+    file per month of games (year=YYYY/month=M), which keeps the column
+    types. Only the games of one file and of the months they fall in
+    are in memory at a time, so the memory does not grow with the
+    history. Then an optional CSV export is appended month by month,
+    and the daily aggregate cube and the rating series used by the
+    dashboard are built from a few columns of the dataset. The games
+    can also be upserted into a SQLite database shared by all the
+    players.
+
+    In incremental mode, a manifest saved next to the dataset records
+    the size, mtime and content hash of each raw file, the ids of the
+    games it produced and their months. Only the new or changed files
+    are transformed again, and their games replace the previous ones
+    in their months, keyed by game_id. Games of deleted raw files are
+    removed. Otherwise the dataset is written from scratch next to the
+    previous one, which is replaced at the end.
 
     Args:
         username (str): The chess.com username of the player.
         raw_dir (str): The directory where the raw JSON data is stored.
+        incremental (bool): If False, every file is transformed again
+        and the output is rebuilt from scratch.
+        export_csv (bool): If True, a CSV copy of the games is exported.
+        database_path (str): If given, the games are also written to
+        this SQLite database, and only the new games are upserted.
 
     Returns:
-        pd.DataFrame: A pandas DataFrame containing all transformed
-        game data. Returns an empty DataFrame if no files are found or
-        if an error occurs.
+        tuple: The number of transformed games of the user, 0 if no
+        file is found or if an error occurs, and whether the transform
+        wrote anything, False when the dataset was up to date, so the
+        callers only increment the data version after a change.
     """
-    all_games = []
-    raw_dir = os.path.join(JSON_DATA_DIR, username)
+    raw_dir = os.path.join(raw_dir, username)
     if not os.path.exists(raw_dir):
         print(f"User raw data directory not found: '{raw_dir}'.")
-        return pd.DataFrame()
-    for file in os.listdir(raw_dir):
+        return 0, False
+    migrate_json_archives(raw_dir)
+    user_transformed_output_dir = os.path.join(TRANSFORMED_DATA_DIR, username)
+    dataset_dir = games_dirpath(TRANSFORMED_DATA_DIR, username)
+    manifest_path = os.path.join(
+        user_transformed_output_dir, f"{username}_manifest.json"
+    )
+    previous_manifest = {}
+    if incremental and list_partitions(dataset_dir):
+        previous_manifest = load_manifest(manifest_path)
+    output_dir = dataset_dir
+    if not previous_manifest:  # written from scratch, then swapped
+        output_dir = f"{dataset_dir}.tmp"
+        shutil.rmtree(output_dir, ignore_errors=True)
+    manifest = {}
+    changed_game_ids = set()
+    changed_months = set()
+    changed = False
+    for file in sorted(os.listdir(raw_dir)):
         filepath = os.path.join(raw_dir, file)
-        if not os.path.isfile(filepath) or not file.endswith(
-            ".json"
-        ):  # we only look at .json file and not .git file for example
+        if not os.path.isfile(filepath) or not is_raw_archive(
+            file
+        ):  # we only look at archive files and not .git file for example
+            continue
+        entry = previous_manifest.get(file)
+        fingerprint = file_fingerprint(filepath, with_hash=False)
+        if (
+            entry
+            and entry["size"] == fingerprint["size"]
+            and entry["mtime"] == fingerprint["mtime"]
+        ):
+            manifest[file] = entry  # unchanged file, nothing to do
+            continue
+        fingerprint = file_fingerprint(filepath)
+        if entry and entry["sha256"] == fingerprint["sha256"]:
+            manifest[file] = {**entry, **fingerprint}  # touched but same content
             continue
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                games = json.load(f)
-                print(f"Processing: {filepath}")
-                for game in games:
-                    transformed_game = transformed_single_game(game, username)
-                    if transformed_game:
-                        all_games.append(transformed_game)
+            with span("transform_file", detail=filepath):
+                file_games = transform_file(filepath, username)
+            count("games", len(file_games), stage="transform")
         except Exception as e:
             print(f"Transform step: Error {e} from {filepath}")
-    if all_games:
-        df = pd.DataFrame(all_games)
-        df["opening"] = df["opening"].fillna("N/A")
-        df["player_color"] = df["player_color"].astype("category")
-        df["player_result"] = df["player_result"].astype("category")
-        df["time_class"] = df["time_class"].astype("category")
-        df["rated"] = df["rated"].astype(bool)
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-
-        user_transformed_output_dir = os.path.join(TRANSFORMED_DATA_DIR, username)
-        os.makedirs(user_transformed_output_dir, exist_ok=True)
-        output_filename = os.path.join(
-            user_transformed_output_dir, f"{username}_transformed_games.csv"
+            continue
+        if not file_games.empty:
+            file_games = set_column_types(file_games)
+        partitions = update_partitions(
+            output_dir,
+            file_games,
+            set(entry["game_ids"]) if entry else set(),
+            entry["partitions"] if entry else [],
         )
-        df.to_csv(output_filename, index=False, encoding="utf-8")
-        print(f"Data saved: {output_filename}")
-        return df
+        game_ids = file_games["game_id"].tolist() if len(file_games) else []
+        changed_game_ids.update(game_ids)
+        for key in partitions + (entry["partitions"] if entry else []):
+            changed_months.add(tuple(key))
+        manifest[file] = {**fingerprint, "game_ids": game_ids, "partitions": partitions}
+        changed = True
+    for file, entry in previous_manifest.items():
+        if file not in manifest:  # the raw file was deleted
+            update_partitions(
+                output_dir, pd.DataFrame(), set(entry["game_ids"]), entry["partitions"]
+            )
+            changed_months.update(tuple(key) for key in entry["partitions"])
+            changed = True
 
-    else:
+    if previous_manifest and not changed:
+        print(f"Transform step: {dataset_dir} is up to date")
+        if manifest != previous_manifest:
+            save_manifest(manifest_path, manifest)
+        changed = not all(
+            os.path.exists(filepath(TRANSFORMED_DATA_DIR, username))
+            for filepath in [
+                cube_filepath,
+                series_filepath,
+                snapshot_filepath,
+                opponent_meta_filepath,
+            ]
+        )
+        if changed:
+            write_dashboard_data(TRANSFORMED_DATA_DIR, username)
+        if database_path and write_games_database(
+            iter_partitions(dataset_dir), username, set(), database_path
+        ):  # a rebuilt database holds the games of the current version again
+            version = read_data_version(TRANSFORMED_DATA_DIR, username)
+            write_database_version(username, version, database_path)
+        return count_games(TRANSFORMED_DATA_DIR, username), changed
+    if output_dir != dataset_dir:
+        if not list_partitions(output_dir):
+            shutil.rmtree(output_dir, ignore_errors=True)
+            print(f"There is no found games with {username}")
+            return 0, False
+        replace_dataset(output_dir, dataset_dir)
+    number_games = count_games(TRANSFORMED_DATA_DIR, username)
+    if not number_games:
         print(f"There is no found games with {username}")
-        return pd.DataFrame()
+        return 0, True
+    if export_csv:
+        export_games_csv(TRANSFORMED_DATA_DIR, username)
+    write_dashboard_data(
+        TRANSFORMED_DATA_DIR, username, changed_months if previous_manifest else None
+    )
+    if database_path:
+        write_games_database(
+            iter_partitions(dataset_dir),
+            username,
+            changed_game_ids if previous_manifest else None,
+            database_path,
+        )
+    save_manifest(manifest_path, manifest)
+    print(f"Data saved: {dataset_dir}, {number_games} games")
+    return number_games, True
 
 
 if __name__ == "__main__":
-    username = input("Which username do you want to transform data of? ")
-    df = transformed_games(username=username)
-    if df.empty:
-        print("The dataframe is empty.")
-    else:
-        print(df.head())
+    if len(sys.argv) < 2:
+        sys.exit("usage: python etl/transform_chess_data.py USERNAME...")
+    for username in sys.argv[1:]:
+        number_games, _ = transformed_games(username=username)
+        if not number_games:
+            print("There is no transformed game.")
+        else:
+            print(read_games(TRANSFORMED_DATA_DIR, username).head())
@@ -0,0 +1,229 @@
+import heapq
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import extract_chess_data
+from extract_chess_data import (
+    DEFAULT_REQUESTS_PER_SECOND,
+    JSON_DATA_DIR,
+    archive_may_have_changed,
+    download_and_save_archive,
+)
+from game_store import index_filename
+from games_database import write_database_version
+from games_storage import count_games, write_data_version
+from http_session import ValidatorStore
+from metrics import count, span
+from opening_index import build_opening_index
+from pgn_parser import build_move_store
+from rate_limiter import TokenBucket
+from transform_chess_data import TRANSFORMED_DATA_DIR, transformed_games
+
+DEFAULT_INTERVAL = 60.0  # seconds between two polls of the same user
+MAX_INTERVAL = 900.0  # longest wait after consecutive failed polls
+JITTER = 0.2  # each wait is drawn in [1 - JITTER, 1 + JITTER] times its value
+
+
+def watched_months(username: str, now: datetime, json_dir: str = JSON_DATA_DIR):
+    """
+    It gives the monthly archives polled for a user: the current month,
+    and the previous month while its saved file may still miss the
+    games finished just before midnight at the end of the month. Once
+    the previous month was requested after its end, its file is final
+    (archive_may_have_changed) and only the current month is polled.
+
+    Args:
+        username (str): The chess.com username of the player.
+        now (datetime): The current UTC time.
+        json_dir (str): The directory of the raw data.
+
+    Returns:
+        list: The (year, month) pairs to poll.
+    """
+    months = [(now.year, now.month)]
+    year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    filepath = os.path.join(json_dir, username, index_filename(username, year, month))
+    if os.path.exists(filepath) and archive_may_have_changed(filepath, year, month):
+        months.insert(0, (year, month))
+    return months
+
+
+def next_delay(interval: float, failures: int):
+    """
+    It computes the wait before the next poll of a user: the interval,
+    doubled after each consecutive failure up to MAX_INTERVAL, with a
+    random jitter so that the users do not stay in step.
+
+    Args:
+        interval (float): The seconds between two polls.
+        failures (int): The number of consecutive failed polls.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = min(MAX_INTERVAL, interval * 2**failures) if failures else interval
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def refresh_user(username: str, database_path: str = None):
+    """
+    It appends the new games of a user to the transformed data: the
+    incremental transform only reads the raw files that changed and
+    rewrites their months, then the move store and the opening index
+    are updated. The CSV export is left out, since the whole file
+    would be written again at each new game. When games were added,
+    the data version stamp is incremented, which tells the dashboard
+    to reload the data of the user.
+
+    Args:
+        username (str): The chess.com username of the player.
+        database_path (str): If given, the new games are also upserted
+        into this SQLite database.
+
+    Returns:
+        int: The number of games added.
+    """
+    games_before = count_games(TRANSFORMED_DATA_DIR, username)
+    with span("watch_refresh", detail=username):
+        transformed_games(
+            username=username, export_csv=False, database_path=database_path
+        )
+        new_games = count_games(TRANSFORMED_DATA_DIR, username) - games_before
+        if new_games:
+            build_move_store(username=username, workers=1)
+            build_opening_index(username=username)
+            version = write_data_version(TRANSFORMED_DATA_DIR, username)
+            if database_path:
+                write_database_version(username, version, database_path)
+    return new_games
+
+
+def poll_user(
+    username: str,
+    rate_limiter: TokenBucket,
+    validators: ValidatorStore,
+    database_path: str = None,
+    json_dir: str = JSON_DATA_DIR,
+):
+    """
+    It polls the archives of the current month of a user with a
+    conditional request, so an archive that did not change costs one
+    304 answer without body, and refreshes the transformed data when
+    an archive changed.
+
+    Args:
+        username (str): The chess.com username of the player.
+        rate_limiter (TokenBucket): The rate limiter of the requests.
+        validators (ValidatorStore): The store of ETag/Last-Modified.
+        database_path (str): If given, the new games are also upserted
+        into this SQLite database.
+        json_dir (str): The directory of the raw data.
+
+    Returns:
+        int/None: The number of games added, 0 for a month without game
+        yet, or None if an archive could not be downloaded, which makes
+        the watch back off for this user.
+    """
+    user_json_dir = os.path.join(json_dir, username)
+    os.makedirs(user_json_dir, exist_ok=True)
+    changed = False
+    failed = False
+    for year, month in watched_months(username, datetime.now(timezone.utc), json_dir):
+        archive_url = (
+            f"{extract_chess_data.API_URL}/player/{username}/games/{year}/{month:02d}"
+        )
+        filepath = os.path.join(user_json_dir, index_filename(username, year, month))
+        try:
+            number_games = download_and_save_archive(
+                archive_url, filepath, rate_limiter, validators
+            )
+        except IOError as e:
+            print(f"Watch: {e}")
+            count("watch_polls", result="failed")
+            failed = True
+            continue
+        if number_games is None:
+            count("watch_polls", result="not_modified")
+        elif number_games:
+            count("watch_polls", result="changed")
+            changed = True
+        else:
+            count("watch_polls", result="empty")
+    if not changed:
+        return None if failed else 0
+    validators.save()
+    new_games = refresh_user(username, database_path)
+    count("games", new_games, stage="watch")
+    return new_games
+
+
+def watch_users(
+    usernames: list,
+    interval: float = DEFAULT_INTERVAL,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    database_path: str = None,
+    duration: float = None,
+):
+    """
+    It keeps the data of users up to date until it is stopped with
+    Ctrl+C. Each user is polled every `interval` seconds with a jitter,
+    and only the archive of the current month is requested, with its
+    ETag, instead of listing every archive like the ETL does. After
+    consecutive failures, the polls of the user back off exponentially.
+    The new games are appended to the monthly Parquet files and the
+    data version stamp tells the dashboard to reload them, so they
+    appear within about `interval` seconds of the end of the game.
+
+    Args:
+        usernames (list): The chess.com usernames of the players.
+        interval (float): The seconds between two polls of a user.
+        requests_per_second (float): The maximum number of requests
+        per second sent to the API.
+        database_path (str): If given, the new games are also upserted
+        into this SQLite database.
+        duration (float): If given, the watch stops after this number
+        of seconds.
+
+    Returns:
+        int: The number of games added.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    rate_limiter = TokenBucket(requests_per_second)
+    validators = ValidatorStore()
+    started_at = time.monotonic()
+    # the users are spread over the first interval
+    schedule = [
+        (started_at + interval * index / len(usernames), username)
+        for index, username in enumerate(usernames)
+    ]
+    heapq.heapify(schedule)
+    failures = dict.fromkeys(usernames, 0)
+    total_new_games = 0
+    print(f"=>Watching {len(usernames)} user(s) every {interval:.0f}s (Ctrl+C to stop)")
+    try:
+        while schedule:
+            poll_at, username = heapq.heappop(schedule)
+            if duration is not None and poll_at - started_at > duration:
+                break
+            time.sleep(max(0.0, poll_at - time.monotonic()))
+            try:
+                new_games = poll_user(username, rate_limiter, validators, database_path)
+            except Exception as e:
+                print(f"Watch: Error {e} with {username}")
+                new_games = None
+            if new_games is None:
+                failures[username] += 1
+            else:
+                failures[username] = 0
+                total_new_games += new_games
+                if new_games:
+                    print(f"Watch: {new_games} new game(s) for {username}")
+            delay = next_delay(interval, failures[username])
+            heapq.heappush(schedule, (time.monotonic() + delay, username))
+    except KeyboardInterrupt:
+        print("Watch stopped.")
+    finally:
+        validators.save()
+    return total_new_games
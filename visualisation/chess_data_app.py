@@ -1,87 +1,112 @@
 import streamlit as st
 from visualisation_utils import (
+    DASHBOARD_COLUMNS,
+    average_opponent_rating,
+    data_version,
+    follow_data_version,
+    load_cube,
     load_data,
+    load_snapshot,
+    select_opening_counts,
+    select_rating_points,
+    select_summary,
     show_number_games,
     plot_outcome_distribution,
     plot_rating_evolution,
     plot_frequent_openings,
+    select_time_class,
+    show_opening_explorer,
+    show_opponent_explorer,
+    plot_results_by_difference,
+    warm_up_plotting,
 )
 
 st.title("Chess data visualisation")
 username = st.text_input("Please enter your Chess.com username")
+# matplotlib and seaborn are imported while the username is typed
+warm_up_plotting()
 if username:
-    dataframe_games = load_data(username_input=username)
-    if dataframe_games.empty:
-        st.warning(f"Dataframe empty for {username}")
-
+    # the cached data is loaded again when the ETL writes a new version
+    version = data_version(username)
+    follow_data_version(username, version)
+    # the first view, the whole history, is drawn from the snapshot of
+    # the transform, and the cube and the games are only read when the
+    # date range changes
+    snapshot = load_snapshot(username_input=username, version=version)
+    if snapshot is not None:
+        st.success(f"Loaded Data from {username}: {snapshot.games} game(s).")
+        first_game_date = snapshot.first_day.to_pydatetime()
+        last_game_date = snapshot.last_day.to_pydatetime()
+        number_games = snapshot.games
     else:
-        first_game_date = dataframe_games["date"].min().to_pydatetime()
-        last_game_date = dataframe_games["date"].max().to_pydatetime()
-        date_range = st.slider(
-            "Select date range",
-            min_value=first_game_date,
-            max_value=last_game_date,
-            value=(first_game_date, last_game_date),
-            format="YYYY-MM-DD",
-            key="slider_date_range",
+        dataframe_games = load_data(
+            username_input=username, columns=DASHBOARD_COLUMNS, version=version
         )
-        start_date, end_date = date_range
-        dataframe_games_filtered = dataframe_games[
-            (dataframe_games["date"] >= start_date)
-            & (dataframe_games["date"] <= end_date)
-        ].copy()
-        if dataframe_games_filtered.empty:
-            st.warning("No data found within the selected date range.")
+        cube = load_cube(username_input=username, version=version)
+        if dataframe_games.empty or cube is None or not len(cube.days):
+            st.warning(f"Dataframe empty for {username}")
             st.stop()
-        # st.dataframe(dataframe_games_filtered.head())
-        # show the number of games done by the user
-        st.subheader("Number of games")
-        show_number_games(dataframe_games_filtered)
-        # show average rating of opponents following time class
-        st.subheader("Average rating of opponents")
-        column11, column12, column13 = st.columns(3)
-        avg_rating_all_time_class = round(
-            dataframe_games_filtered.groupby(["time_class"])["opponent_rating"].mean()
-        )
-        with column11:
-            st.metric(label="Blitz", value=avg_rating_all_time_class["blitz"])
-        with column12:
-            st.metric(label="Bullet", value=avg_rating_all_time_class["bullet"])
-        with column13:
-            st.metric(label="Rapid", value=avg_rating_all_time_class["rapid"])
-        # show distribution of win, lose and draw following time class
-        st.subheader("Game results")
-        tab11, tab12, tab13 = st.tabs(["Blitz", "Bullet", "Rapid"])
-        df_blitz = dataframe_games_filtered[
-            dataframe_games_filtered["time_class"] == "blitz"
-        ]
-        df_bullet = dataframe_games_filtered[
-            dataframe_games_filtered["time_class"] == "bullet"
-        ]
-        df_rapid = dataframe_games_filtered[
-            dataframe_games_filtered["time_class"] == "rapid"
-        ]
-        with tab11:
-            plot_outcome_distribution(df=df_blitz, time_class="Blitz")
-        with tab12:
-            plot_outcome_distribution(df=df_bullet, time_class="Bullet")
-        with tab13:
-            plot_outcome_distribution(df=df_rapid, time_class="Rapid")
-        # show ratings evolution of the player
-        st.subheader("Ratings Evolution")
-        tab21, tab22, tab23 = st.tabs(["Blitz", "Bullet", "Rapid"])
-        with tab21:
-            plot_rating_evolution(df=df_blitz, time_class="Blitz")
-        with tab22:
-            plot_rating_evolution(df=df_bullet, time_class="Bullet")
-        with tab23:
-            plot_rating_evolution(df=df_rapid, time_class="Rapid")
-        # show opening ranking by frequency
-        st.subheader("Most frequent played openings")
-        tab31, tab32, tab33 = st.tabs(["Blitz", "Bullet", "Rapid"])
-        with tab31:
-            plot_frequent_openings(df=df_blitz, time_class="Blitz")
-        with tab32:
-            plot_frequent_openings(df=df_bullet, time_class="Bullet")
-        with tab33:
-            plot_frequent_openings(df=df_rapid, time_class="Rapid")
+        first_game_date = cube.days[0].to_pydatetime()
+        last_game_date = cube.days[-1].to_pydatetime()
+        number_games = len(cube)
+    date_range = st.slider(
+        "Select date range",
+        min_value=first_game_date,
+        max_value=last_game_date,
+        value=(first_game_date, last_game_date),
+        format="YYYY-MM-DD",
+        key="slider_date_range",
+    )
+    start_date, end_date = date_range
+    # the figures are cached for this user, data version and date range
+    view = (username, version, number_games, start_date, end_date)
+    # every widget but the openings is answered by the aggregate cube
+    summary = select_summary(username, version, snapshot, start_date, end_date)
+    if summary.empty:
+        st.warning("No data found within the selected date range.")
+        st.stop()
+    # show the number of games done by the user
+    st.subheader("Number of games")
+    show_number_games(summary, view)
+    # show average rating of opponents following time class
+    st.subheader("Average rating of opponents")
+    column11, column12, column13 = st.columns(3)
+    avg_rating_all_time_class = average_opponent_rating(summary)
+    with column11:
+        st.metric(label="Blitz", value=avg_rating_all_time_class.get("blitz"))
+    with column12:
+        st.metric(label="Bullet", value=avg_rating_all_time_class.get("bullet"))
+    with column13:
+        st.metric(label="Rapid", value=avg_rating_all_time_class.get("rapid"))
+    # only the chart of the chosen time class is built in each section
+    # show distribution of win, lose and draw following time class
+    st.subheader("Game results")
+    time_class = select_time_class(key="time_class_results")
+    plot_outcome_distribution(summary=summary, time_class=time_class, view=view)
+    # show ratings evolution of the player
+    st.subheader("Ratings Evolution")
+    time_class = select_time_class(key="time_class_ratings")
+    resolution, points = select_rating_points(
+        username, version, snapshot, start_date, end_date, time_class
+    )
+    plot_rating_evolution(resolution, points, time_class, view)
+    # show opening ranking by frequency
+    st.subheader("Most frequent played openings")
+    time_class = select_time_class(key="time_class_openings")
+    plot_frequent_openings(
+        counts=select_opening_counts(
+            username, version, snapshot, start_date, end_date, time_class
+        ),
+        time_class=time_class,
+        view=view,
+    )
+    # explore the results of the player after any sequence of moves
+    st.subheader("Opening explorer")
+    show_opening_explorer(username_input=username, version=version)
+    # the record against each opponent and by rating difference, over
+    # the whole history, answered by the opponent index
+    st.subheader("Head to head")
+    show_opponent_explorer(username_input=username, version=version)
+    st.subheader("Results by rating difference")
+    time_class = select_time_class(key="time_class_differences")
+    plot_results_by_difference(username, version, time_class)
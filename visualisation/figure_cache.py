@@ -0,0 +1,114 @@
+import io
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 << 20  # 64 MB of PNG images
+FIGURE_DPI = 100
+
+
+def load_pyplot():
+    """
+    It imports pyplot with the Agg backend. Matplotlib is the longest
+    import of the dashboard, so it is only imported when the first
+    figure is drawn, or in the background by warm_up_plotting.
+
+    Returns:
+        module: matplotlib.pyplot.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def render_png(fig):
+    """
+    It renders a matplotlib figure to PNG and closes it, so that the
+    figure does not stay in the pyplot state.
+
+    Args:
+        fig (plt.Figure): The figure to render.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=FIGURE_DPI, bbox_inches="tight")
+    load_pyplot().close(fig)
+    return buffer.getvalue()
+
+
+class FigureCache:
+    """
+    A cache of rendered figures, shared by all the sessions of the
+    dashboard. The figures are kept as PNG images, keyed by everything
+    they depend on (user, data version, date range, time class and the
+    parameters of the widget). The total size of the images is bounded
+    by `max_bytes`, and the least recently used images are evicted
+    first.
+
+    Args:
+        max_bytes (int): The maximum total size of the cached images.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.images)
+
+    def get(self, key: tuple):
+        """
+        It returns the cached image of a key, or None.
+        """
+        with self.lock:
+            image = self.images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: tuple, image: bytes):
+        """
+        It stores an image and evicts the least recently used images
+        until the cache fits in `max_bytes`. An image larger than the
+        whole cache is not stored.
+        """
+        with self.lock:
+            if key in self.images:
+                self.nbytes -= len(self.images.pop(key))
+            if len(image) > self.max_bytes:
+                return
+            self.images[key] = image
+            self.nbytes += len(image)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def render(self, key: tuple, draw, *args, **kwargs):
+        """
+        It returns the image of a key, and only calls `draw` to build
+        the figure when the image is not cached.
+
+        Args:
+            key (tuple): Everything the figure depends on.
+            draw (callable): A function returning a matplotlib figure.
+            *args, **kwargs: The arguments of `draw`.
+
+        Returns:
+            bytes: The PNG image.
+        """
+        image = self.get(key)
+        if image is None:
+            image = render_png(draw(*args, **kwargs))
+            self.put(key, image)
+        return image
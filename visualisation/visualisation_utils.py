@@ -1,25 +1,240 @@
 import streamlit as st
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import sys
+import threading
+from figure_cache import FigureCache, load_pyplot
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etl"))
+from aggregate_cube import CELL_KEYS, RATING_COLUMNS  # noqa: E402
+from aggregate_cube import DailyCube, build_cube, read_cube  # noqa: E402
+from dashboard_snapshot import opening_counts, read_snapshot  # noqa: E402
+from games_database import has_user, query_games, read_database_version  # noqa: E402
+from games_storage import (  # noqa: E402
+    game_urls,
+    games_dirpath,
+    has_games,
+    read_data_version,
+    read_games,
+)
+from opening_index import OpeningIndex, opening_index_dir  # noqa: E402
+from opponent_index import OpponentIndex, opponent_meta_filepath  # noqa: E402
+from rating_series import (  # noqa: E402
+    RatingSeries,
+    build_rating_series,
+    read_rating_series,
+)
 
 DATA_DIR = "../data/transformed"
+DATABASE_PATH = "../data/games.sqlite"
+DASHBOARD_COLUMNS = ("date",)
+TIME_CLASSES = ["Blitz", "Bullet", "Rapid"]
+VERSION_POLL_SECONDS = 15  # how often an open dashboard checks for new games
+CACHED_VERSIONS = 32  # entries of the cached loaders, old versions are dropped
+OPPONENT_MATCHES = 20  # opponents proposed for a prefix
+OPPONENT_GAMES = 10  # latest games shown against an opponent
+RESULT_COLORS = {"wins": "#2E7D32", "draws": "#9E9E9E", "losses": "#8F0F07"}
 
 
-@st.cache_data
-def load_data(username_input: str) -> pd.DataFrame:
+def data_version(username_input: str):
     """
-    It loads transformed chess game data for a user. This function
-    locates and reads a CSV file containing the player's game data.
-    Then, it performs data preprocessing by converting columns to
-    appropriate data types.
+    It reads the data version stamp written by the ETL for a user. It
+    is given to the cached loaders, so they load the data again only
+    after the ETL or the watch mode changed it.
 
     Args:
         username_input(str): The username of the user that we want
         to analyse.
 
+    Returns:
+        int: The version of the data of the user.
+    """
+    return read_data_version(DATA_DIR, username_input)
+
+
+def plotting_modules():
+    """
+    It imports pyplot and seaborn, the first time a figure is drawn.
+
+    Returns:
+        tuple: The pyplot and seaborn modules.
+    """
+    plt = load_pyplot()
+    import seaborn as sns
+
+    return plt, sns
+
+
+@st.cache_resource
+def warm_up_plotting():
+    """
+    It imports the plotting modules in a background thread, once per
+    server, while the user types a username. The page is shown without
+    waiting for matplotlib, and the first figure does not wait for it
+    either unless the username was typed at once.
+
+    Returns:
+        threading.Thread: The thread importing the modules.
+    """
+    thread = threading.Thread(target=plotting_modules, daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def load_snapshot(username_input: str, version: int = 0):
+    """
+    It reads the dashboard snapshot of a user once per data version. It
+    holds the data of the first view of the dashboard, the whole
+    history, so the first charts are drawn without reading the games,
+    the cube or the rating series.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user, only used as a
+        key of the cache.
+
+    Returns:
+        DashboardSnapshot/None: The snapshot, or None if the ETL did
+        not write one.
+    """
+    return read_snapshot(DATA_DIR, username_input)
+
+
+def select_summary(username_input: str, version: int, snapshot, start, end):
+    """
+    It gives the cube cells of a date range, from the snapshot for the
+    whole history and from the cube otherwise.
+
+    Returns:
+        pd.DataFrame: The cells, as returned by DailyCube.select, and
+        no cell if the user has no cube (its data was removed since the
+        snapshot was read).
+    """
+    if snapshot is not None and snapshot.covers(start, end):
+        return snapshot.summary()
+    cube = load_cube(username_input, version)
+    if cube is None:
+        cells = {column: pd.Series(dtype=object) for column in CELL_KEYS}
+        cells["games"] = pd.Series(dtype="int64")
+        for column in RATING_COLUMNS:
+            cells[f"{column}_games"] = pd.Series(dtype="int64")
+            for name in ["sum", "min", "max"]:
+                cells[f"{column}_{name}"] = pd.Series(dtype="float64")
+        return pd.DataFrame(cells)
+    return cube.select(start, end)
+
+
+def select_rating_points(
+    username_input: str, version: int, snapshot, start, end, time_class: str
+):
+    """
+    It gives the rating points of a time class over a date range, from
+    the snapshot for the whole history and from the rating series
+    otherwise.
+
+    Returns:
+        tuple: The resolution and the points, like RatingSeries.select.
+    """
+    if snapshot is not None and snapshot.covers(start, end):
+        return snapshot.rating_points(time_class.lower())
+    series = load_rating_series(username_input, version)
+    return series.select(time_class.lower(), start, end)
+
+
+def select_opening_counts(
+    username_input: str, version: int, snapshot, start, end, time_class: str
+):
+    """
+    It gives the number of games of the openings of a time class over a
+    date range, from the snapshot for the whole history (the openings
+    the slider can show) and from the games otherwise.
+
+    Returns:
+        pd.Series: The number of games of each opening, most played first.
+    """
+    if snapshot is not None and snapshot.covers(start, end):
+        return snapshot.opening_counts(time_class.lower())
+    df = load_data(
+        username_input=username_input,
+        columns=("opening",),
+        start_date=start,
+        end_date=end,
+        time_class=time_class.lower(),
+        version=version,
+    )
+    return opening_counts(df["opening"]) if not df.empty else pd.Series(dtype="int64")
+
+
+@st.fragment(run_every=VERSION_POLL_SECONDS)
+def follow_data_version(username_input: str, version: int):
+    """
+    It checks every VERSION_POLL_SECONDS if the data version of the
+    user changed, for example when the watch mode of the ETL appended
+    new games, and reruns the app to show them. Only this fragment
+    runs between two checks, and it only reads the version stamp.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version shown by the dashboard.
+    """
+    if data_version(username_input) != version:
+        st.rerun()
+
+
+@st.cache_resource
+def get_table_cache():
+    """
+    It creates the cache of the Arrow tables of the monthly Parquet
+    files, shared by every session of the app. When a new data version
+    is loaded, only the months whose file changed are read again.
+
+    Returns:
+        dict: The tables by file and columns, with the size and mtime
+        of their file.
+    """
+    return {}
+
+
+@st.cache_data(max_entries=CACHED_VERSIONS)
+def load_data(
+    username_input: str,
+    columns: tuple = None,
+    memory_map: bool = False,
+    start_date=None,
+    end_date=None,
+    time_class: str = None,
+    version: int = 0,
+) -> pd.DataFrame:
+    """
+    It loads transformed chess game data for a user. When the ETL wrote
+    the games of the user to the SQLite database with the current data
+    version, the date range and
+    time class filters are pushed down to SQL and only the matching
+    games are read. Otherwise, this function reads the monthly Parquet
+    files of the player's games, which already store the appropriate
+    data types, and only reads the requested columns of the months in
+    the date range, so a narrow range of a long history stays cheap.
+    The tables of the months are kept in the table cache, so a new
+    data version only reads again the months that changed.
+    The single Parquet or CSV file written by older versions of the
+    ETL is still read if there is no dataset.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        columns (tuple): The columns needed by the dashboard. If None,
+        every column is loaded.
+        memory_map (bool): If True, the file is memory-mapped.
+        start_date (datetime): If given, the first day of the games.
+        end_date (datetime): If given, the last day of the games.
+        time_class (str): If given, the time class of the games, like
+        "blitz".
+        version (int): The data version of the user (data_version), a
+        key of the cache and the oldest version of the database read.
+
     Returns:
         pd.DataFrame: A pandas dataFrame containing the preprocessed
         game
@@ -31,103 +246,309 @@ def load_data(username_input: str) -> pd.DataFrame:
         Exception: For any other errors that occur while reading the
         file.
     """
-    filepath = os.path.join(
-        DATA_DIR, username_input, f"{username_input}_transformed_games.csv"
-    )
-    if os.path.exists(filepath):
+    filtered = start_date is not None or end_date is not None or time_class
+    # the database can be behind the Parquet files, when the ETL ran
+    # without it, so it is only read when it has the current version
+    if has_user(username_input, DATABASE_PATH) and (
+        read_database_version(username_input, DATABASE_PATH) >= version
+    ):
         try:
-            df = pd.read_csv(filepath)
-            df["opening"] = df["opening"].fillna("N/A")
-            df["player_color"] = df["player_color"].astype("category")
-            df["player_result"] = df["player_result"].astype("category")
-            df["time_class"] = df["time_class"].astype("category")
-            df["rated"] = df["rated"].astype(bool)
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-            st.success(f"Loaded Data from {username_input}: {len(df)} game(s).")
+            df = query_games(
+                [username_input],
+                columns,
+                start_date,
+                end_date,
+                time_class,
+                DATABASE_PATH,
+            )
+            if not filtered:
+                st.success(f"Loaded Data from {username_input}: {len(df)} game(s).")
             return df
         except Exception as e:
             st.error(f"Error: {e}")
+    if has_games(DATA_DIR, username_input):
+        try:
+            read_columns = columns
+            if columns and time_class:
+                read_columns = list(dict.fromkeys([*columns, "time_class"]))
+            df = read_games(
+                DATA_DIR,
+                username_input,
+                read_columns,
+                memory_map,
+                start_date,
+                end_date,
+                get_table_cache(),
+            )
+            if not filtered:
+                st.success(f"Loaded Data from {username_input}: {len(df)} game(s).")
+                return df
+            if time_class:
+                df = df[df["time_class"] == time_class]
+            return df[list(columns)] if columns else df
+        except Exception as e:
+            st.error(f"Error: {e}")
     else:
-        st.error(f"No data found from : {filepath}")
+        st.error(f"No data found from : {games_dirpath(DATA_DIR, username_input)}")
         st.stop()
 
     st.warning("No data loaded.")
     return pd.DataFrame()
 
 
-def show_number_games(df: pd.DataFrame):
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def load_cube(username_input: str, version: int = 0):
+    """
+    It loads the daily aggregate cube of a user once per data version.
+    The cube is built by the transform step, and its prefix sums answer
+    the dashboard widgets for any date range without touching the
+    games.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user, only used as a
+        key of the cache.
+
+    Returns:
+        DailyCube/None: The cube, or None if the user has no data. The
+        cube is built in memory for data transformed by older versions.
+    """
+    cube = read_cube(DATA_DIR, username_input)
+    if cube is None:
+        df = read_games(DATA_DIR, username_input)
+        if df is not None:
+            cube = DailyCube(build_cube(df))
+    return cube
+
+
+@st.cache_resource
+def get_figure_cache():
+    """
+    It creates the figure cache shared by every session of the app.
+
+    Returns:
+        FigureCache: The cache of rendered figures.
+    """
+    return FigureCache()
+
+
+def show_figure(key: tuple, draw, *args):
+    """
+    It shows a figure from the figure cache, and only draws it when it
+    is not cached yet.
+
+    Args:
+        key (tuple): Everything the figure depends on: the view (user,
+        data version and date range), the widget and its parameters.
+        draw (callable): The function building the matplotlib figure.
+        *args: The arguments of `draw`.
+    """
+    st.image(get_figure_cache().render(key, draw, *args), use_container_width=True)
+
+
+def select_time_class(key: str):
+    """
+    It shows a choice of time class in place of tabs. Unlike st.tabs,
+    which runs the content of every tab, only the chart of the chosen
+    time class is built.
+
+    Args:
+        key (str): The widget key.
+
+    Returns:
+        str: The chosen time class, for example "Blitz".
+    """
+    return st.radio(
+        "Time class",
+        TIME_CLASSES,
+        horizontal=True,
+        label_visibility="collapsed",
+        key=key,
+    )
+
+
+def draw_number_games(games_by_time_class: pd.Series):
+    plt, sns = plotting_modules()
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.barplot(
+        x=games_by_time_class.index,
+        y=games_by_time_class.values,
+        hue=games_by_time_class.index,
+        palette="Dark2",
+        ax=ax,
+    )
+    ax.set_title("Number of games by time class")
+    ax.set_xlabel("time class")
+    ax.set_ylabel("Number of games")
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    return fig
+
+
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def load_rating_series(username_input: str, version: int = 0):
+    """
+    It loads the rating series of a user once per data version. They
+    are built by the transform step at several resolutions, so a chart
+    of any date range is read without going through the games.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user, only used as a
+        key of the cache.
+
+    Returns:
+        RatingSeries/None: The series, or None if the user has no data.
+        They are built in memory for data transformed by older versions.
+    """
+    series = read_rating_series(DATA_DIR, username_input)
+    if series is None:
+        df = read_games(DATA_DIR, username_input)
+        if df is not None:
+            series = RatingSeries(build_rating_series(df))
+    return series
+
+
+def show_number_games(summary: pd.DataFrame, view: tuple):
     """
     It shows the number of games done by the user. Firstly, it shows
     the total number of games regardless time class. Then it plots the
     distribution of games number regarding time class.
 
     Args:
-        df (pd.Dataframe): Dataframe containing the user data
+        summary (pd.DataFrame): The cube cells of the selected date
+        range, as returned by DailyCube.select.
+        view (tuple): The user, data version and date range, which
+        identify the figure in the cache.
+    """
+    st.metric(label="Total", value=int(summary["games"].sum()))
+    games_by_time_class = summary.groupby("time_class")["games"].sum()
+    show_figure(view + ("number_games",), draw_number_games, games_by_time_class)
+
+
+def average_opponent_rating(summary: pd.DataFrame):
+    """
+    It computes the average rating of the opponents for each time
+    class from the rating sums of the cube, over the games where the
+    opponent was rated.
+
+    Args:
+        summary (pd.DataFrame): The cube cells of the selected date
+        range, as returned by DailyCube.select.
+
+    Returns:
+        pd.Series: The rounded average rating of each time class.
     """
-    st.metric(label="Total", value=len(df))
+    totals = summary.groupby("time_class")[
+        ["opponent_rating_sum", "opponent_rating_games"]
+    ].sum()
+    return round(totals["opponent_rating_sum"] / totals["opponent_rating_games"])
+
+
+def draw_outcome_distribution(results: pd.Series, time_class: str):
+    plt, sns = plotting_modules()
     fig, ax = plt.subplots(figsize=(12, 6))
-    sns.countplot(x="time_class", data=df, palette="Dark2", ax=ax)
-    ax.set_title("Number of games by time class")
-    ax.set_xlabel("time class")
+    sns.barplot(
+        x=results.index, y=results.values, hue=results.index, palette="Dark2", ax=ax
+    )
+    ax.set_title(f"Distribution of {time_class} Results")
+    ax.set_xlabel("Results")
     ax.set_ylabel("Number of games")
     ax.grid(axis="y", linestyle="--", alpha=0.7)
-    st.pyplot(fig)
+    return fig
 
 
-def plot_outcome_distribution(df: pd.DataFrame, time_class: str):
+def plot_outcome_distribution(summary: pd.DataFrame, time_class: str, view: tuple):
     """
     It plots the distribution of game results by time class. This
     function creates a bar chart showing the count of game results.
 
     Args:
-        df (pd.DataFrame): DataFrame containing the user data,
-        filtered by time class.
+        summary (pd.DataFrame): The cube cells of the selected date
+        range, as returned by DailyCube.select.
 
         time_class (str): The time class ('Blitz', 'Bullet' and
         'Rapid') for the plot title
+        view (tuple): The user, data version and date range, which
+        identify the figure in the cache.
     """
-    if df.empty:
+    summary = summary[summary["time_class"] == time_class.lower()]
+    if summary.empty:
         st.warning(f"No {time_class} Data")
         return
+    results = summary.groupby("player_result")["games"].sum()
+    show_figure(
+        view + ("outcomes", time_class), draw_outcome_distribution, results, time_class
+    )
+
+
+def draw_rating_evolution(points: pd.DataFrame, resolution: str, time_class: str):
+    plt = load_pyplot()
     fig, ax = plt.subplots(figsize=(12, 6))
-    sns.countplot(x="player_result", data=df, palette="Dark2", ax=ax)
-    ax.set_title(f"Distribution of {time_class} Results")
-    ax.set_xlabel("Results")
-    ax.set_ylabel("Number of games")
+    ax.plot(points["date"], points["close"], linewidth=2, color="#377E47")
+    if resolution != "raw":
+        # the lowest and highest ratings of each point, around the curve
+        ax.fill_between(
+            points["date"], points["low"], points["high"], color="#377E47", alpha=0.2
+        )
+    ax.set_title(f"{time_class} Rating")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Rating")
+    ax.grid(axis="x", linestyle="--", alpha=0.7)
     ax.grid(axis="y", linestyle="--", alpha=0.7)
-    st.pyplot(fig)
+    ax.tick_params(axis="x", labelrotation=40)
+    return fig
 
 
-def plot_rating_evolution(df: pd.DataFrame, time_class: str):
+def plot_rating_evolution(
+    resolution: str, points: pd.DataFrame, time_class: str, view: tuple
+):
     """
     It plots the player's rating evolution following the time class.
-    This function create a line plot that shows the player rating
-    based on the game date.
+    This function create a line plot of the rating of the player, with
+    every game when there are few of them, or else the daily or weekly
+    ratings with their min-max envelope. The number of points is capped
+    by the rating series, so the plot cost does not grow with the games.
 
     Args:
-        df (pd.DataFrame): DataFrame containing the user data, filtered
-        by time class.
-
+        resolution (str): The resolution of the points.
+        points (pd.DataFrame): The points of the date range, as given
+        by select_rating_points.
         time_class (str): The time class ('Blitz', 'Bullet' and 'Rapid')
         for the plot title
+        view (tuple): The user, data version and date range, which
+        identify the figure in the cache.
     """
-    if df.empty:
+    if points.empty:
         st.warning(f"No {time_class} Data")
         return
+    show_figure(
+        view + ("rating_evolution", time_class),
+        draw_rating_evolution,
+        points,
+        resolution,
+        time_class,
+    )
+    st.caption(f"{len(points)} points ({resolution})")
+
+
+def draw_frequent_openings(counts: pd.Series, time_class: str, number: int):
+    plt, sns = plotting_modules()
+    frequent_openings = counts.head(number)
     fig, ax = plt.subplots(figsize=(12, 6))
-    sns.lineplot(
-        x="date", y="player_rating", data=df, linewidth=2, color="#377E47", ax=ax
+    sns.barplot(  # plain labels, or the unused categories would be drawn too
+        x=frequent_openings.values,
+        y=frequent_openings.index.astype(str),
+        color="#8F0F07",
+        ax=ax,
     )
-    ax.set_title(f"{time_class} Rating")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Rating")
-    ax.grid(axis="x", linestyle="--", alpha=0.7)
-    ax.grid(axis="y", linestyle="--", alpha=0.7)
-    plt.xticks(rotation=40)
-    st.pyplot(fig)
+    ax.set_title(f"Most frequent openings played in {time_class}")
+    ax.set_xlabel("occurrence")
+    return fig
 
 
-def plot_frequent_openings(df: pd.DataFrame, time_class: str):
+def plot_frequent_openings(counts: pd.Series, time_class: str, view: tuple):
     """
     It plots the most frequent openings played for each time class.
     This function uses a slider to allow user to select the number of
@@ -137,16 +558,19 @@ def plot_frequent_openings(df: pd.DataFrame, time_class: str):
     frequently played openings.
 
     Args:
-        df (pd.DataFrame): DataFrame containing the user data, filtered
-        by time class.
+        counts (pd.Series): The number of games of each opening of the
+        time class, most played first, as given by
+        select_opening_counts.
 
         time_class (str): The time class ('Blitz', 'Bullet' and
         'Rapid') for the plot title
+        view (tuple): The user, data version and date range, which
+        identify the figure in the cache.
     """
-    if df.empty:
+    if counts.empty:
         st.warning(f"No {time_class} Data")
         return
-    total_different_openings_played = len(df["opening"].unique())
+    total_different_openings_played = len(counts)
     number_frequent_openings = st.slider(
         "How many opening do you want to show",
         1,
@@ -155,11 +579,206 @@ def plot_frequent_openings(df: pd.DataFrame, time_class: str):
         1,
         key=f"slider_openings_{time_class}",
     )
-    frequent_openings = df["opening"].value_counts().head(number_frequent_openings)
+    show_figure(
+        view + ("frequent_openings", time_class, number_frequent_openings),
+        draw_frequent_openings,
+        counts,
+        time_class,
+        number_frequent_openings,
+    )
+
+
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def load_opening_index(username_input: str, version: int = 0):
+    """
+    It opens the opening index of a user once per data version. The
+    arrays of the index are memory-mapped, so nothing is recomputed on
+    reruns.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user, only used as a
+        key of the cache.
+
+    Returns:
+        OpeningIndex/None: The opening index, or None if the ETL did
+        not build it yet.
+    """
+    if not os.path.exists(
+        os.path.join(opening_index_dir(username_input, DATA_DIR), "meta.json")
+    ):
+        return None
+    return OpeningIndex(username_input, DATA_DIR)
+
+
+def show_opening_explorer(username_input: str, version: int = 0):
+    """
+    It shows the results of the player after a sequence of moves typed
+    by the user, and the results of every next move. Each query is a
+    lookup in the opening index, whose cost only depends on the number
+    of moves, not on the number of games.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user.
+    """
+    index = load_opening_index(username_input, version)
+    if index is None:
+        st.warning(f"No opening index for {username_input}, run the ETL first")
+        return
+    moves = st.text_input(
+        f"Moves from the starting position (SAN, at most {index.depth})",
+        placeholder="e4 e5 Nf3",
+        key="opening_explorer_moves",
+    ).split()
+    column1, column2 = st.columns(2)
+    with column1:
+        color = st.selectbox("Color", ["all", "white", "black"], key="opening_color")
+    with column2:
+        time_class = st.selectbox(
+            "Time class", ["all"] + index.time_classes, key="opening_time_class"
+        )
+    color = None if color == "all" else color
+    time_class = None if time_class == "all" else time_class
+    stats = index.stats(moves[: index.depth], color, time_class)
+    column1, column2, column3, column4 = st.columns(4)
+    column1.metric(label="Games", value=stats["games"])
+    column2.metric(label="Wins", value=stats["wins"])
+    column3.metric(label="Draws", value=stats["draws"])
+    column4.metric(label="Losses", value=stats["losses"])
+    if len(moves) < index.depth:
+        st.dataframe(
+            index.continuations(moves, color, time_class),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def load_opponent_index(username_input: str, version: int = 0):
+    """
+    It opens the opponent index of a user once per data version. The
+    arrays of the index are memory-mapped, so nothing is recomputed on
+    reruns.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user, only used as a
+        key of the cache.
+
+    Returns:
+        OpponentIndex/None: The opponent index, or None if the ETL did
+        not build it yet.
+    """
+    if not os.path.exists(opponent_meta_filepath(DATA_DIR, username_input)):
+        return None
+    return OpponentIndex(username_input, DATA_DIR)
+
+
+def show_opponent_explorer(username_input: str, version: int = 0):
+    """
+    It shows the record of the player against an opponent found by
+    the first letters of their username, and their latest games. The
+    search, the record and the games are lookups in the opponent index,
+    whose cost does not depend on the number of games.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user.
+    """
+    index = load_opponent_index(username_input, version)
+    if index is None:
+        st.warning(f"No opponent index for {username_input}, run the ETL first")
+        return
+    prefix = st.text_input(
+        "Opponent username, or its first letters",
+        placeholder="the most played opponents",
+        key="opponent_prefix",
+    )
+    matches = index.search(prefix, OPPONENT_MATCHES)
+    if matches.empty:
+        st.info(f"No opponent starting with {prefix}")
+        return
+    games = dict(zip(matches["opponent"], matches["games"]))
+    column1, column2 = st.columns(2)
+    with column1:
+        opponent = st.selectbox(
+            "Opponent",
+            list(games),
+            format_func=lambda name: f"{name} ({games[name]} games)",
+            key="opponent_name",
+        )
+    with column2:
+        time_class = st.selectbox(
+            "Time class", ["all"] + index.time_classes, key="opponent_time_class"
+        )
+    record = index.record(opponent, None if time_class == "all" else time_class)
+    column1, column2, column3, column4, column5 = st.columns(5)
+    column1.metric(label="Games", value=record["games"])
+    column2.metric(label="Wins", value=record["wins"])
+    column3.metric(label="Draws", value=record["draws"])
+    column4.metric(label="Losses", value=record["losses"])
+    column5.metric(
+        label="Rating difference",
+        value=record["average_difference"],
+        help="Average rating of the opponent minus the rating of the player",
+    )
+    latest_games = index.opponent_games(opponent, last=OPPONENT_GAMES)
+    latest_games.insert(0, "game_url", game_urls(latest_games))
+    st.dataframe(
+        latest_games.drop(columns="game_id"),
+        hide_index=True,
+        use_container_width=True,
+        column_config={"game_url": st.column_config.LinkColumn("Game")},
+    )
+
+
+def draw_results_by_difference(brackets: pd.DataFrame, time_class: str):
+    plt, sns = plotting_modules()
     fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(
-        x=frequent_openings.values, y=frequent_openings.index, color="#8F0F07", ax=ax
+    bottom = pd.Series(0.0, index=brackets.index)
+    for column, color in RESULT_COLORS.items():
+        share = brackets[column] / brackets["games"] * 100
+        ax.bar(brackets["bracket"], share, bottom=bottom, color=color, label=column)
+        bottom += share
+    ax.set_title(f"{time_class} results by rating difference")
+    ax.set_xlabel("Opponent rating minus player rating")
+    ax.set_ylabel("% of games")
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend()
+    return fig
+
+
+def plot_results_by_difference(username_input: str, version: int, time_class: str):
+    """
+    It plots the share of wins, draws and losses of the player by
+    bracket of rating difference with the opponent, over the whole
+    history. The brackets are pre-aggregated by the opponent index.
+
+    Args:
+        username_input(str): The username of the user that we want
+        to analyse.
+        version (int): The data version of the user.
+        time_class (str): The time class ('Blitz', 'Bullet' and
+        'Rapid') for the plot title
+    """
+    index = load_opponent_index(username_input, version)
+    if index is None:
+        st.warning(f"No opponent index for {username_input}, run the ETL first")
+        return
+    brackets = index.results_by_difference(time_class.lower())
+    brackets = brackets[brackets["games"] > 0]
+    if brackets.empty:
+        st.warning(f"No {time_class} Data")
+        return
+    show_figure(
+        (username_input, version, "results_by_difference", time_class),
+        draw_results_by_difference,
+        brackets,
+        time_class,
     )
-    ax.set_title(f"Most frequent openings played in {time_class}")
-    ax.set_xlabel("occurrence")
-    st.pyplot(fig)
+    st.caption(f"{int(brackets['games'].sum())} games with both ratings")